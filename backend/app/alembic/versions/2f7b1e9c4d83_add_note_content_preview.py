@@ -0,0 +1,64 @@
+"""Add note content preview columns
+
+Revision ID: 2f7b1e9c4d83
+Revises: 5e2a9d7c4f10
+Create Date: 2026-10-19 14:27:53.911640
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f7b1e9c4d83'
+down_revision: Union[str, Sequence[str], None] = '5e2a9d7c4f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+PREVIEW_CHARS = 280  # crud.NOTE_PREVIEW_CHARS when this was written
+
+BACKFILL = (
+    "UPDATE notes SET content_preview = substr(content, 1, :chars), content_length = length(content) "
+    "WHERE id > :after AND id <= :upto"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notes', sa.Column('content_preview', sa.String(), nullable=True))
+    op.add_column('notes', sa.Column('content_length', sa.Integer(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        # TOAST (compress, then move out of line) any row wider than 256
+        # bytes instead of the default ~2kB, so long content stops widening
+        # the heap rows that listings scan. Applies to rows as they are
+        # written, which the backfill below does for every note.
+        op.execute("ALTER TABLE notes SET (toast_tuple_target = 256)")
+
+    if context.is_offline_mode():
+        op.execute(sa.text(BACKFILL.replace("WHERE id > :after AND id <= :upto", ""))
+                   .bindparams(chars=PREVIEW_CHARS))
+        return
+    # One committed batch at a time, so a large table isn't locked and
+    # rewritten in one transaction; rerunning only redoes the last batch.
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        after = 0
+        while True:
+            upto = bind.execute(sa.text(
+                "SELECT max(id) FROM (SELECT id FROM notes WHERE id > :after ORDER BY id LIMIT :size) AS batch"
+            ), {"after": after, "size": BATCH_SIZE}).scalar()
+            if upto is None:
+                break
+            bind.execute(sa.text(BACKFILL), {"chars": PREVIEW_CHARS, "after": after, "upto": upto})
+            after = upto
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE notes RESET (toast_tuple_target)")
+    op.drop_column('notes', 'content_length')
+    op.drop_column('notes', 'content_preview')
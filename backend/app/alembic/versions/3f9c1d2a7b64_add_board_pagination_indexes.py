@@ -0,0 +1,38 @@
+"""Add board pagination and viewport indexes
+
+Revision ID: 3f9c1d2a7b64
+Revises: 5487ac341a9c
+Create Date: 2026-10-18 18:10:12.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c1d2a7b64'
+down_revision: Union[str, Sequence[str], None] = '5487ac341a9c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keyset cursors need a non-null updated_at on every row
+    op.execute("UPDATE notes SET updated_at = created_at WHERE updated_at IS NULL")
+    op.alter_column('notes', 'updated_at',
+                    existing_type=sa.DateTime(timezone=True),
+                    server_default=sa.text('now()'))
+    op.create_index('ix_notes_owner_updated_id', 'notes', ['owner_id', 'updated_at', 'id'], unique=False)
+    op.create_index('ix_notes_owner_x_y', 'notes', ['owner_id', 'x', 'y'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_notes_owner_x_y', table_name='notes')
+    op.drop_index('ix_notes_owner_updated_id', table_name='notes')
+    op.alter_column('notes', 'updated_at',
+                    existing_type=sa.DateTime(timezone=True),
+                    server_default=None)
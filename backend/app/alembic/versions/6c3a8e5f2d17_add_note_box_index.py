@@ -0,0 +1,33 @@
+"""Add GiST index on note rectangles
+
+Revision ID: 6c3a8e5f2d17
+Revises: 4b7e2d9c1a58
+Create Date: 2026-10-18 22:14:09.530871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c3a8e5f2d17'
+down_revision: Union[str, Sequence[str], None] = '4b7e2d9c1a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # btree_gist lets owner_id share the GiST index with the box, so a
+    # board's spatial queries stay within that board's entries.
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute(
+        "CREATE INDEX ix_notes_owner_box ON notes USING gist "
+        "(owner_id, box(point(x, y), point(x + width, y + height)))"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_notes_owner_box', table_name='notes')
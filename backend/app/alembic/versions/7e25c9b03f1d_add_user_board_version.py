@@ -0,0 +1,28 @@
+"""Add user board_version
+
+Revision ID: 7e25c9b03f1d
+Revises: d2b8f5a61e93
+Create Date: 2026-10-18 20:02:48.551294
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e25c9b03f1d'
+down_revision: Union[str, Sequence[str], None] = 'd2b8f5a61e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('board_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'board_version')
@@ -0,0 +1,45 @@
+"""Add per-user tag counts and reverse note_tag index
+
+Revision ID: 8d1f4c7a2b96
+Revises: 6c3a8e5f2d17
+Create Date: 2026-10-18 23:05:41.218306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d1f4c7a2b96'
+down_revision: Union[str, Sequence[str], None] = '6c3a8e5f2d17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_tag_counts',
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('note_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('owner_id', 'tag_id')
+    )
+    op.create_index('ix_note_tag_tag_id_note_id', 'note_tag', ['tag_id', 'note_id'], unique=False)
+    # from here on the counts are kept by the app; seed them once
+    op.execute(
+        "INSERT INTO user_tag_counts (owner_id, tag_id, note_count) "
+        "SELECT notes.owner_id, note_tag.tag_id, COUNT(*) FROM note_tag "
+        "JOIN notes ON notes.id = note_tag.note_id "
+        "WHERE notes.owner_id IS NOT NULL "
+        "GROUP BY notes.owner_id, note_tag.tag_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_note_tag_tag_id_note_id', table_name='note_tag')
+    op.drop_table('user_tag_counts')
@@ -0,0 +1,37 @@
+"""Add note tombstones for delta sync
+
+Revision ID: 9a4d6e1f0c37
+Revises: c71e0b94d2a8
+Create Date: 2026-10-18 19:20:05.667310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d6e1f0c37'
+down_revision: Union[str, Sequence[str], None] = 'c71e0b94d2a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_note_tombstones_owner_deleted', 'note_tombstones', ['owner_id', 'deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_note_tombstones_owner_deleted', table_name='note_tombstones')
+    op.drop_table('note_tombstones')
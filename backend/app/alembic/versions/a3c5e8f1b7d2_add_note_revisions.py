@@ -0,0 +1,42 @@
+"""Add note revisions table
+
+Revision ID: a3c5e8f1b7d2
+Revises: 2f7b1e9c4d83
+Create Date: 2026-10-19 16:05:48.219376
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e8f1b7d2'
+down_revision: Union[str, Sequence[str], None] = '2f7b1e9c4d83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_revisions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('snapshot', sa.Boolean(), server_default='false', nullable=False),
+    sa.Column('content', sa.String(), nullable=True),
+    sa.Column('geometry', sa.LargeBinary(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_note_revisions_note_revision', 'note_revisions', ['note_id', 'revision'], unique=True)
+    op.create_index('ix_note_revisions_created_at', 'note_revisions', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_note_revisions_created_at', table_name='note_revisions')
+    op.drop_index('ix_note_revisions_note_revision', table_name='note_revisions')
+    op.drop_table('note_revisions')
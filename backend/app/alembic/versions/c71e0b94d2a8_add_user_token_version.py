@@ -0,0 +1,28 @@
+"""Add user token_version
+
+Revision ID: c71e0b94d2a8
+Revises: 3f9c1d2a7b64
+Create Date: 2026-10-18 18:42:37.102954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c71e0b94d2a8'
+down_revision: Union[str, Sequence[str], None] = '3f9c1d2a7b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
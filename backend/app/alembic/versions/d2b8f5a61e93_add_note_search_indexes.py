@@ -0,0 +1,40 @@
+"""Add note full-text and tag trigram search indexes
+
+Revision ID: d2b8f5a61e93
+Revises: 9a4d6e1f0c37
+Create Date: 2026-10-18 19:41:26.030871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b8f5a61e93'
+down_revision: Union[str, Sequence[str], None] = '9a4d6e1f0c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notes', sa.Column(
+        'content_tsv',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', coalesce(content, ''))", persisted=True),
+        nullable=True,
+    ))
+    op.create_index('ix_notes_content_tsv', 'notes', ['content_tsv'], unique=False, postgresql_using='gin')
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_tags_name_trgm', 'tags', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tags_name_trgm', table_name='tags')
+    op.drop_index('ix_notes_content_tsv', table_name='notes')
+    op.drop_column('notes', 'content_tsv')
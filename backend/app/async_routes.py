@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from app import crud_async, schemas
+from app.auth import Principal, get_async_db, get_current_user_async
+from app.ratelimit import LimitedRoute
+from app.write_buffer import write_buffer
+
+# Async mirror of the corkboard routes in main.py, mounted under /async when
+# DB_ASYNC_ENABLED is set.
+router = APIRouter(prefix="/async", route_class=LimitedRoute)
+
+
+async def get_board_user_async(current_user: Principal = Depends(get_current_user_async)) -> Principal:
+    # main.get_board_user for these routes; the flush blocks, so it runs in
+    # the threadpool, and only when the board has moves buffered
+    if write_buffer.needs_flush(current_user.id):
+        await run_in_threadpool(write_buffer.flush, current_user.id)
+    return current_user
+
+
+@router.get("/corkboard", response_model=List[schemas.NoteListOut])
+async def read_corkboard_notes(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_board_user_async)
+):
+    return await crud_async.get_board_notes(db, user_id=current_user.id)
+
+@router.get("/corkboard/page", response_model=schemas.NotePage)
+async def read_corkboard_page(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_board_user_async)
+):
+    try:
+        notes, next_cursor = await crud_async.get_board_page(db, user_id=current_user.id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"notes": notes, "next_cursor": next_cursor}
+
+@router.get("/corkboard/viewport", response_model=List[schemas.NoteListOut])
+async def read_corkboard_viewport(
+    x: float = Query(..., allow_inf_nan=False),
+    y: float = Query(..., allow_inf_nan=False),
+    width: float = Query(..., gt=0, allow_inf_nan=False),
+    height: float = Query(..., gt=0, allow_inf_nan=False),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_board_user_async)
+):
+    return await crud_async.get_notes_in_viewport(db, user_id=current_user.id, x=x, y=y, width=width, height=height)
+
+@router.post("/corkboard", response_model=schemas.NoteOut)
+async def create_corkboard_note(
+    note: schemas.NoteCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_board_user_async)
+):
+    return await crud_async.create_note(db=db, note=note, user_id=current_user.id)
+
+@router.post("/corkboard/batch", response_model=List[schemas.NoteBatchResult])
+async def batch_corkboard_notes(
+    batch: schemas.NoteBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_board_user_async)
+):
+    return await crud_async.apply_note_batch(db, user_id=current_user.id, operations=batch.operations)
+
+@router.put("/corkboard/{note_id}", response_model=schemas.NoteOut)
+async def update_corkboard_note(
+    note_id: int,
+    note: schemas.NoteUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_board_user_async)
+):
+    db_note = await crud_async.get_note(db, note_id)
+    if not db_note or db_note.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Note not found or access denied")
+    return await crud_async.update_note(db, note_id=note_id, note_data=note)
+
+@router.delete("/corkboard/{note_id}")
+async def delete_corkboard_note(
+    note_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_board_user_async)
+):
+    db_note = await crud_async.get_note(db, note_id)
+    if not db_note or db_note.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Note not found or access denied")
+    await crud_async.delete_note(db, note_id)
+    return {"detail": "Note deleted successfully"}
@@ -3,15 +3,23 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.crud import get_user_by_username, verify_password
-from app.database import SessionLocal
+from app.crud import get_user, get_user_by_username, update_user_password_hash, verify_password
+from app import crud_async
+from app.database import AsyncSessionLocal, SessionLocal, get_db
+from app.passwords import verify_and_update_async
+from app.user_cache import Principal, user_cache
 
 SECRET_KEY = "YOUR_SECRET_KEY"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+JOB_TOKEN_EXPIRE_HOURS = 24
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+# for routes that also take other credentials; a missing header is None, not 401
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -20,12 +28,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def create_user_token(user) -> str:
+    # uid/ver let get_current_user resolve the caller without a DB lookup
+    return create_access_token(data={"sub": user.username, "uid": user.id, "ver": user.token_version})
+
+def create_job_token(job_id: str) -> str:
+    # Reads one job without signing in, for jobs that outlive their account.
+    # No uid, and a "sub" no user has, so it never passes get_current_user.
+    return create_access_token(data={"sub": f"job:{job_id}", "job": job_id},
+                               expires_delta=timedelta(hours=JOB_TOKEN_EXPIRE_HOURS))
+
+def job_id_from_token(token: str) -> str:
+    job_id = decode_token(token).get("job")
+    if job_id is None:
+        raise _credentials_exception()
+    return job_id
 
 def authenticate_user(db, username: str, password: str):
     user = get_user_by_username(db, username=username)
@@ -33,20 +50,98 @@ def authenticate_user(db, username: str, password: str):
         return False
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+async def authenticate_user_async(db, username: str, password: str):
+    # bcrypt runs on the password pool; the DB calls stay on the threadpool
+    user = await run_in_threadpool(get_user_by_username, db, username=username)
+    if not user:
+        return False
+    valid, new_hash = await verify_and_update_async(password, user.password)
+    if not valid:
+        return False
+    if new_hash:
+        await run_in_threadpool(update_user_password_hash, db, user, new_hash)
+    return user
+
+def load_principal(db: Session, user_id: int) -> Optional[Principal]:
+    user = get_user(db, user_id)
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    user_cache.put(principal)
+    return principal
+
+def principal_from_token(token: str) -> Principal:
+    # for callers outside the dependency system, e.g. websocket handshakes
+    db = SessionLocal()
+    try:
+        return get_current_user(token=token, db=db)
+    finally:
+        db.close()
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    credentials_exception = _credentials_exception()
+    payload = decode_token(token)
+    username: str = payload.get("sub")
+
+    user_id = payload.get("uid")
+    if user_id is None:
+        # token issued before tokens carried the user id
+        user = get_user_by_username(db, username=username)
+        if user is None or user.token_version != 0:
+            raise credentials_exception
+        return Principal.from_user(user)
+
+    version = payload.get("ver", 0)
+    principal = user_cache.get(user_id)
+    if principal is None or principal.token_version < version:
+        # a newer token than the cached principal means it was revoked elsewhere
+        principal = load_principal(db, user_id)
+    if principal is None or principal.token_version != version:
         raise credentials_exception
-    user = get_user_by_username(db, username=username)
-    if user is None:
-        raise credentials_exception
-    return user
+    return principal
+
+
+# -------------------------
+# Async stack
+# -------------------------
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    payload = decode_token(token)
+    user_id = payload.get("uid")
+    if user_id is None:
+        user = await crud_async.get_user_by_username(db, username=payload["sub"])
+        if user is None or user.token_version != 0:
+            raise _credentials_exception()
+        return Principal.from_user(user)
+
+    version = payload.get("ver", 0)
+    principal = user_cache.get(user_id)
+    if principal is None or principal.token_version < version:
+        user = await crud_async.get_user(db, user_id)
+        principal = Principal.from_user(user) if user else None
+        if principal:
+            user_cache.put(principal)
+    if principal is None or principal.token_version != version:
+        raise _credentials_exception()
+    return principal
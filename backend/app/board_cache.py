@@ -0,0 +1,152 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from pydantic import TypeAdapter
+
+from app import crud, schemas
+
+BOARD_CACHE_MAX_BYTES = int(os.environ.get("BOARD_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+BOARD_CACHE_URL = os.environ.get("BOARD_CACHE_URL")  # e.g. redis://localhost:6379/1
+BOARD_CACHE_TTL = int(os.environ.get("BOARD_CACHE_TTL", 3600))  # seconds, shared backend only
+
+board_adapter = TypeAdapter(List[schemas.NoteListOut])
+
+# a board is cached once per response format and content encoding
+VARIANTS = tuple(f"{fmt}.{enc}" for fmt in ("full", "compact") for enc in ("identity", "gzip", "br"))
+
+
+def serialize_board(notes) -> bytes:
+    # the same bytes GET /corkboard would produce through response_model
+    return board_adapter.dump_json(board_adapter.validate_python(notes, from_attributes=True))
+
+
+# -------------------------
+# Backends
+# -------------------------
+# Entries are tagged with the board version they were built from, so a
+# cached board is only served while users.board_version still matches.
+# Invalidation on write just frees the entries early.
+
+class MemoryBoardCache:
+    # LRU bounded by the total size of the cached payloads.
+    def __init__(self, max_bytes: int = BOARD_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, version: int, variant: str = "full.identity") -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get((user_id, variant))
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, variant))
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id: int, version: int, payload: bytes, variant: str = "full.identity"):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop((user_id, variant))
+            self._entries[(user_id, variant)] = (version, payload)
+            self._size += len(payload)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            for variant in VARIANTS:
+                self._drop((user_id, variant))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SharedBoardCache:
+    # Boards shared across workers through a key/value store. `client`
+    # needs get/set(ex=)/delete(*keys) on bytes: a redis.Redis works as
+    # is, and LocalKeyValueStore stands in for it locally.
+    def __init__(self, client, prefix: str = "noteify:board-json:", ttl: int = BOARD_CACHE_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, version: int, variant: str = "full.identity") -> Optional[bytes]:
+        value = self.client.get(f"{self.prefix}{user_id}:{variant}")
+        tag = f"{version}:".encode()
+        if value is None or not value.startswith(tag):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value[len(tag):]
+
+    def set(self, user_id: int, version: int, payload: bytes, variant: str = "full.identity"):
+        self.client.set(f"{self.prefix}{user_id}:{variant}", f"{version}:".encode() + payload, ex=self.ttl)
+
+    def invalidate(self, user_id: int):
+        self.client.delete(*(f"{self.prefix}{user_id}:{variant}" for variant in VARIANTS))
+
+    def stats(self):
+        return {"backend": "shared", "hits": self.hits, "misses": self.misses}
+
+
+class LocalKeyValueStore:
+    # In-memory stand-in for the shared store; ignores expiry.
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._values.get(key)
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None):
+        with self._lock:
+            self._values[key] = value
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+
+def _make_cache():
+    if BOARD_CACHE_URL:
+        import redis  # optional dependency, only needed for a shared cache
+
+        return SharedBoardCache(redis.Redis.from_url(BOARD_CACHE_URL))
+    return MemoryBoardCache()
+
+board_cache = _make_cache()
+
+
+def _invalidate_boards(changes: List[crud.NoteChange]):
+    for user_id in {change.user_id for change in changes}:
+        board_cache.invalidate(user_id)
+
+crud.add_note_listener(_invalidate_boards)
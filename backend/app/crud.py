@@ -1,25 +1,52 @@
-from sqlalchemy.orm import Session
-from typing import List
-from app import model, schemas
-from passlib.context import CryptContext
+from sqlalchemy import and_, bindparam, delete, func, insert, inspect, literal_column, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, defer, joinedload, selectinload, subqueryload
+from typing import Dict, List, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import base64
+import json
+import logging
+import os
+import re
+import uuid
+from app import model, revisions, schemas
+from app.database import on_replica
+from app.user_cache import user_cache
+from app import passwords
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# Delta sync: tombstones older than this are pruned, and a change token
+# older than this gets the full board back instead of a diff.
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", 30))
+# Changes queries look this far behind the token so writes from transactions
+# that started before the last sync but committed after it aren't missed.
+CHANGES_OVERLAP_SECONDS = float(os.environ.get("CHANGES_OVERLAP_SECONDS", 5))
+NOTE_PREVIEW_CHARS = int(os.environ.get("NOTE_PREVIEW_CHARS", 280))
 
 # -------------------------
 # Password utilities
 # -------------------------
+# Hashing lives in app.passwords so it can run in the worker pool; these
+# synchronous wrappers are kept for scripts and migrations.
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
+    return passwords.hash_password(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return passwords.verify_password(plain_password, hashed_password)
 
 
 # -------------------------
 # User CRUD
 # -------------------------
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = model.User(
         username=user.username,
         email=user.email,
@@ -37,18 +64,130 @@ def get_user_by_email(db: Session, email: str):
     return db.query(model.User).filter(model.User.email == email).first()
 
 def get_user_by_username(db: Session, username: str):
+    # on the primary: a login right after sign-up must find the user
     return db.query(model.User).filter(model.User.username == username).first()
 
 def get_users(db: Session, skip: int = 0, limit: int = 10):
     return db.query(model.User).offset(skip).limit(limit).all()
 
+def update_user_password_hash(db: Session, user: model.User, hashed_password: str):
+    user.password = hashed_password
+    db.commit()
+
+def revoke_user_tokens(db: Session, user_id: int):
+    db.execute(
+        update(model.User)
+        .where(model.User.id == user_id)
+        .values(token_version=model.User.token_version + 1)
+    )
+    db.commit()
+    user_cache.invalidate(user_id)
+
+def delete_user(db: Session, user_id: int, batch_size: int = 1000):
+    """Delete an account and everything on its board.
+
+    Notes go batch_size at a time, each batch in its own transaction, so
+    a large board doesn't hold locks for the whole run; running it again
+    after a failure picks up where it stopped. The user row goes last.
+    """
+    while True:
+        note_ids = list(db.scalars(select(model.Note.id).where(model.Note.owner_id == user_id).limit(batch_size)))
+        if not note_ids:
+            break
+        db.execute(delete(model.note_tag).where(model.note_tag.c.note_id.in_(note_ids)))
+        db.execute(delete(model.NoteRevision).where(model.NoteRevision.note_id.in_(note_ids)))
+        db.execute(delete(model.Note).where(model.Note.id.in_(note_ids)))
+        db.commit()
+    for table in (model.UserTagCount, model.NoteTombstone, model.NoteImport):
+        db.execute(delete(table).where(table.owner_id == user_id))
+    db.execute(delete(model.User).where(model.User.id == user_id))
+    db.commit()
+    user_cache.invalidate(user_id)
+
+
+# -------------------------
+# Board versions
+# -------------------------
+def bump_board_version(db: Session, user_id: int) -> int:
+    # part of the writer's transaction, so the version and the notes change together
+    return db.scalar(
+        update(model.User)
+        .where(model.User.id == user_id)
+        .values(board_version=model.User.board_version + 1)
+        .returning(model.User.board_version)
+    )
+
+def get_board_version(db: Session, user_id: int, replica: bool = False) -> int:
+    # replica=True for reads that load the board from the replica as well,
+    # so the version is never ahead of the notes it tags
+    stmt = select(model.User.board_version).where(model.User.id == user_id)
+    return db.scalar(on_replica(stmt) if replica else stmt) or 0
+
+
+# -------------------------
+# Note change notifications
+# -------------------------
+@dataclass
+class NoteChange:
+    kind: str                           # "create", "update", "delete"; "import"/"layout" for bulk writes
+    user_id: int
+    note_id: Optional[int]              # None for bulk writes
+    note: Optional[model.Note] = None   # the committed note; None for deletes
+    fields: frozenset = frozenset()     # NoteUpdate fields that were written
+    version: Optional[int] = None       # board version the write produced
+
+# Listeners run after a note write commits, in the writer's thread, and get
+# the list of changes from that write. Realtime sync and caches hook in here.
+# Writes on an event loop thread (crud_async's run_sync) hand them to one
+# worker thread instead, so their I/O doesn't block the loop and each
+# write's changes still arrive in order.
+_note_listeners = []
+_listener_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="note-listeners")
+
+_NOTE_RELATIONSHIPS = set(inspect(model.Note).relationships.keys())
+
+def add_note_listener(listener):
+    _note_listeners.append(listener)
+
+def remove_note_listener(listener):
+    _note_listeners.remove(listener)
+
+def _notify(changes: List[NoteChange]):
+    if not changes:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        _run_listeners(changes)
+        return
+    for change in changes:
+        if change.note is not None and inspect(change.note).session is not None:
+            # lazy loads only work here, where the async session runs
+            for key in inspect(change.note).unloaded & _NOTE_RELATIONSHIPS:
+                getattr(change.note, key)
+    _listener_thread.submit(_run_listeners, changes)
+
+def _run_listeners(changes: List[NoteChange]):
+    for listener in list(_note_listeners):
+        try:
+            listener(changes)
+        except Exception:
+            logger.exception("note listener %r failed", listener)
+
 
 # -------------------------
 # Note CRUD
 # -------------------------
+def content_fields(content: Optional[str]) -> dict:
+    # the preview columns, written wherever content is
+    if content is None:
+        return {"content_preview": None, "content_length": None}
+    return {"content_preview": content[:NOTE_PREVIEW_CHARS], "content_length": len(content)}
+
 def create_note(db: Session, note: schemas.NoteCreate, user_id: int):
     db_note = model.Note(
         content=note.content,
+        **content_fields(note.content),
         owner_id=user_id,
         x=note.x,
         y=note.y,
@@ -57,47 +196,72 @@ def create_note(db: Session, note: schemas.NoteCreate, user_id: int):
     )
 
     # Add tags
-    tags = []
-    for tag_name in note.tags:
-        tag = db.query(model.Tag).filter(model.Tag.name == tag_name).first()
-        if not tag:
-            tag = model.Tag(name=tag_name)
-            db.add(tag)
-            db.commit()
-            db.refresh(tag)
-        tags.append(tag)
-    db_note.tags = tags
+    db_note.tags = list(resolve_tags(db, note.tags).values())
+    adjust_tag_counts(db, user_id, {tag.id: 1 for tag in db_note.tags})
 
     db.add(db_note)
+    version = bump_board_version(db, user_id)
     db.commit()
     db.refresh(db_note)
+    _notify([NoteChange("create", user_id, db_note.id, db_note, version=version)])
     return db_note
 
 def update_note(db: Session, note_id: int, note_data: schemas.NoteUpdate):
-    db_note = db.query(model.Note).filter(model.Note.id == note_id).first()
+    # db.get() hits the identity map when the route already loaded the note
+    db_note = db.get(model.Note, note_id)
     if not db_note:
         return None
 
+    record_note_revisions(db, {note_id: note_data.model_dump(include=set(NOTE_FIELDS), exclude_none=True)})
+
     # Update simple fields
     for field in ["content", "x", "y", "width", "height"]:
         value = getattr(note_data, field, None)
         if value is not None:
             setattr(db_note, field, value)
+    if note_data.content is not None:
+        for field, value in content_fields(note_data.content).items():
+            setattr(db_note, field, value)
 
-    # Update tags
+    # Update tags: only touch the links that actually changed
     if note_data.tags is not None:
-        db_note.tags.clear()
-        for tag_name in note_data.tags:
-            tag = db.query(model.Tag).filter(model.Tag.name == tag_name).first()
-            if not tag:
-                tag = model.Tag(name=tag_name)
-                db.add(tag)
-                db.commit()
-                db.refresh(tag)
-            db_note.tags.append(tag)
+        wanted = set(note_data.tags)
+        current = {tag.name: tag for tag in db_note.tags}
+        deltas = {}
+        for tag_name in current.keys() - wanted:
+            db_note.tags.remove(current[tag_name])
+            deltas[current[tag_name].id] = -1
+        added = wanted - current.keys()
+        if added:
+            new_tags = list(resolve_tags(db, added).values())
+            db_note.tags.extend(new_tags)
+            deltas.update((tag.id, 1) for tag in new_tags)
+        adjust_tag_counts(db, db_note.owner_id, deltas)
 
+    version = bump_board_version(db, db_note.owner_id)
     db.commit()
     db.refresh(db_note)
+    fields = frozenset(note_data.model_dump(exclude_none=True))
+    _notify([NoteChange("update", db_note.owner_id, db_note.id, db_note, fields, version)])
+    return db_note
+
+def restore_note(db: Session, note_id: int, state: dict):
+    """Write a revision's content and geometry back as-is, NULLs included.
+
+    Unlike update_note, None means "set to NULL" here. The restore is
+    logged as a new revision; tags are left alone.
+    """
+    db_note = db.get(model.Note, note_id)
+    if not db_note:
+        return None
+    values = {field: state[field] for field in revisions.REVISION_FIELDS}
+    record_note_revisions(db, {note_id: values})
+    for field, value in {**values, **content_fields(values["content"])}.items():
+        setattr(db_note, field, value)
+    version = bump_board_version(db, db_note.owner_id)
+    db.commit()
+    db.refresh(db_note)
+    _notify([NoteChange("update", db_note.owner_id, db_note.id, db_note, frozenset(values), version)])
     return db_note
 
 def get_notes(db: Session, skip: int = 0, limit: int = 10):
@@ -110,20 +274,779 @@ def get_notes(db: Session, skip: int = 0, limit: int = 10):
 def get_notes_for_user(db: Session, user_id: int):
     return db.query(model.Note).filter(model.Note.owner_id == user_id).all()
 
+def board_select(user_id: int, listing: bool = False):
+    # Loads notes + owner in one query and every note's tags in one more,
+    # so the query count stays fixed no matter how big the board gets.
+    # Shared with crud_async, which runs the same statement on AsyncSession.
+    stmt = (
+        select(model.Note)
+        .options(joinedload(model.Note.owner), subqueryload(model.Note.tags))
+        .where(model.Note.owner_id == user_id)
+    )
+    if listing and schemas.PREVIEW_LISTINGS:
+        # listings serialize the preview; touching content would be a query per note
+        stmt = stmt.options(defer(model.Note.content, raiseload=True))
+    return stmt
+
+def board_page_select(user_id: int, limit: int = 100, cursor: Optional[str] = None):
+    stmt = board_select(user_id, listing=True)
+    if cursor:
+        updated_at, note_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(model.Note.updated_at, model.Note.id) > tuple_(updated_at, note_id)
+        )
+    return stmt.order_by(model.Note.updated_at, model.Note.id).limit(limit + 1)
+
+def split_board_page(notes, limit: int):
+    next_cursor = encode_cursor(notes[limit - 1]) if len(notes) > limit else None
+    return notes[:limit], next_cursor
+
+def viewport_select(user_id: int, x: float, y: float, width: float, height: float):
+    # a note overlaps the viewport when the two rectangles intersect on both axes
+    return board_select(user_id, listing=True).where(
+        model.Note.x < x + width,
+        model.Note.x + model.Note.width > x,
+        model.Note.y < y + height,
+        model.Note.y + model.Note.height > y,
+    )
+
+def tagged_select(user_id: int, tag_ids: List[int], match: str = "all"):
+    # the subquery walks ix_note_tag_tag_id_note_id from each tag to its notes
+    linked = select(model.note_tag.c.note_id).where(model.note_tag.c.tag_id.in_(tag_ids))
+    if match == "all":
+        linked = linked.group_by(model.note_tag.c.note_id).having(func.count() == len(tag_ids))
+    return board_select(user_id, listing=True).where(model.Note.id.in_(linked))
+
+def get_board_notes(db: Session, user_id: int, tags: Optional[List[str]] = None, match: str = "all"):
+    """The user's notes, or with `tags` only those carrying all (or any) of them.
+
+    Read from the replica when there is one, like get_board_page.
+    """
+    if not tags:
+        return db.scalars(on_replica(board_select(user_id, listing=True))).all()
+    names = set(tags)
+    tag_ids = list(db.scalars(on_replica(select(model.Tag.id).where(model.Tag.name.in_(names)))))
+    if not tag_ids or (match == "all" and len(tag_ids) < len(names)):
+        return []
+    return db.scalars(on_replica(tagged_select(user_id, tag_ids, match))).all()
+
+def encode_cursor(note: model.Note) -> str:
+    raw = json.dumps([note.updated_at.isoformat(), note.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    # raises ValueError on anything that isn't a cursor we handed out
+    try:
+        updated_at, note_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(note_id)
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+def get_board_page(db: Session, user_id: int, limit: int = 100, cursor: Optional[str] = None):
+    notes = db.scalars(on_replica(board_page_select(user_id, limit=limit, cursor=cursor))).all()
+    return split_board_page(notes, limit)
+
+def get_notes_in_viewport(db: Session, user_id: int, x: float, y: float, width: float, height: float):
+    return db.scalars(viewport_select(user_id, x, y, width, height)).all()
+
+def get_note_content(db: Session, user_id: int, note_id: int):
+    # (id, content) of one of the user's notes, or None
+    return db.execute(
+        select(model.Note.id, model.Note.content).where(model.Note.id == note_id, model.Note.owner_id == user_id)
+    ).first()
+
 def get_note(db: Session, note_id: int):
     return db.query(model.Note).filter(model.Note.id == note_id).first()
 
 def delete_note(db: Session, note_id: int):
-    db_note = db.query(model.Note).filter(model.Note.id == note_id).first()
+    db_note = db.get(model.Note, note_id)
     if db_note:
+        adjust_tag_counts(db, db_note.owner_id, {tag.id: -1 for tag in db_note.tags})
+        db.execute(delete(model.NoteRevision).where(model.NoteRevision.note_id == note_id))
         db.delete(db_note)
+        _record_tombstones(db, db_note.owner_id, [note_id])
+        version = bump_board_version(db, db_note.owner_id)
         db.commit()
+        _notify([NoteChange("delete", db_note.owner_id, note_id, version=version)])
     return db_note
 
 
+# -------------------------
+# Search
+# -------------------------
+SEARCH_HIGHLIGHT = ("<mark>", "</mark>")
+SNIPPET_CHARS = 160
+
+def search_notes(db: Session, user_id: int, q: str, limit: int = 20, offset: int = 0):
+    """Ranked search over note content and tag names.
+
+    Returns up to `limit` (note, rank, snippet) rows plus the next offset,
+    or None when there are no more results.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        rows = _search_notes_pg(db, user_id, q, limit + 1, offset)
+    else:
+        rows = _search_notes_fallback(db, user_id, q)[offset:offset + limit + 1]
+    next_offset = offset + limit if len(rows) > limit else None
+    return rows[:limit], next_offset
+
+def _search_notes_pg(db: Session, user_id: int, q: str, limit: int, offset: int):
+    query = func.websearch_to_tsquery("english", q)
+    content_tsv = literal_column("notes.content_tsv")
+    pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    tag_score = (
+        select(func.max(func.similarity(model.Tag.name, q)))
+        .join(model.note_tag, model.note_tag.c.tag_id == model.Tag.id)
+        .where(
+            model.note_tag.c.note_id == model.Note.id,
+            or_(model.Tag.name.ilike(pattern), model.Tag.name.op("%")(q)),
+        )
+        .scalar_subquery()
+    )
+    rank = (func.ts_rank_cd(content_tsv, query) + func.coalesce(tag_score, 0)).label("rank")
+    start, stop = SEARCH_HIGHLIGHT
+    snippet = func.ts_headline(
+        "english", func.coalesce(model.Note.content, ""), query,
+        f"StartSel={start}, StopSel={stop}, MaxWords=35, MinWords=15",
+    ).label("snippet")
+    stmt = (
+        select(model.Note, rank, snippet)
+        .options(joinedload(model.Note.owner), selectinload(model.Note.tags))
+        .where(
+            model.Note.owner_id == user_id,
+            or_(content_tsv.op("@@")(query), tag_score.is_not(None)),
+        )
+        .order_by(rank.desc(), model.Note.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    return db.execute(stmt).all()
+
+def _search_notes_fallback(db: Session, user_id: int, q: str):
+    # Pure-Python stand-in for SQLite test runs: term counts on content plus
+    # substring hits on tag names, same result shape as the Postgres path.
+    terms = re.findall(r"\w+", q.lower())
+    needle = q.strip().lower()
+    if not terms and not needle:
+        return []
+    results = []
+    # full rows: the listing select defers content in preview mode
+    for note in db.scalars(board_select(user_id)).all():
+        content = note.content or ""
+        lowered = content.lower()
+        rank = sum(lowered.count(term) for term in terms) / (1 + len(lowered) / 1000)
+        rank += sum(1.0 for tag in note.tags if needle and needle in tag.name.lower())
+        if rank > 0:
+            results.append((note, rank, _snippet(content, terms)))
+    results.sort(key=lambda row: (-row[1], row[0].id))
+    return results
+
+def _snippet(content: str, terms: List[str]):
+    if not content:
+        return ""
+    lowered = content.lower()
+    hits = [lowered.find(term) for term in terms if term in lowered]
+    first = min(hits) if hits else 0
+    begin = max(0, first - SNIPPET_CHARS // 4)
+    window = content[begin:begin + SNIPPET_CHARS]
+    if terms:
+        start, stop = SEARCH_HIGHLIGHT
+        pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+        window = pattern.sub(lambda match: start + match.group(0) + stop, window)
+    return window
+
+
+# -------------------------
+# Delta sync
+# -------------------------
+def _record_tombstones(db: Session, user_id: int, note_ids):
+    db.execute(insert(model.NoteTombstone), [{"note_id": note_id, "owner_id": user_id} for note_id in note_ids])
+    cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    db.execute(delete(model.NoteTombstone).where(
+        model.NoteTombstone.owner_id == user_id, model.NoteTombstone.deleted_at < cutoff
+    ))
+
+def encode_change_token(moment: datetime) -> str:
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode()
+
+def decode_change_token(token: str) -> datetime:
+    try:
+        moment = datetime.fromisoformat(base64.urlsafe_b64decode(token.encode()).decode())
+    except UnicodeDecodeError as exc:
+        raise ValueError("Invalid change token") from exc
+    return moment
+
+def _aware(moment: datetime) -> datetime:
+    # SQLite hands back naive timestamps; they are UTC
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+def get_changes(db: Session, user_id: int, since: Optional[str] = None):
+    """Notes created/updated and note ids deleted after a change token.
+
+    Without a token, or with one older than tombstone retention, the whole
+    board comes back with reset=True and the client should replace its copy.
+    Results can repeat changes from just before the token; applying a
+    change twice is harmless.
+    """
+    since_at = decode_change_token(since) if since else None
+    cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    reset = since_at is None or _aware(since_at) < cutoff
+
+    stmt = board_select(user_id, listing=True)
+    deleted = []
+    if not reset:
+        window = since_at - timedelta(seconds=CHANGES_OVERLAP_SECONDS)
+        stmt = stmt.where(model.Note.updated_at > window)
+        deleted = db.execute(
+            select(model.NoteTombstone.note_id, model.NoteTombstone.deleted_at)
+            .where(model.NoteTombstone.owner_id == user_id, model.NoteTombstone.deleted_at > window)
+        ).all()
+    notes = db.scalars(stmt).all()
+
+    moments = [note.updated_at for note in notes] + [deleted_at for _, deleted_at in deleted]
+    if since_at is not None:
+        moments.append(since_at)
+    next_at = max(moments, key=_aware) if moments else datetime.now(timezone.utc)
+    return {
+        "notes": notes,
+        "deleted": sorted({note_id for note_id, _ in deleted}),
+        "next_token": encode_change_token(next_at),
+        "reset": reset,
+    }
+
+
+# -------------------------
+# Batch note operations
+# -------------------------
+NOTE_FIELDS = ("content", "x", "y", "width", "height")
+
+def apply_note_batch(db: Session, user_id: int, operations: List[schemas.NoteBatchOp]):
+    results = [None] * len(operations)
+    referenced = {op.id for op in operations if op.id is not None}
+    owned = set()
+    if referenced:
+        owned = set(db.scalars(
+            select(model.Note.id).where(model.Note.owner_id == user_id, model.Note.id.in_(referenced))
+        ))
+
+    creates = []    # (index, row, tag names)
+    updates = {}    # note id -> merged column values
+    tag_sets = {}   # note id -> tag names, last write wins
+    deleted = set()
+    for index, op in enumerate(operations):
+        if op.op == "create":
+            data = schemas.NoteCreate(**op.model_dump(exclude_none=True, exclude={"op", "id"}))
+            row = {field: getattr(data, field) for field in NOTE_FIELDS}
+            row.update(content_fields(data.content))
+            row["owner_id"] = user_id
+            creates.append((index, row, data.tags))
+            continue
+        if op.id is None:
+            results[index] = {"index": index, "op": op.op, "status": 422, "detail": "id is required"}
+        elif op.id not in owned or op.id in deleted:
+            results[index] = {"index": index, "op": op.op, "id": op.id, "status": 404,
+                              "detail": "Note not found or access denied"}
+        elif op.op == "update":
+            values = op.model_dump(include=set(NOTE_FIELDS), exclude_none=True)
+            if "content" in values:
+                values.update(content_fields(values["content"]))
+            updates.setdefault(op.id, {}).update(values)
+            if op.tags is not None:
+                tag_sets[op.id] = op.tags
+            results[index] = {"index": index, "op": op.op, "id": op.id, "status": 200}
+        else:
+            deleted.add(op.id)
+            updates.pop(op.id, None)
+            tag_sets.pop(op.id, None)
+            # earlier updates of this note are dropped along with it
+            for earlier in results[:index]:
+                if earlier is not None and earlier.get("id") == op.id and earlier["status"] == 200:
+                    earlier.update(status=404, detail="Note deleted later in this batch")
+            results[index] ={"index": index, "op": op.op, "id": op.id, "status": 204}
+
+    if creates:
+        new_ids = db.scalars(
+            insert(model.Note).returning(model.Note.id, sort_by_parameter_order=True),
+            [row for _, row, _ in creates],
+        ).all()
+        for (index, _, tag_names), note_id in zip(creates, new_ids):
+            if tag_names:
+                tag_sets[note_id] = tag_names
+            results[index] = {"index": index, "op": "create", "id": note_id, "status": 201}
+
+    if updates:
+        record_note_revisions(db, updates)
+        now = datetime.now(timezone.utc)
+        db.execute(
+            update(model.Note),
+            [{"id": note_id, "updated_at": now, **values} for note_id, values in updates.items()],
+        )
+
+    if tag_sets:
+        _apply_tag_sets(db, user_id, tag_sets)
+
+    if deleted:
+        unlinked = db.execute(
+            select(model.note_tag.c.tag_id, func.count())
+            .where(model.note_tag.c.note_id.in_(deleted))
+            .group_by(model.note_tag.c.tag_id)
+        ).tuples()
+        adjust_tag_counts(db, user_id, {tag_id: -count for tag_id, count in unlinked})
+        db.execute(delete(model.note_tag).where(model.note_tag.c.note_id.in_(deleted)))
+        db.execute(delete(model.NoteRevision).where(model.NoteRevision.note_id.in_(deleted)))
+        db.execute(delete(model.Note).where(model.Note.id.in_(deleted)))
+        _record_tombstones(db, user_id, deleted)
+
+    version = None
+    if creates or updates or tag_sets or deleted:
+        version = bump_board_version(db, user_id)
+    touched = {result["id"] for result in results if result["status"] in (200, 201)} - deleted
+    db.commit()
+
+    notes = {}
+    if touched:
+        notes = {note.id: note for note in db.scalars(board_select(user_id).where(model.Note.id.in_(touched)))}
+        for result in results:
+            if result["status"] in (200, 201):
+                result["note"] = notes[result["id"]]
+
+    changes = [NoteChange("create", user_id, result["id"], notes[result["id"]], version=version)
+               for result in results if result["status"] == 201]
+    for note_id in updates.keys() | (tag_sets.keys() - {c.note_id for c in changes}):
+        fields = set(updates.get(note_id, ()))
+        if note_id in tag_sets:
+            fields.add("tags")
+        changes.append(NoteChange("update", user_id, note_id, notes[note_id], frozenset(fields), version))
+    changes.extend(NoteChange("delete", user_id, note_id, version=version) for note_id in deleted)
+    _notify(changes)
+    return results
+
+
+def save_note_positions(db: Session, user_id: int, positions):
+    """Move many notes at once: [{"id", "x", "y"}, ...] owned by user_id.
+
+    One executemany UPDATE by primary key. Listeners get a single "layout"
+    change rather than one per note; realtime clients refetch the board.
+    """
+    record_note_revisions(db, {position["id"]: position for position in positions})
+    now = datetime.now(timezone.utc)
+    db.execute(update(model.Note), [{**position, "updated_at": now} for position in positions])
+    version = bump_board_version(db, user_id)
+    db.commit()
+    _notify([NoteChange("layout", user_id, None, version=version)])
+
+def write_note_geometry(db: Session, boards) -> int:
+    """Write buffered moves: {user_id: {note_id: {"x": .., ...}}}.
+
+    One executemany UPDATE for every board (per set of fields moved), one
+    version bump per board.
+    Listeners get an "update" per note carrying its full geometry (not the
+    whole note). Returns the number of notes still there to update.
+    """
+    now = datetime.now(timezone.utc)
+    # Core rather than ORM bulk update so a note deleted in the meantime is
+    # skipped instead of failing the batch; one statement per set of fields
+    by_fields = {}
+    for notes in boards.values():
+        for note_id, values in notes.items():
+            by_fields.setdefault(tuple(sorted(values)), []).append(
+                {"b_id": note_id, **{f"b_{field}": value for field, value in values.items()}}
+            )
+    record_note_revisions(db, {note_id: values for notes in boards.values() for note_id, values in notes.items()})
+    notes_table = model.Note.__table__
+    for fields, params in by_fields.items():
+        db.execute(
+            update(notes_table)
+            .where(notes_table.c.id == bindparam("b_id"))
+            .values(updated_at=now, **{field: bindparam(f"b_{field}") for field in fields}),
+            params,
+        )
+    versions = {user_id: bump_board_version(db, user_id) for user_id in boards}
+    db.commit()
+    geometry = ("x", "y", "width", "height")
+    rows = {row.id: row for row in db.execute(
+        select(model.Note.id, model.Note.owner_id, *(getattr(model.Note, field) for field in geometry))
+        .where(model.Note.id.in_([note_id for notes in boards.values() for note_id in notes]))
+    )}
+    changes = []
+    for user_id, notes in boards.items():
+        for note_id, values in notes.items():
+            row = rows.get(note_id)
+            if row is None:
+                continue  # deleted in the meantime
+            note = model.Note(id=note_id, owner_id=row.owner_id, **{field: getattr(row, field) for field in geometry})
+            changes.append(NoteChange("update", user_id, note_id, note, frozenset(values), versions[user_id]))
+    _notify(changes)
+    return len(changes)
+
+def _apply_tag_sets(db: Session, user_id: int, tag_sets):
+    # diff each note's wanted tag names against its current links
+    tags = resolve_tags(db, {name for names in tag_sets.values() for name in names})
+    wanted = {(note_id, tags[name].id) for note_id, names in tag_sets.items() for name in names}
+    current = set(db.execute(
+        select(model.note_tag.c.note_id, model.note_tag.c.tag_id)
+        .where(model.note_tag.c.note_id.in_(tag_sets))
+    ).tuples())
+    removed = current - wanted
+    if removed:
+        db.execute(delete(model.note_tag).where(
+            tuple_(model.note_tag.c.note_id, model.note_tag.c.tag_id).in_(removed)
+        ))
+    added = wanted - current
+    if added:
+        db.execute(insert(model.note_tag), [{"note_id": n, "tag_id": t} for n, t in added])
+    deltas = Counter(tag_id for _, tag_id in added)
+    deltas.subtract(tag_id for _, tag_id in removed)
+    adjust_tag_counts(db, user_id, deltas)
+
+
+# -------------------------
+# Revisions
+# -------------------------
+def _latest_revisions(db: Session, note_ids):
+    latest = (
+        select(model.NoteRevision.note_id, func.max(model.NoteRevision.revision).label("revision"))
+        .where(model.NoteRevision.note_id.in_(note_ids))
+        .group_by(model.NoteRevision.note_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(model.NoteRevision.id, model.NoteRevision.note_id, model.NoteRevision.revision,
+               model.NoteRevision.snapshot, model.NoteRevision.content.is_(None).label("geometry_only"),
+               model.NoteRevision.geometry, model.NoteRevision.created_at)
+        .join(latest, and_(model.NoteRevision.note_id == latest.c.note_id,
+                           model.NoteRevision.revision == latest.c.revision))
+    )
+    return {row.note_id: row for row in rows}
+
+def _snapshot_row(note_id: int, revision: int, state: dict, created_at: datetime) -> dict:
+    return {"note_id": note_id, "revision": revision, "snapshot": True, "content": state["content"],
+            "geometry": revisions.pack_geometry(state), "created_at": created_at}
+
+def record_note_revisions(db: Session, edits: Dict[int, dict]):
+    """Log a revision for each note about to be updated: {note_id: {field: new value}}.
+
+    Runs inside the writer's transaction, before its UPDATE, so the old
+    state is still there to diff against; the revisions commit with the
+    update. The notes' rows are locked first, so concurrent writers of a
+    note number their revisions one after the other. A None value sets
+    the field to NULL and is logged as a snapshot. A note's first
+    revision is a snapshot of it as it was before.
+    Geometry-only edits within REVISION_COALESCE_SECONDS of the note's last
+    one fold into it, and writing a snapshot trims revisions past
+    REVISION_MAX_PER_NOTE.
+    """
+    if not revisions.NOTE_REVISIONS_ENABLED:
+        return
+    edits = {note_id: {field: value for field, value in values.items() if field in revisions.REVISION_FIELDS}
+             for note_id, values in edits.items()}
+    edits = {note_id: values for note_id, values in edits.items() if values}
+    if not edits:
+        return
+    if db.get_bind().dialect.name == "sqlite":
+        # no FOR UPDATE there: a no-op write takes the database's write lock
+        db.execute(update(model.Note).where(model.Note.id.in_(edits))
+                   .values(id=model.Note.id, updated_at=model.Note.updated_at)
+                   .execution_options(synchronize_session=False))
+    else:
+        db.execute(select(model.Note.id).where(model.Note.id.in_(edits)).order_by(model.Note.id).with_for_update())
+    now = datetime.now(timezone.utc)
+    coalesce_after = now - timedelta(seconds=revisions.REVISION_COALESCE_SECONDS)
+    latest = _latest_revisions(db, list(edits))
+
+    merges = []
+    pending = {}
+    for note_id, values in edits.items():
+        last = latest.get(note_id)
+        if (last is not None and last.geometry_only and not last.snapshot and "content" not in values
+                and None not in values.values() and _aware(last.created_at) > coalesce_after):
+            geometry = {**revisions.unpack_geometry(last.geometry), **values}
+            merges.append({"b_id": last.id, "b_geometry": revisions.pack_geometry(geometry), "b_created_at": now})
+        else:
+            pending[note_id] = values
+
+    # the old state, for first revisions, content diffs and snapshots
+    needed = [note_id for note_id, values in pending.items()
+              if note_id not in latest or "content" in values or None in values.values()
+              or revisions.is_snapshot(latest[note_id].revision + 1)]
+    old = {}
+    if needed:
+        old = {row.id: row for row in db.execute(
+            select(model.Note.id, model.Note.content, model.Note.x, model.Note.y, model.Note.width,
+                   model.Note.height, model.Note.updated_at)
+            .where(model.Note.id.in_(needed))
+        )}
+
+    rows = []
+    trims = []
+    for note_id, values in pending.items():
+        before = old.get(note_id)
+        if note_id in needed and before is None:
+            continue  # deleted in the meantime
+        if "content" in values and values["content"] == before.content:
+            del values["content"]
+            if not values:
+                continue
+        last = latest.get(note_id)
+        if last is None:
+            state = {field: getattr(before, field) for field in revisions.REVISION_FIELDS}
+            rows.append(_snapshot_row(note_id, 1, state, before.updated_at or now))
+            number = 2
+        else:
+            number = last.revision + 1
+        delta = None
+        if values.get("content") is not None:
+            delta = revisions.diff_text(before.content or "", values["content"])
+        if revisions.is_snapshot(number) or ("content" in values and delta is None) or None in values.values():
+            state = {field: getattr(before, field) for field in revisions.REVISION_FIELDS}
+            rows.append(_snapshot_row(note_id, number, {**state, **values}, now))
+            if revisions.trim_before(number) > 1:
+                trims.append({"b_note_id": note_id, "b_revision": revisions.trim_before(number)})
+        else:
+            rows.append({"note_id": note_id, "revision": number, "snapshot": False, "content": delta,
+                         "geometry": revisions.pack_geometry(values), "created_at": now})
+
+    table = model.NoteRevision.__table__
+    if rows:
+        db.execute(insert(table), rows)
+    if merges:
+        db.execute(
+            update(table).where(table.c.id == bindparam("b_id"))
+            .values(geometry=bindparam("b_geometry"), created_at=bindparam("b_created_at")),
+            merges,
+        )
+    if trims:
+        db.execute(
+            delete(table).where(table.c.note_id == bindparam("b_note_id"), table.c.revision < bindparam("b_revision")),
+            trims,
+        )
+
+def _replay_revisions(db: Session, note_id: int, low: int, high: int):
+    # rows from the last snapshot before `low` (so low's changes are known)
+    # through `high`, replayed
+    snapshots = select(func.max(model.NoteRevision.revision)).where(
+        model.NoteRevision.note_id == note_id, model.NoteRevision.snapshot
+    )
+    start = db.scalar(snapshots.where(model.NoteRevision.revision < low))
+    if start is None:
+        start = db.scalar(snapshots.where(model.NoteRevision.revision <= low))
+    if start is None:
+        return []
+    rows = db.execute(
+        select(model.NoteRevision.revision, model.NoteRevision.snapshot, model.NoteRevision.content,
+               model.NoteRevision.geometry, model.NoteRevision.created_at)
+        .where(model.NoteRevision.note_id == note_id, model.NoteRevision.revision.between(start, high))
+        .order_by(model.NoteRevision.revision)
+    ).all()
+    return [replayed for replayed in revisions.replay(rows) if replayed[0].revision >= low]
+
+def get_note_revisions(db: Session, note_id: int, limit: int = 20, before: Optional[int] = None):
+    """A note's revisions, newest first, and the `before` for the page after.
+
+    Each is {"revision", "created_at", "changed", "content", "x", ...}
+    with the note's full state as of that revision.
+    """
+    stmt = select(model.NoteRevision.revision).where(model.NoteRevision.note_id == note_id)
+    if before is not None:
+        stmt = stmt.where(model.NoteRevision.revision < before)
+    numbers = list(db.scalars(stmt.order_by(model.NoteRevision.revision.desc()).limit(limit + 1)))
+    if not numbers:
+        return [], None
+    next_before = numbers[limit - 1] if len(numbers) > limit else None
+    numbers = numbers[:limit]
+    replayed = _replay_revisions(db, note_id, numbers[-1], numbers[0])
+    page = [{"revision": row.revision, "created_at": row.created_at, "changed": changed, **state}
+            for row, state, changed in replayed]
+    return page[::-1], next_before
+
+def get_note_revision(db: Session, note_id: int, revision: int) -> Optional[dict]:
+    # the note's content and geometry as of `revision`, or None if it isn't kept
+    replayed = _replay_revisions(db, note_id, revision, revision)
+    if not replayed or replayed[-1][0].revision != revision:
+        return None
+    return replayed[-1][1]
+
+def prune_note_revisions(db: Session, before: datetime) -> int:
+    # Drop revisions older than `before`, except from each note's newest
+    # snapshot before then on, which later revisions replay from.
+    older = model.NoteRevision.__table__.alias("older")
+    table = model.NoteRevision.__table__
+    newest_old_snapshot = (
+        select(func.max(older.c.revision))
+        .where(older.c.note_id == table.c.note_id, older.c.snapshot, older.c.created_at < before)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        delete(table).where(table.c.created_at < before, table.c.revision < newest_old_snapshot)
+    )
+    db.commit()
+    return result.rowcount
+
+
+# -------------------------
+# Bulk import/export
+# -------------------------
+EXPORT_BATCH = int(os.environ.get("EXPORT_BATCH", 1000))
+EXPORT_COLUMNS = ("id", "content", "x", "y", "width", "height", "created_at", "updated_at")
+
+def export_board(db: Session, user_id: int):
+    """Yield the user's notes as plain dicts, EXPORT_BATCH rows at a time.
+
+    yield_per streams through a server-side cursor on Postgres, so memory
+    stays flat however large the board is. Tags come one query per batch.
+    """
+    result = db.execute(
+        select(*(getattr(model.Note, column) for column in EXPORT_COLUMNS))
+        .where(model.Note.owner_id == user_id)
+        .order_by(model.Note.id)
+        .execution_options(yield_per=EXPORT_BATCH)
+    )
+    for rows in result.partitions():
+        tags = {}
+        for note_id, name in db.execute(
+            select(model.note_tag.c.note_id, model.Tag.name)
+            .join(model.Tag, model.Tag.id == model.note_tag.c.tag_id)
+            .where(model.note_tag.c.note_id.in_([row.id for row in rows]))
+        ):
+            tags.setdefault(note_id, []).append(name)
+        for row in rows:
+            yield {**row._asdict(), "tags": sorted(tags.get(row.id, []))}
+
+def start_note_import(db: Session, user_id: int, import_id: str) -> model.NoteImport:
+    # resuming an import returns its checkpoint instead of starting over
+    checkpoint = db.get(model.NoteImport, (import_id, user_id))
+    if checkpoint is None:
+        checkpoint = model.NoteImport(id=import_id, owner_id=user_id, status="running")
+        db.add(checkpoint)
+    elif checkpoint.status == "failed":
+        checkpoint.status = "running"
+    db.commit()
+    db.refresh(checkpoint)
+    return checkpoint
+
+def import_note_chunk(db: Session, checkpoint: model.NoteImport, notes: List[schemas.NoteImportLine],
+                      lines_processed: int, failed_lines: int = 0):
+    """Insert a chunk of imported notes and advance the checkpoint.
+
+    Notes go in with one executemany INSERT and their tags are resolved
+    for the whole chunk at once; both commit with the checkpoint.
+    """
+    user_id = checkpoint.owner_id
+    if notes:
+        now = datetime.now(timezone.utc)
+        rows = []
+        for note in notes:
+            row = {field: getattr(note, field) for field in NOTE_FIELDS}
+            row.update(content_fields(note.content))
+            row.update(owner_id=user_id, created_at=note.created_at or now, updated_at=now)
+            rows.append(row)
+        note_ids = db.scalars(
+            insert(model.Note).returning(model.Note.id, sort_by_parameter_order=True), rows
+        ).all()
+        tags = resolve_tags(db, {name for note in notes for name in note.tags})
+        links = {(note_id, tags[name].id) for note, note_id in zip(notes, note_ids) for name in note.tags}
+        if links:
+            db.execute(insert(model.note_tag), [{"note_id": n, "tag_id": t} for n, t in links])
+            adjust_tag_counts(db, user_id, Counter(tag_id for _, tag_id in links))
+        version = bump_board_version(db, user_id)
+
+    checkpoint.lines_processed = lines_processed
+    checkpoint.notes_imported += len(notes)
+    checkpoint.failed_lines += failed_lines
+    db.commit()
+    if notes:
+        # one change per chunk; listeners treat it as "refetch the board"
+        _notify([NoteChange("import", user_id, None, version=version)])
+    return checkpoint
+
+def finish_note_import(db: Session, checkpoint: model.NoteImport, status: str = "completed"):
+    checkpoint.status = status
+    db.commit()
+    db.refresh(checkpoint)
+    return checkpoint
+
+def get_note_import(db: Session, user_id: int, import_id: str) -> Optional[model.NoteImport]:
+    return db.get(model.NoteImport, (import_id, user_id))
+
+
 # -------------------------
 # Tag CRUD
 # -------------------------
+def resolve_tags(db: Session, tag_names):
+    """Map tag names to Tag rows, creating the missing ones in one statement.
+
+    Does not commit; the caller's transaction owns the new tags.
+    """
+    names = set(tag_names)
+    if not names:
+        return {}
+    tags = {tag.name: tag for tag in db.scalars(select(model.Tag).where(model.Tag.name.in_(names)))}
+    missing = sorted(names - tags.keys())
+    if missing:
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            upsert = pg_insert if dialect == "postgresql" else sqlite_insert
+            stmt = (
+                upsert(model.Tag)
+                .values([{"name": name} for name in missing])
+                .on_conflict_do_nothing(index_elements=[model.Tag.name])
+                .returning(model.Tag)
+            )
+            tags.update((tag.name, tag) for tag in db.scalars(stmt))
+        else:
+            db.add_all(model.Tag(name=name) for name in missing)
+            db.flush()
+        # anything still missing was inserted by a concurrent transaction
+        raced = names - tags.keys()
+        if raced:
+            tags.update((tag.name, tag) for tag in db.scalars(select(model.Tag).where(model.Tag.name.in_(raced))))
+    return tags
+
+def adjust_tag_counts(db: Session, user_id: int, deltas: Dict[int, int]):
+    """Apply {tag_id: +n/-n} to the user's tag counts.
+
+    Called wherever note_tag rows are added or removed, in the same
+    transaction, so the counts move with the links. Tags dropping to
+    zero notes are removed from the board's list.
+    """
+    deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    counts = model.UserTagCount
+    # rows in tag order, so concurrent writers lock them in the same order
+    rows = [{"owner_id": user_id, "tag_id": tag_id, "note_count": deltas[tag_id]} for tag_id in sorted(deltas)]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        upsert = pg_insert if dialect == "postgresql" else sqlite_insert
+        stmt = upsert(counts).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[counts.owner_id, counts.tag_id],
+            set_={"note_count": counts.note_count + stmt.excluded.note_count},
+        ))
+    else:
+        existing = {row.tag_id: row for row in db.scalars(
+            select(counts).where(counts.owner_id == user_id, counts.tag_id.in_(deltas))
+        )}
+        for row in rows:
+            if row["tag_id"] in existing:
+                existing[row["tag_id"]].note_count += row["note_count"]
+            else:
+                db.add(counts(**row))
+        db.flush()
+    if any(delta < 0 for delta in deltas.values()):
+        db.execute(delete(counts).where(
+            counts.owner_id == user_id, counts.tag_id.in_(deltas), counts.note_count <= 0
+        ))
+
+def get_tag_counts(db: Session, user_id: int):
+    """(name, note_count) for every tag on the user's board, most used first."""
+    return db.execute(
+        select(model.Tag.name, model.UserTagCount.note_count)
+        .join(model.Tag, model.Tag.id == model.UserTagCount.tag_id)
+        .where(model.UserTagCount.owner_id == user_id)
+        .order_by(model.UserTagCount.note_count.desc(), model.Tag.name)
+    ).all()
+
 def create_tag(db: Session, tag: schemas.TagCreate):
     db_tag = model.Tag(name=tag.name)
     db.add(db_tag)
@@ -133,3 +1056,85 @@ def create_tag(db: Session, tag: schemas.TagCreate):
 
 def get_tags(db: Session):
     return db.query(model.Tag).all()
+
+
+# -------------------------
+# Jobs
+# -------------------------
+def create_job(db: Session, kind: str, owner_id: Optional[int], payload: dict, max_attempts: int = 3) -> model.Job:
+    now = datetime.now(timezone.utc)
+    job = model.Job(id=uuid.uuid4().hex, kind=kind, owner_id=owner_id, payload=payload,
+                    status="queued", max_attempts=max_attempts, run_after=now)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_job(db: Session, job_id: str) -> Optional[model.Job]:
+    return db.get(model.Job, job_id)
+
+def claim_job(db: Session, lease_seconds: float, job_id: Optional[str] = None) -> Optional[model.Job]:
+    """Mark one due job as running and return it, or None.
+
+    A job is due when it is queued and its run_after has passed, or when
+    it is running but its lease ran out (the worker died). The UPDATE only
+    matches while that still holds, so two workers never claim the same
+    job; on Postgres SKIP LOCKED keeps them from queueing on one row.
+    """
+    now = datetime.now(timezone.utc)
+    Job = model.Job
+    due = or_(
+        and_(Job.status == "queued", Job.run_after <= now),
+        and_(Job.status == "running", Job.lease_expires_at < now),
+    )
+    candidate = select(Job.id).where(due).order_by(Job.run_after).limit(1)
+    if job_id is not None:
+        candidate = candidate.where(Job.id == job_id)
+    if db.get_bind().dialect.name == "postgresql":
+        candidate = candidate.with_for_update(skip_locked=True)
+    claimed = db.scalar(
+        update(Job)
+        .where(Job.id == candidate.scalar_subquery(), due)
+        .values(status="running", attempts=Job.attempts + 1,
+                lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+        .returning(Job.id)
+    )
+    db.commit()
+    return db.get(Job, claimed, populate_existing=True) if claimed else None
+
+def finish_job(db: Session, job: model.Job, status: str, result: Optional[dict] = None,
+               error: Optional[str] = None, retry_in: Optional[float] = None):
+    # retry_in puts the job back in the queue instead of finishing it
+    now = datetime.now(timezone.utc)
+    job.lease_expires_at = None
+    job.error = error
+    if retry_in is not None:
+        job.status = "queued"
+        job.run_after = now + timedelta(seconds=retry_in)
+    else:
+        job.status = status
+        job.result = result
+        job.finished_at = now
+    db.commit()
+    return job
+
+def request_job_cancel(db: Session, job: model.Job) -> model.Job:
+    """Cancel a queued job now; ask a running one to stop at its next check."""
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = datetime.now(timezone.utc)
+    elif job.status == "running":
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job
+
+def job_cancel_requested(db: Session, job_id: str) -> bool:
+    return bool(db.scalar(select(model.Job.cancel_requested).where(model.Job.id == job_id)))
+
+def prune_jobs(db: Session, before: datetime) -> int:
+    result = db.execute(delete(model.Job).where(
+        model.Job.status.in_(("succeeded", "failed", "cancelled")), model.Job.finished_at < before
+    ))
+    db.commit()
+    return result.rowcount
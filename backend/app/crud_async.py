@@ -0,0 +1,60 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app import crud, model, schemas
+
+# Async counterparts of the crud functions used by the corkboard routes.
+# Reads run natively on AsyncSession; writes run the sync crud functions
+# through run_sync so both stacks share one implementation of the write
+# path, then reload the note with the board's eager-load options.
+
+
+# -------------------------
+# User reads
+# -------------------------
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(model.User, user_id)
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(model.User).where(model.User.username == username))
+
+
+# -------------------------
+# Note reads
+# -------------------------
+async def get_board_notes(db: AsyncSession, user_id: int):
+    return (await db.scalars(crud.board_select(user_id, listing=True))).all()
+
+async def get_board_page(db: AsyncSession, user_id: int, limit: int = 100, cursor: Optional[str] = None):
+    notes = (await db.scalars(crud.board_page_select(user_id, limit=limit, cursor=cursor))).all()
+    return crud.split_board_page(notes, limit)
+
+async def get_notes_in_viewport(db: AsyncSession, user_id: int, x: float, y: float, width: float, height: float):
+    return (await db.scalars(crud.viewport_select(user_id, x, y, width, height))).all()
+
+async def get_note(db: AsyncSession, note_id: int):
+    return await db.get(model.Note, note_id)
+
+async def _load_board_note(db: AsyncSession, user_id: int, note_id: int):
+    stmt = crud.board_select(user_id).where(model.Note.id == note_id)
+    return await db.scalar(stmt.execution_options(populate_existing=True))
+
+
+# -------------------------
+# Note writes
+# -------------------------
+async def create_note(db: AsyncSession, note: schemas.NoteCreate, user_id: int):
+    db_note = await db.run_sync(crud.create_note, note, user_id)
+    return await _load_board_note(db, user_id, db_note.id)
+
+async def update_note(db: AsyncSession, note_id: int, note_data: schemas.NoteUpdate):
+    db_note = await db.run_sync(crud.update_note, note_id, note_data)
+    if db_note is None:
+        return None
+    return await _load_board_note(db, db_note.owner_id, note_id)
+
+async def delete_note(db: AsyncSession, note_id: int):
+    return await db.run_sync(crud.delete_note, note_id)
+
+async def apply_note_batch(db: AsyncSession, user_id: int, operations: List[schemas.NoteBatchOp]):
+    return await db.run_sync(crud.apply_note_batch, user_id, operations)
@@ -1,12 +1,100 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import os
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
+# optional read replica for read-only queries that tolerate replication lag
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+# only meaningful for Postgres; SQLite (local runs, benchmarks) takes no sslmode
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")
 
-engine = create_engine(DATABASE_URL, connect_args={"sslmode": "require"})
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # seconds, below the server's idle timeout
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def make_engine(url: str):
+    if not url.startswith("postgres"):
+        return create_engine(url)
+    return create_engine(
+        url,
+        connect_args={"sslmode": DB_SSLMODE},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+engine = make_engine(DATABASE_URL)
+replica_engine = make_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+
+def on_replica(stmt):
+    # marks a read-only statement for the replica, when one is configured
+    return stmt.execution_options(replica=True)
+
+class RoutingSession(Session):
+    # Marked statements go to the replica, and so do the subqueryload
+    # queries they spawn, which carry the mark. Everything else, writes
+    # and flushes included, stays on `engine`.
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if replica_engine is not None and clause is not None and clause.get_execution_options().get("replica"):
+            return replica_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=RoutingSession)
 
 Base = declarative_base()
+
+# -------------------------
+# Dependency: DB Session
+# -------------------------
+# Shared by the routes and the auth dependencies, so FastAPI resolves it
+# once and an authenticated request runs on a single session.
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# -------------------------
+# Async engine (opt-in)
+# -------------------------
+# With DB_ASYNC_ENABLED set, the async routes are mounted under /async next
+# to the sync ones so both stacks can be benchmarked against the same DB.
+DB_ASYNC_ENABLED = os.environ.get("DB_ASYNC_ENABLED", "").lower() in ("1", "true", "yes")
+ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", 10))
+ASYNC_MAX_OVERFLOW = int(os.environ.get("ASYNC_DB_MAX_OVERFLOW", 10))
+ASYNC_POOL_TIMEOUT = float(os.environ.get("ASYNC_DB_POOL_TIMEOUT", 10))
+ASYNC_POOL_RECYCLE = int(os.environ.get("ASYNC_DB_POOL_RECYCLE", 1800))  # seconds
+
+def to_async_url(url: str) -> str:
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or (DATABASE_URL and to_async_url(DATABASE_URL))
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC_ENABLED:
+    if ASYNC_DATABASE_URL.startswith("sqlite"):
+        async_engine = create_async_engine(ASYNC_DATABASE_URL)
+    else:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=ASYNC_POOL_SIZE,
+            max_overflow=ASYNC_MAX_OVERFLOW,
+            pool_timeout=ASYNC_POOL_TIMEOUT,
+            pool_recycle=ASYNC_POOL_RECYCLE,
+            pool_pre_ping=True,
+            connect_args={"ssl": "require"},
+        )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
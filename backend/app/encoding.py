@@ -0,0 +1,138 @@
+import gzip
+import os
+from typing import Optional
+
+import pydantic_core
+from fastapi import Request, Response
+
+from app.schemas import PREVIEW_LISTINGS
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; the fallback below is slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPACT_MEDIA_TYPE = "application/vnd.noteify.compact+json"
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 4))
+
+
+def dumps(value) -> bytes:
+    # OPT_UTC_Z writes UTC datetimes with a Z, as pydantic_core does (and
+    # response_model output), so both give the same bytes, and ETags, for
+    # a board. They still differ on floats of 1e16 and up (1e16 / 1e+16).
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return pydantic_core.to_json(value)
+
+
+# -------------------------
+# Compact note listings
+# -------------------------
+def wants_compact(request: Request, format: Optional[str] = None) -> bool:
+    if format is not None:
+        return format == "compact"
+    return COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+
+def compact_notes(notes, **extra) -> dict:
+    # Each owner and tag is listed once in a side table and notes refer to
+    # them by id, instead of NoteOut repeating them on every note. Content
+    # follows NOTE_LISTING_CONTENT, like the other listings.
+    tags = {}
+    users = {}
+    rows = []
+    for note in notes:
+        for tag in note.tags:
+            tags[tag.id] = tag
+        owner = note.owner
+        if owner is not None:
+            users[owner.id] = owner
+        if PREVIEW_LISTINGS:
+            content = {"content": note.content_preview,
+                       "content_truncated": (note.content_length or 0) > len(note.content_preview or "")}
+        else:
+            content = {"content": note.content}
+        rows.append({
+            "id": note.id,
+            **content,
+            "x": note.x,
+            "y": note.y,
+            "width": note.width,
+            "height": note.height,
+            "created_at": note.created_at,
+            "updated_at": note.updated_at,
+            "owner_id": note.owner_id,
+            "tag_ids": [tag.id for tag in note.tags],
+        })
+    return {
+        "notes": rows,
+        "tags": [{"id": tag.id, "name": tag.name} for tag in tags.values()],
+        "users": [{"id": user.id, "username": user.username, "email": user.email} for user in users.values()],
+        **extra,
+    }
+
+def compact_bytes(notes, **extra) -> bytes:
+    return dumps(compact_notes(notes, **extra))
+
+
+# -------------------------
+# Content negotiation
+# -------------------------
+def negotiate_encoding(request: Request) -> str:
+    # q-values are ignored beyond q=0 opting out; br beats gzip when offered
+    offered = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        offered[name.strip().lower()] = params.replace(" ", "") not in ("q=0", "q=0.0")
+    if brotli is not None and offered.get("br"):
+        return "br"
+    if offered.get("gzip"):
+        return "gzip"
+    return "identity"
+
+def compress(payload: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(payload, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(payload, compresslevel=GZIP_LEVEL)
+    return payload
+
+def bytes_response(payload: bytes, media_type: str, encoding: str = "identity", status_code: int = 200) -> Response:
+    # `payload` must already be encoded with `encoding`
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=payload, status_code=status_code, media_type=media_type, headers=headers)
+
+def encoded_response(request: Request, payload: bytes, media_type: str = "application/json") -> Response:
+    encoding = negotiate_encoding(request) if len(payload) >= COMPRESS_MIN_BYTES else "identity"
+    return bytes_response(compress(payload, encoding), media_type, encoding)
+
+
+# -------------------------
+# NDJSON
+# -------------------------
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def ndjson_line(value) -> bytes:
+    return dumps(value) + b"\n"
+
+async def ndjson_lines(chunks, max_line_bytes: int):
+    # Split a streamed body into lines without holding more than one
+    # line plus one chunk in memory.
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"line longer than {max_line_bytes} bytes")
+    if buffer:
+        yield buffer
@@ -0,0 +1,317 @@
+import functools
+import heapq
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from app import database
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))  # 0 disables the slow-request log
+SLOW_STATEMENTS_KEPT = int(os.environ.get("SLOW_STATEMENTS_KEPT", 3))
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")  # when set, /metrics requires "Authorization: Bearer <token>"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# -------------------------
+# Per-request stats
+# -------------------------
+class RequestStats:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = None  # path template, set once the request is routed
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.handler_time = 0.0
+        self.serialize_time = 0.0
+        self.slowest = []  # min-heap of (duration, statement)
+        self._endpoint_done = None
+
+    def record_query(self, statement: str, duration: float):
+        self.queries += 1
+        self.db_time += duration
+        if SLOW_STATEMENTS_KEPT:
+            entry = (duration, statement)
+            if len(self.slowest) < SLOW_STATEMENTS_KEPT:
+                heapq.heappush(self.slowest, entry)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def server_timing(self, total: float) -> str:
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f"handler;dur={self.handler_time * 1000:.1f}",
+            f"serialize;dur={self.serialize_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+# Sync handlers run on the threadpool with a copy of the request's context,
+# so they see the same RequestStats object and their queries land on it.
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+@contextmanager
+def timed(phase: str = "serialize"):
+    # for handlers that serialize by hand instead of through response_model
+    stats = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            setattr(stats, f"{phase}_time", getattr(stats, f"{phase}_time") + time.perf_counter() - started)
+
+
+# -------------------------
+# SQL timing
+# -------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    stats = _current.get()
+    if started is not None and stats is not None:
+        stats.record_query(statement, time.perf_counter() - started)
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# -------------------------
+# Route timing
+# -------------------------
+def _timed_endpoint(endpoint):
+    # Times the endpoint itself; what the route does after it returns
+    # (response_model validation and JSON encoding) counts as serialization.
+    def finish(stats, started):
+        if stats is not None:
+            stats._endpoint_done = time.perf_counter()
+            stats.handler_time += stats._endpoint_done - started
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            stats, started = _current.get(), time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                finish(stats, started)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            stats, started = _current.get(), time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                finish(stats, started)
+    return wrapper
+
+
+class InstrumentedRoute(APIRoute):
+    # route_class for the app and its routers; labels metrics with the path
+    # template rather than the raw path.
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def instrumented_handler(request):
+            stats = _current.get()
+            if stats is None:
+                return await handler(request)
+            stats.route = route
+            try:
+                return await handler(request)
+            finally:
+                if stats._endpoint_done is not None:
+                    stats.serialize_time += time.perf_counter() - stats._endpoint_done
+                    stats._endpoint_done = None
+
+        return instrumented_handler
+
+
+# -------------------------
+# Metrics
+# -------------------------
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names: Tuple[str, ...]) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self._series.items()):
+            base = _labels(zip(label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {count}'
+            yield f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}'
+            yield f"{self.name}_sum{{{base}}} {series[-2]}"
+            yield f"{self.name}_count{{{base}}} {series[-1]}"
+
+
+def _labels(pairs) -> str:
+    return ",".join(f'{name}="{str(value)}"' for name, value in pairs)
+
+
+class Metrics:
+    ROUTE_LABELS = ("method", "route")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duration = Histogram("noteify_request_duration_seconds", "Request latency", LATENCY_BUCKETS)
+        self.db_duration = Histogram("noteify_request_db_seconds", "Time spent in SQL per request", LATENCY_BUCKETS)
+        self.serialize_duration = Histogram(
+            "noteify_request_serialize_seconds", "Time spent serializing responses", LATENCY_BUCKETS
+        )
+        self.queries = Histogram("noteify_request_queries", "SQL statements per request", QUERY_BUCKETS)
+        self.responses = {}  # (method, route, status) -> count
+        self.slow_requests = 0
+        self._collectors = []
+
+    def observe(self, stats: RequestStats, status: int, total: float, slow: bool):
+        labels = (stats.method, stats.route or "unmatched")
+        with self._lock:
+            self.duration.observe(labels, total)
+            self.db_duration.observe(labels, stats.db_time)
+            self.serialize_duration.observe(labels, stats.serialize_time)
+            self.queries.observe(labels, stats.queries)
+            key = labels + (status,)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            if slow:
+                self.slow_requests += 1
+
+    def add_collector(self, collect: Callable[[], Iterable[tuple]]):
+        # `collect` yields (name, type, help, labels dict, value) when /metrics
+        # is scraped, for state that lives elsewhere (caches, pools, queues)
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for histogram in (self.duration, self.db_duration, self.serialize_duration, self.queries):
+                lines.extend(histogram.render(self.ROUTE_LABELS))
+            lines.append("# HELP noteify_responses_total Responses by route and status")
+            lines.append("# TYPE noteify_responses_total counter")
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f"noteify_responses_total{{{_labels([('method', method), ('route', route), ('status', status)])}}} {count}")
+            lines.append("# HELP noteify_slow_requests_total Requests slower than SLOW_REQUEST_MS")
+            lines.append("# TYPE noteify_slow_requests_total counter")
+            lines.append(f"noteify_slow_requests_total {self.slow_requests}")
+        described = set()
+        for collect in self._collectors:
+            for name, kind, help, labels, value in collect():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{{{_labels(labels.items())}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+
+# -------------------------
+# Middleware
+# -------------------------
+class InstrumentationMiddleware:
+    # Plain ASGI middleware so the Server-Timing header can be added to any
+    # response, including the raw byte responses built by hand in main.py.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope["method"], scope["path"])
+        token = _current.set(stats)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    total = time.perf_counter() - stats.started
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", stats.server_timing(total).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self._finish(stats, status)
+
+    def _finish(self, stats: RequestStats, status: int):
+        total = time.perf_counter() - stats.started
+        slow = bool(SLOW_REQUEST_MS) and total * 1000 >= SLOW_REQUEST_MS
+        metrics.observe(stats, status, total, slow)
+        if slow:
+            statements = "; ".join(
+                f"{duration * 1000:.1f}ms {' '.join(statement.split())[:200]}"
+                for duration, statement in sorted(stats.slowest, reverse=True)
+            )
+            logger.warning(
+                "slow request %s %s -> %s in %.1fms (db %.1fms over %d queries, handler %.1fms, "
+                "serialize %.1fms); slowest: %s",
+                stats.method, stats.route or stats.path, status, total * 1000, stats.db_time * 1000,
+                stats.queries, stats.handler_time * 1000, stats.serialize_time * 1000, statements or "-",
+            )
+
+
+def _pool_metrics():
+    engines = [("primary", database.engine), ("replica", database.replica_engine)]
+    if database.async_engine is not None:
+        engines.append(("async", database.async_engine.sync_engine))
+    for name, engine in engines:
+        pool = getattr(engine, "pool", None)
+        if not isinstance(pool, QueuePool):
+            continue  # SQLite's pools don't track checkouts
+        labels = {"pool": name}
+        yield "noteify_db_pool_size", "gauge", "Configured pool size", labels, pool.size()
+        yield "noteify_db_pool_checked_out", "gauge", "Connections in use", labels, pool.checkedout()
+        yield "noteify_db_pool_checked_in", "gauge", "Idle connections in the pool", labels, pool.checkedin()
+        yield "noteify_db_pool_overflow", "gauge", "Connections open beyond pool_size", labels, pool.overflow()
+
+instrument_engine(database.engine)
+if database.replica_engine is not None:
+    instrument_engine(database.replica_engine)
+if database.async_engine is not None:
+    instrument_engine(database.async_engine.sync_engine)
+metrics.add_collector(_pool_metrics)
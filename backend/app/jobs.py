@@ -0,0 +1,254 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app import crud, layout, model, revisions
+from app.database import SessionLocal
+from app.write_buffer import write_buffer
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))  # worker threads per process
+# "database" polls the jobs table, so any process can run any job and queued
+# jobs survive restarts; "memory" hands ids to this process's workers directly
+JOB_BROKER = os.environ.get("JOB_BROKER", "database")
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))  # seconds between looks at the table
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BACKOFF = float(os.environ.get("JOB_RETRY_BACKOFF", 5))  # seconds, doubled per attempt
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 600))  # a running job past this is run again
+JOB_RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", 7))  # finished jobs are pruned after this
+JOB_SHUTDOWN_TIMEOUT = float(os.environ.get("JOB_SHUTDOWN_TIMEOUT", 10))  # then running jobs are left to their lease
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# -------------------------
+# Handlers
+# -------------------------
+# A handler gets a session and the claimed job and returns a JSON-able
+# result. It may run more than once (retries, an expired lease), so it
+# must be safe to repeat. Long ones call check_cancelled() between steps.
+HANDLERS: Dict[str, Callable[[Session, model.Job], Optional[dict]]] = {}
+
+def handler(kind: str):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+def check_cancelled(db: Session, job: model.Job):
+    if crud.job_cancel_requested(db, job.id):
+        raise JobCancelled()
+
+@handler("delete_account")
+def delete_account(db: Session, job: model.Job):
+    crud.delete_user(db, job.owner_id)
+    return {"user_id": job.owner_id}
+
+@handler("layout")
+def layout_board(db: Session, job: model.Job):
+    write_buffer.flush(job.owner_id)
+    options = job.payload
+    origin = tuple(options["origin"]) if options.get("origin") is not None else None
+    positions = layout.layout_board(db, job.owner_id, algorithm=options["algorithm"], gap=options["gap"],
+                                    origin=origin, dry_run=True)
+    check_cancelled(db, job)
+    crud.save_note_positions(db, job.owner_id, positions)
+    return {"algorithm": options["algorithm"], "notes": len(positions)}
+
+
+# -------------------------
+# Brokers
+# -------------------------
+# A broker tells workers when to look for work and, optionally, which job.
+# `next` returns a job id, or None for "claim whatever is due"; claiming
+# always goes through the jobs table, so a hint for a job that is gone or
+# already taken is harmless.
+
+class DatabaseBroker:
+    # No transport at all: workers poll the table. Enqueues in this process
+    # wake a worker right away instead of waiting for the next poll.
+    def __init__(self, poll_interval: float = JOB_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._wake = threading.Condition()
+        self._pending = 0
+        self._closed = False
+
+    def publish(self, job_id: str, delay: float = 0.0):
+        if delay:
+            return  # the poll finds it once run_after passes
+        with self._wake:
+            self._pending += 1
+            self._wake.notify()
+
+    def next(self) -> Optional[str]:
+        with self._wake:
+            if not self._pending and not self._closed:
+                self._wake.wait(self.poll_interval)
+            self._pending = max(0, self._pending - 1)
+        return None
+
+    def close(self):
+        with self._wake:
+            self._closed = True
+            self._wake.notify_all()
+
+
+class MemoryBroker:
+    # In-process queue of job ids, ordered by when they are due; for tests
+    # and single-process deployments. Jobs still live in the table, and a
+    # worker with nothing queued falls back to claiming any due job.
+    def __init__(self, idle_interval: float = JOB_POLL_INTERVAL):
+        self.idle_interval = idle_interval
+        self._heap = []  # (due, seq, job_id)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def publish(self, job_id: str, delay: float = 0.0):
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, job_id))
+            self._cond.notify()
+
+    def next(self) -> Optional[str]:
+        deadline = time.monotonic() + self.idle_interval
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)[2]
+                if now >= deadline:
+                    return None
+                wake = min(deadline, self._heap[0][0]) if self._heap else deadline
+                self._cond.wait(wake - now)
+        return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# -------------------------
+# Workers
+# -------------------------
+class JobQueue:
+    def __init__(self, broker, workers: int = JOB_WORKERS):
+        self.broker = broker
+        self.workers = workers
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._last_prune = None
+        self.outcomes = {}  # status -> count, this process only
+
+    def enqueue(self, db: Session, kind: str, owner_id: Optional[int], payload: Optional[dict] = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> model.Job:
+        job = crud.create_job(db, kind, owner_id, payload or {}, max_attempts=max_attempts)
+        self.start()
+        self.broker.publish(job.id)
+        return job
+
+    def start(self):
+        with self._lock:
+            if self._threads or self._stopping or not self.workers:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while not self._stopping:
+            job_id = self.broker.next()
+            if self._stopping:
+                return
+            try:
+                self.run_once(job_id)
+            except Exception:
+                logger.exception("job worker failed; carrying on")
+
+    def run_once(self, job_id: Optional[str] = None) -> Optional[model.Job]:
+        """Claim and run one due job (`job_id` if given); returns it, or None."""
+        db = SessionLocal()
+        try:
+            self._maybe_prune(db)
+            job = crud.claim_job(db, JOB_LEASE_SECONDS, job_id)
+            if job is None and job_id is not None:
+                job = crud.claim_job(db, JOB_LEASE_SECONDS)  # the hinted job was taken; look for another
+            if job is not None:
+                self._execute(db, job)
+            return job
+        finally:
+            db.close()
+
+    def _execute(self, db: Session, job: model.Job):
+        fn = HANDLERS.get(job.kind)
+        try:
+            if fn is None:
+                raise LookupError(f"no handler for job kind {job.kind!r}")
+            if job.cancel_requested:
+                raise JobCancelled()
+            result = fn(db, job)
+        except JobCancelled:
+            db.rollback()
+            crud.finish_job(db, job, "cancelled")
+        except Exception as exc:
+            db.rollback()
+            error = f"{type(exc).__name__}: {exc}"
+            if job.attempts < job.max_attempts and not job.cancel_requested:
+                delay = JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+                logger.warning("job %s (%s) failed on attempt %d, retrying in %.0fs: %s",
+                               job.id, job.kind, job.attempts, delay, error)
+                crud.finish_job(db, job, "queued", error=error, retry_in=delay)
+                self.broker.publish(job.id, delay)
+                self._count("retried")
+                return
+            logger.exception("job %s (%s) failed after %d attempts", job.id, job.kind, job.attempts)
+            crud.finish_job(db, job, "failed", error=error)
+        else:
+            crud.finish_job(db, job, "succeeded", result=result)
+        self._count(job.status)
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def _maybe_prune(self, db: Session):
+        # once an hour per process is plenty
+        if self._last_prune is not None and time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        now = datetime.now(timezone.utc)
+        crud.prune_jobs(db, now - timedelta(days=JOB_RETENTION_DAYS))
+        crud.prune_note_revisions(db, now - timedelta(days=revisions.REVISION_RETENTION_DAYS))
+
+    def close(self):
+        with self._lock:
+            self._stopping = True
+            threads, self._threads = self._threads, []
+        self.broker.close()
+        deadline = time.monotonic() + JOB_SHUTDOWN_TIMEOUT
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            return {"workers": len(self._threads), "outcomes": dict(self.outcomes)}
+
+
+def _make_broker():
+    if JOB_BROKER == "memory":
+        return MemoryBroker()
+    return DatabaseBroker()
+
+job_queue = JobQueue(_make_broker())
@@ -0,0 +1,211 @@
+import math
+import os
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import crud, model
+from app.spatial import GridIndex, note_rect
+
+LAYOUT_FORCE_ITERATIONS = int(os.environ.get("LAYOUT_FORCE_ITERATIONS", 50))
+
+ALGORITHMS = ("grid", "shelf", "force")
+
+
+# -------------------------
+# Algorithms
+# -------------------------
+# Each takes the board as arrays (x, y, w, h) plus a gap and returns new
+# (x, y) arrays, relative to the origin at 0,0.
+
+def grid_layout(x, y, w, h, gap: float):
+    # Equal cells sized to the largest note, filled in reading order of
+    # the current positions, in a roughly square block.
+    n = len(x)
+    cell_w = w.max() + gap
+    cell_h = h.max() + gap
+    cols = max(1, math.ceil(math.sqrt(n * cell_h / cell_w)))
+    order = np.lexsort((x, y))
+    slot = np.empty(n, dtype=np.int64)
+    slot[order] = np.arange(n)
+    return (slot % cols) * cell_w, (slot // cols) * cell_h
+
+def shelf_layout(x, y, w, h, gap: float):
+    # Tallest notes first, left to right on shelves of a fixed width; a
+    # shelf is as tall as its first (tallest) note.
+    order = np.lexsort((-w, -h))
+    widths = w[order] + gap
+    ends = np.cumsum(widths)
+    shelf_width = max(widths.max(), math.sqrt(float(np.sum(widths * (h[order] + gap)))))
+
+    shelf = np.empty(len(x), dtype=np.int64)
+    starts = []
+    start, base = 0, 0.0
+    while start < len(x):
+        # every note that still ends within this shelf; at least one
+        stop = max(start + 1, int(np.searchsorted(ends, base + shelf_width, side="right")))
+        shelf[start:stop] = len(starts)
+        starts.append(start)
+        base = ends[stop - 1]
+        start = stop
+
+    starts = np.asarray(starts)
+    shelf_heights = h[order][starts] + gap
+    shelf_tops = np.concatenate(([0.0], np.cumsum(shelf_heights)[:-1]))
+    shelf_bases = np.concatenate(([0.0], ends[starts[1:] - 1]))
+    new_x = np.empty_like(x)
+    new_y = np.empty_like(y)
+    new_x[order] = ends - widths - shelf_bases[shelf]
+    new_y[order] = shelf_tops[shelf]
+    return new_x, new_y
+
+def _candidate_pairs(x, y, cell_w: float, cell_h: float):
+    # Index pairs (i, j) of notes whose top-left corners share a grid cell
+    # or sit in neighbouring ones. With cells as large as the largest note,
+    # that includes every pair that can overlap.
+    n = len(x)
+    cx = np.floor(x / cell_w).astype(np.int64)
+    cy = np.floor(y / cell_h).astype(np.int64)
+    cx -= cx.min()
+    cy -= cy.min()
+    stride = int(cy.max()) + 3  # room for cy - 1 and cy + 1 without wrapping
+    key = cx * stride + cy + 1
+    order = np.argsort(key, kind="stable")
+    skey = key[order]
+    positions = np.arange(n)
+    found_i, found_j = [], []
+    # each unordered pair of neighbouring cells once, plus the cell itself
+    for step_x, step_y in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        target = skey + step_x * stride + step_y
+        hi = np.searchsorted(skey, target, side="right")
+        lo = positions + 1 if (step_x, step_y) == (0, 0) else np.searchsorted(skey, target, side="left")
+        count = np.maximum(hi - lo, 0)
+        total = int(count.sum())
+        if not total:
+            continue
+        first = np.cumsum(count) - count
+        i = np.repeat(positions, count)
+        j = np.repeat(lo, count) + (np.arange(total) - np.repeat(first, count))
+        found_i.append(order[i])
+        found_j.append(order[j])
+    if not found_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(found_i), np.concatenate(found_j)
+
+def force_layout(x, y, w, h, gap: float, iterations: int = LAYOUT_FORCE_ITERATIONS):
+    # Overlap removal that keeps the board's shape. The board is first
+    # spread out until the notes could fit, and crowded spots are fanned
+    # out. Then overlapping pairs are pushed apart along the line between
+    # their centres, each note taking half. Whatever still overlaps after
+    # `iterations` passes is settled one note at a time.
+    n = len(x)
+    w = w + gap
+    h = h + gap
+    cx = x + w / 2
+    cy = y + h / 2
+    cell_w, cell_h = float(w.mean()), float(h.mean())
+    # scale about the centre so the notes cover at most half the area
+    needed = float(np.sum(w * h)) * 2
+    available = max(float(np.ptp(cx)), cell_w) * max(float(np.ptp(cy)), cell_h)
+    scale = max(1.0, math.sqrt(needed / available))
+    cx = (cx - cx.mean()) * scale
+    cy = (cy - cy.mean()) * scale
+    # notes sharing a spot fan out on a spiral around it, so stacked
+    # notes spread in every direction instead of along one line
+    key = np.floor(cx / cell_w).astype(np.int64) * 1_000_003 + np.floor(cy / cell_h).astype(np.int64)
+    order = np.argsort(key, kind="stable")
+    rank = np.empty(n)
+    rank[order] = np.arange(n) - np.searchsorted(key[order], key[order], side="left")
+    turn = rank * 2.399963  # golden angle, radians
+    cx += np.cos(turn) * np.sqrt(rank) * cell_w * 0.8
+    cy += np.sin(turn) * np.sqrt(rank) * cell_h * 0.8
+
+    for _ in range(iterations):
+        i, j = _candidate_pairs(cx - w / 2, cy - h / 2, float(w.max()), float(h.max()))
+        dist_x = cx[j] - cx[i]
+        dist_y = cy[j] - cy[i]
+        over_x = (w[i] + w[j]) / 2 - np.abs(dist_x)
+        over_y = (h[i] + h[j]) / 2 - np.abs(dist_y)
+        hit = (over_x > 0) & (over_y > 0)
+        if not np.any(hit):
+            break
+        i, j, dist_x, dist_y = i[hit], j[hit], dist_x[hit], dist_y[hit]
+        distance = np.hypot(dist_x, dist_y) + 1e-9
+        # enough to clear the shallower axis, plus a unit so pairs don't stay touching
+        amount = (np.minimum(over_x[hit], over_y[hit]) / 2 + 1.0) / distance
+        dx = np.zeros(n)
+        dy = np.zeros(n)
+        np.add.at(dx, i, -dist_x * amount)
+        np.add.at(dx, j, dist_x * amount)
+        np.add.at(dy, i, -dist_y * amount)
+        np.add.at(dy, j, dist_y * amount)
+        cx += dx
+        cy += dy
+    else:
+        _settle(cx, cy, w, h)
+    new_x = cx - w / 2
+    new_y = cy - h / 2
+    return new_x - new_x.min(), new_y - new_y.min()
+
+def _settle(cx, cy, w, h):
+    # Last resort when the pushes haven't converged, which happens in dense
+    # piles: keep the notes that no longer overlap and move each remaining
+    # one, nearest the centre first, to the closest free spot on a spiral
+    # around where it ended up. Updates cx/cy in place.
+    i, j = _candidate_pairs(cx - w / 2, cy - h / 2, float(w.max()), float(h.max()))
+    overlapping = (np.abs(cx[j] - cx[i]) < (w[i] + w[j]) / 2) & (np.abs(cy[j] - cy[i]) < (h[i] + h[j]) / 2)
+    stuck = np.zeros(len(cx), dtype=bool)
+    stuck[i[overlapping]] = True
+    stuck[j[overlapping]] = True
+    index = GridIndex(cell_size=float(max(w.max(), h.max())))
+    for k in np.flatnonzero(~stuck).tolist():
+        index.insert(k, (cx[k] - w[k] / 2, cy[k] - h[k] / 2, w[k], h[k]))
+    centre_x, centre_y = cx.mean(), cy.mean()
+    pending = np.flatnonzero(stuck)
+    pending = pending[np.argsort(np.hypot(cx[pending] - centre_x, cy[pending] - centre_y))]
+    for k in pending.tolist():
+        step = max(w[k], h[k])
+        for attempt in range(100000):
+            radius = step * math.sqrt(attempt)
+            angle = attempt * 2.399963
+            rect = (cx[k] + radius * math.cos(angle) - w[k] / 2, cy[k] + radius * math.sin(angle) - h[k] / 2, w[k], h[k])
+            if not index.query_rect(rect):
+                break
+        cx[k] = rect[0] + w[k] / 2
+        cy[k] = rect[1] + h[k] / 2
+        index.insert(k, rect)
+
+LAYOUTS = {"grid": grid_layout, "shelf": shelf_layout, "force": force_layout}
+
+
+# -------------------------
+# Board layout
+# -------------------------
+def layout_board(db: Session, user_id: int, algorithm: str = "grid", gap: float = 20.0,
+                 origin=None, dry_run: bool = False):
+    """Lay out every note on the board without overlaps.
+
+    Returns [{"id", "x", "y"}, ...] for the whole board and, unless
+    dry_run, saves them through crud.save_note_positions.
+    """
+    rows = db.execute(
+        select(model.Note.id, model.Note.x, model.Note.y, model.Note.width, model.Note.height)
+        .where(model.Note.owner_id == user_id)
+        .order_by(model.Note.id)
+    ).all()
+    if not rows:
+        return []
+    ids = [row.id for row in rows]
+    x, y, w, h = np.array([note_rect(row) for row in rows], dtype=np.float64).T
+    if origin is None:
+        origin = (float(x.min()), float(y.min()))
+
+    new_x, new_y = LAYOUTS[algorithm](x, y, w, h, gap)
+    new_x = new_x + origin[0]
+    new_y = new_y + origin[1]
+    positions = [{"id": note_id, "x": px, "y": py}
+                 for note_id, px, py in zip(ids, new_x.tolist(), new_y.tolist())]
+    if not dry_run:
+        crud.save_note_positions(db, user_id, positions)
+    return positions
@@ -1,13 +1,45 @@
-from fastapi import FastAPI, Depends, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import List
-from app import model, schemas, crud
-from app.database import SessionLocal
+from typing import List, Optional
+import hashlib
+import hmac
+import math
+import os
+import uuid
+from app import model, schemas, crud, encoding, layout, passwords, realtime, spatial
+from app.instrumentation import InstrumentationMiddleware, METRICS_TOKEN, metrics, timed
+from app.ratelimit import LimitedRoute
+from app.database import DB_ASYNC_ENABLED, SessionLocal, async_engine, engine, get_db, replica_engine
 from fastapi.security import OAuth2PasswordRequestForm
-from app.auth import authenticate_user, create_access_token, get_current_user
+from app.auth import (Principal, authenticate_user_async, create_job_token, create_user_token, get_current_user,
+                      job_id_from_token, optional_oauth2_scheme, principal_from_token)
+from app.user_cache import user_cache
+from app.board_cache import board_cache, serialize_board
+from app.jobs import job_queue
+from app.write_buffer import FlushFailed, WRITE_BUFFER_MODE, is_geometry_only, write_buffer
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue.start()
+    yield
+    job_queue.close()
+    write_buffer.close()
+    realtime.broker.close()
+    passwords.shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = LimitedRoute
 
 # -------------------------
 # CORS
@@ -18,78 +50,626 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing"],
 )
 
 # -------------------------
-# Dependency: DB Session
+# Instrumentation
+# -------------------------
+# Outermost, so the timings cover CORS and error handling too.
+app.add_middleware(InstrumentationMiddleware)
+
+@app.exception_handler(FlushFailed)
+def write_buffer_failed(request: Request, exc: FlushFailed):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Could not save note positions, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(passwords.PasswordPoolSaturated)
+def password_pool_saturated(request: Request, exc: passwords.PasswordPoolSaturated):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many login attempts in progress, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+def _json_safe(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_json_safe(item) for item in value]
+    return value
+
+@app.exception_handler(RequestValidationError)
+def request_validation_failed(request: Request, exc: RequestValidationError):
+    # FastAPI's default body, but a rejected NaN or infinity can't be echoed
+    # back as JSON, so inputs like that come back as strings
+    return JSONResponse(status_code=422, content={"detail": _json_safe(jsonable_encoder(exc.errors()))})
+
+if DB_ASYNC_ENABLED:
+    from app.async_routes import router as async_router
+    app.include_router(async_router)
+
+# -------------------------
+# Conditional GET
+# -------------------------
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    return etag in (candidate.strip().removeprefix("W/") for candidate in header.split(","))
+
+def not_modified(etag: str, vary: Optional[str] = None) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if vary:
+        headers["Vary"] = vary
+    return Response(status_code=304, headers=headers)
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+def board_etag(user_id: int, version: int) -> str:
+    return f'"board-{user_id}-{version}"'
+
+def coded_etag(etag: str, content_encoding: str) -> str:
+    # a strong validator names one exact body, so each content-coding gets its own
+    return etag if content_encoding == "identity" else etag[:-1] + f'-{content_encoding}"'
+
 # -------------------------
-def get_db():
-    db = SessionLocal()
+# Dependency: board access
+# -------------------------
+def get_board_user(current_user: Principal = Depends(get_current_user)) -> Principal:
+    # Reads and writes of a board first flush the moves buffered for it,
+    # so they see them and can't be overtaken by them.
+    write_buffer.flush(current_user.id)
+    return current_user
+
+# -------------------------
+# Metrics
+# -------------------------
+def _app_metrics():
+    for cache, stats in (("user", user_cache.stats()), ("board", board_cache.stats())):
+        # the user cache calls its entry count "size" (as /auth/cache shows it)
+        entries = stats.get("entries", stats.get("size"))
+        if entries is not None:
+            yield f"noteify_{cache}_cache_entries", "gauge", f"{cache} cache entries", {}, entries
+        if "bytes" in stats:
+            yield f"noteify_{cache}_cache_bytes", "gauge", f"{cache} cache bytes", {}, stats["bytes"]
+        for key in ("hits", "misses", "evictions"):
+            if key in stats:
+                yield f"noteify_{cache}_cache_{key}_total", "counter", f"{cache} cache {key}", {}, stats[key]
+    yield "noteify_password_queue_depth", "gauge", "Password hashes queued or running", {}, passwords.queue_depth()
+    stats = write_buffer.stats()
+    yield "noteify_write_buffer_pending", "gauge", "Note moves waiting to be flushed", {}, stats["pending"]
+    yield "noteify_write_buffer_writes_total", "counter", "Note moves buffered", {}, stats["writes"]
+    yield "noteify_write_buffer_rows_total", "counter", "Rows written by buffer flushes", {}, stats["rows_flushed"]
+    yield "noteify_write_buffer_flushes_total", "counter", "Buffer flushes that wrote rows", {}, stats["flushes"]
+    stats = job_queue.stats()
+    for outcome, count in sorted(stats["outcomes"].items()):
+        yield "noteify_jobs_total", "counter", "Job runs by outcome", {"outcome": outcome}, count
+    stats = spatial.spatial_indexes.stats()
+    yield "noteify_spatial_boards", "gauge", "Boards with an in-memory spatial index", {}, stats["boards"]
+    yield "noteify_spatial_rebuilds_total", "counter", "Spatial index rebuilds", {}, stats["rebuilds"]
+
+metrics.add_collector(_app_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics(request: Request):
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied, METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# -------------------------
+# Health
+# -------------------------
+def ping(db_engine) -> bool:
     try:
-        yield db
-    finally:
-        db.close()
+        with db_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except SQLAlchemyError:
+        return False
+
+@app.get("/health", include_in_schema=False)
+def health():
+    checks = {"database": "ok" if ping(engine) else "unavailable"}
+    if replica_engine is not None:
+        # replica reads have no fallback, so a down replica fails the check
+        checks["replica"] = "ok" if ping(replica_engine) else "unavailable"
+    healthy = all(value == "ok" for value in checks.values())
+    return JSONResponse(status_code=200 if healthy else 503, content=checks)
 
 # -------------------------
 # User Routes
 # -------------------------
 @app.post("/users/", response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await passwords.hash_password_async(user.password)
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
 
 @app.get("/users/me/", response_model=schemas.UserOut)
-def read_users_me(current_user: model.User = Depends(get_current_user)):
+def read_users_me(request: Request, response: Response, current_user: Principal = Depends(get_current_user)):
+    digest = hashlib.sha1(f"{current_user.id}:{current_user.username}:{current_user.email}".encode()).hexdigest()
+    etag = f'"user-{current_user.id}-{digest[:16]}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return current_user
 
+@app.delete("/users/me", status_code=202, response_model=schemas.JobAccepted)
+def delete_users_me(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    # Deleting a board can take a while; the job does it in batches. The
+    # bearer token stops working once the user row goes, so the response
+    # carries a job token to poll with until the end.
+    return job_accepted(job_queue.enqueue(db, "delete_account", current_user.id), with_token=True)
+
 # -------------------------
 # Auth Routes
 # -------------------------
 @app.post("/auth/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, username=form_data.username, password=form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await authenticate_user_async(db, username=form_data.username, password=form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.post("/auth/logout-all")
+def logout_everywhere(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    crud.revoke_user_tokens(db, current_user.id)
+    return {"detail": "All sessions revoked"}
+
+@app.get("/auth/cache")
+def read_user_cache_stats(current_user: Principal = Depends(get_current_user)):
+    return user_cache.stats()
+
+# -------------------------
+# Job Routes
+# -------------------------
+def job_accepted(job: model.Job, with_token: bool = False) -> JSONResponse:
+    body = schemas.JobOut.model_validate(job).model_dump(mode="json")
+    location = f"/jobs/{job.id}"
+    if with_token:
+        body["token"] = create_job_token(job.id)
+        location += f"?token={body['token']}"
+    return JSONResponse(status_code=202, content=body, headers={"Location": location})
+
+def get_owned_job(job_id: str, db: Session, current_user: Principal) -> model.Job:
+    job = crud.get_job(db, job_id)
+    if job is None or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobOut)
+def read_job(
+    job_id: str,
+    token: Optional[str] = Query(None, description="job token from the 202, instead of signing in"),
+    bearer: Optional[str] = Depends(optional_oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    if token is not None:
+        job = crud.get_job(db, job_id)
+        if job is None or job_id_from_token(token) != job_id:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+    if bearer is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return get_owned_job(job_id, db, get_current_user(token=bearer, db=db))
+
+@app.post("/jobs/{job_id}/cancel", response_model=schemas.JobOut)
+def cancel_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    job = get_owned_job(job_id, db, current_user)
+    if job.status not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return crud.request_job_cancel(db, job)
+
 # -------------------------
 # Corkboard Routes (new system)
 # -------------------------
-@app.get("/corkboard", response_model=List[schemas.NoteOut])
+def parse_tag_filter(tags: Optional[str]) -> List[str]:
+    # "a, b,,c" -> ["a", "b", "c"]
+    if not tags:
+        return []
+    return sorted({name.strip() for name in tags.split(",") if name.strip()})
+
+@app.get("/corkboard", response_model=List[schemas.NoteListOut])
 def read_corkboard_notes(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(full|compact)$"),
+    tags: Optional[str] = Query(None, max_length=1000, description="comma-separated tag names"),
+    match: str = Query("all", pattern="^(all|any)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    compact = encoding.wants_compact(request, format)
+    tag_names = parse_tag_filter(tags)
+    # read the version before the notes, and from the same database: the
+    # body can only be newer than its ETag
+    version = crud.get_board_version(db, current_user.id, replica=True)
+    etag = board_etag(current_user.id, version)
+    if compact:
+        etag = etag[:-1] + '-compact"'
+    if tag_names:
+        digest = hashlib.sha256("\n".join([match, *tag_names]).encode()).hexdigest()[:16]
+        etag = etag[:-1] + f'-tags-{digest}"'
+    # small bodies go out uncompressed, so a client may hold either coding
+    content_encoding = encoding.negotiate_encoding(request)
+    for candidate in (coded_etag(etag, content_encoding), etag):
+        if etag_matches(request, candidate):
+            return not_modified(candidate, vary="Accept, Accept-Encoding")
+
+    media_type = encoding.COMPACT_MEDIA_TYPE if compact else "application/json"
+    if tag_names:
+        # filtered views aren't cached; the filter runs on note_tag's indexes
+        notes = crud.get_board_notes(db, user_id=current_user.id, tags=tag_names, match=match)
+        with timed("serialize"):
+            raw = encoding.compact_bytes(notes) if compact else serialize_board(notes)
+            response = encoding.encoded_response(request, raw, media_type)
+        set_etag(response, coded_etag(etag, response.headers.get("content-encoding", "identity")))
+        return response
+
+    # Serve the pre-serialized board while its version is current. It is
+    # cached already compressed, so even small boards are compressed once
+    # rather than on every request.
+    variant = f"{'compact' if compact else 'full'}.{content_encoding}"
+    payload = board_cache.get(current_user.id, version, variant)
+    if payload is None:
+        notes = crud.get_board_notes(db, user_id=current_user.id)
+        with timed("serialize"):
+            raw = encoding.compact_bytes(notes) if compact else serialize_board(notes)
+            payload = encoding.compress(raw, content_encoding)
+        board_cache.set(current_user.id, version, payload, variant)
+    response = encoding.bytes_response(payload, media_type, content_encoding)
+    set_etag(response, coded_etag(etag, content_encoding))
+    return response
+
+@app.get("/corkboard/tags", response_model=List[schemas.TagCount])
+def read_corkboard_tags(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    version = crud.get_board_version(db, current_user.id)
+    etag = board_etag(current_user.id, version)[:-1] + '-tags"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    counts = crud.get_tag_counts(db, user_id=current_user.id)
+    response = JSONResponse([{"name": name, "note_count": count} for name, count in counts])
+    set_etag(response, etag)
+    return response
+
+@app.get("/corkboard/page", response_model=schemas.NotePage)
+def read_corkboard_page(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(full|compact)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    try:
+        notes, next_cursor = crud.get_board_page(db, user_id=current_user.id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if encoding.wants_compact(request, format):
+        with timed("serialize"):
+            payload = encoding.compact_bytes(notes, next_cursor=next_cursor)
+            return encoding.encoded_response(request, payload, encoding.COMPACT_MEDIA_TYPE)
+    return {"notes": notes, "next_cursor": next_cursor}
+
+@app.get("/corkboard/changes", response_model=schemas.NoteChanges)
+def read_corkboard_changes(
+    since: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    try:
+        return crud.get_changes(db, user_id=current_user.id, since=since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid change token")
+
+@app.get("/corkboard/search", response_model=schemas.NoteSearchPage)
+def search_corkboard_notes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    rows, next_offset = crud.search_notes(db, user_id=current_user.id, q=q, limit=limit, offset=offset)
+    hits = [{"note": note, "rank": rank, "snippet": snippet} for note, rank, snippet in rows]
+    return {"hits": hits, "next_offset": next_offset}
+
+@app.get("/corkboard/viewport", response_model=List[schemas.NoteListOut])
+def read_corkboard_viewport(
+    request: Request,
+    x: float = Query(..., allow_inf_nan=False),
+    y: float = Query(..., allow_inf_nan=False),
+    width: float = Query(..., gt=0, allow_inf_nan=False),
+    height: float = Query(..., gt=0, allow_inf_nan=False),
+    format: Optional[str] = Query(None, pattern="^(full|compact)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    notes = crud.get_notes_in_viewport(db, user_id=current_user.id, x=x, y=y, width=width, height=height)
+    if encoding.wants_compact(request, format):
+        with timed("serialize"):
+            return encoding.encoded_response(request, encoding.compact_bytes(notes), encoding.COMPACT_MEDIA_TYPE)
+    return notes
+
+# -------------------------
+# Spatial queries
+# -------------------------
+@app.get("/corkboard/hit", response_model=List[schemas.NoteListOut])
+def hit_test_corkboard(
+    x: float = Query(..., allow_inf_nan=False),
+    y: float = Query(..., allow_inf_nan=False),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    note_ids = spatial.hit_test(db, user_id=current_user.id, x=x, y=y)
+    return spatial.load_notes(db, current_user.id, note_ids)
+
+@app.get("/corkboard/select", response_model=List[schemas.NoteListOut])
+def select_corkboard_notes(
+    x: float = Query(..., allow_inf_nan=False),
+    y: float = Query(..., allow_inf_nan=False),
+    width: float = Query(..., ge=0, allow_inf_nan=False),
+    height: float = Query(..., ge=0, allow_inf_nan=False),
+    mode: str = Query("intersects", pattern="^(intersects|contains)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    note_ids = spatial.select_rect(db, user_id=current_user.id, rect=(x, y, width, height), mode=mode)
+    return spatial.load_notes(db, current_user.id, note_ids)
+
+@app.get("/corkboard/collisions", response_model=schemas.NoteCollisions)
+def read_corkboard_collisions(
+    x: float = Query(..., allow_inf_nan=False),
+    y: float = Query(..., allow_inf_nan=False),
+    width: float = Query(..., gt=0, allow_inf_nan=False),
+    height: float = Query(..., gt=0, allow_inf_nan=False),
+    exclude: List[int] = Query([]),
     db: Session = Depends(get_db),
-    current_user: model.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_board_user)
 ):
-    return crud.get_notes_for_user(db, user_id=current_user.id)
+    # ids only: layout code asks this a lot and rarely needs the notes
+    rect = (x, y, width, height)
+    return {"note_ids": spatial.find_collisions(db, user_id=current_user.id, rect=rect, exclude=exclude)}
+
+@app.post("/corkboard/layout", response_model=schemas.LayoutResult, responses={202: {"model": schemas.JobOut}})
+def layout_corkboard(
+    request: schemas.LayoutRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    origin = None
+    if request.origin_x is not None or request.origin_y is not None:
+        origin = (request.origin_x or 0.0, request.origin_y or 0.0)
+    if request.background:
+        if request.dry_run:
+            raise HTTPException(status_code=422, detail="Dry runs return their positions and can't run in the background")
+        payload = {"algorithm": request.algorithm, "gap": request.gap, "origin": origin}
+        return job_accepted(job_queue.enqueue(db, "layout", current_user.id, payload))
+    positions = layout.layout_board(db, user_id=current_user.id, algorithm=request.algorithm,
+                                    gap=request.gap, origin=origin, dry_run=request.dry_run)
+    return {"algorithm": request.algorithm, "dry_run": request.dry_run, "positions": positions}
 
 @app.post("/corkboard", response_model=schemas.NoteOut)
 def create_corkboard_note(
     note: schemas.NoteCreate,
     db: Session = Depends(get_db),
-    current_user: model.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     return crud.create_note(db=db, note=note, user_id=current_user.id)
 
-@app.put("/corkboard/{note_id}", response_model=schemas.NoteOut)
+@app.post("/corkboard/batch", response_model=List[schemas.NoteBatchResult])
+def batch_corkboard_notes(
+    batch: schemas.NoteBatch,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    return crud.apply_note_batch(db, user_id=current_user.id, operations=batch.operations)
+
+# -------------------------
+# Bulk import/export
+# -------------------------
+IMPORT_CHUNK = int(os.environ.get("IMPORT_CHUNK", 500))  # notes per insert/commit
+IMPORT_MAX_LINE_BYTES = int(os.environ.get("IMPORT_MAX_LINE_BYTES", 64 * 1024))
+IMPORT_MAX_ERRORS = 100  # reported per upload; the rest are only counted
+
+def import_status(checkpoint: model.NoteImport, errors=()):
+    return {
+        "import_id": checkpoint.id,
+        "status": checkpoint.status,
+        "lines_processed": checkpoint.lines_processed,
+        "notes_imported": checkpoint.notes_imported,
+        "failed_lines": checkpoint.failed_lines,
+        "errors": list(errors),
+    }
+
+@app.get("/corkboard/export")
+def export_corkboard_notes(current_user: Principal = Depends(get_board_user)):
+    # The request's session is closed before the body streams, so the
+    # export reads through its own.
+    def lines():
+        db = SessionLocal()
+        try:
+            for note in crud.export_board(db, user_id=current_user.id):
+                yield encoding.ndjson_line(note)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        lines(),
+        media_type=encoding.NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": 'attachment; filename="corkboard.ndjson"'},
+    )
+
+@app.post("/corkboard/import", response_model=schemas.NoteImportStatus)
+async def import_corkboard_notes(
+    request: Request,
+    import_id: Optional[str] = Query(None, pattern="^[A-Za-z0-9_-]{1,64}$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Import an NDJSON upload, one note per line, in committed chunks.
+
+    Pass your own import_id to poll GET /corkboard/import/{import_id} for
+    progress, and to resume: re-uploading the same file with the same id
+    skips the lines already committed.
+    """
+    checkpoint = await run_in_threadpool(crud.start_note_import, db, current_user.id, import_id or uuid.uuid4().hex)
+    if checkpoint.status == "completed":
+        return import_status(checkpoint)
+
+    skip = checkpoint.lines_processed
+    chunk, errors, failed, line_no = [], [], 0, 0
+    try:
+        async for line in encoding.ndjson_lines(request.stream(), IMPORT_MAX_LINE_BYTES):
+            line_no += 1
+            if line_no <= skip or not line.strip():
+                continue
+            try:
+                chunk.append(schemas.NoteImportLine.model_validate_json(line))
+            except ValidationError as exc:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"line": line_no, "detail": str(exc.errors(include_url=False)[0]["msg"])})
+            if len(chunk) >= IMPORT_CHUNK:
+                await run_in_threadpool(crud.import_note_chunk, db, checkpoint, chunk, line_no, failed)
+                chunk, failed = [], 0
+    except ValueError as exc:
+        await run_in_threadpool(crud.finish_note_import, db, checkpoint, "failed")
+        raise HTTPException(status_code=413, detail=str(exc))
+    await run_in_threadpool(crud.import_note_chunk, db, checkpoint, chunk, max(line_no, skip), failed)
+    await run_in_threadpool(crud.finish_note_import, db, checkpoint)
+    return import_status(checkpoint, errors)
+
+@app.get("/corkboard/import/{import_id}", response_model=schemas.NoteImportStatus)
+def read_corkboard_import(
+    import_id: str,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    checkpoint = crud.get_note_import(db, user_id=current_user.id, import_id=import_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return import_status(checkpoint)
+
+@app.websocket("/corkboard/ws")
+async def corkboard_socket(
+    websocket: WebSocket,
+    token: str,
+    since: Optional[int] = None,
+    epoch: Optional[str] = None,
+):
+    # browsers can't set headers on a websocket, so the token comes as ?token=
+    try:
+        principal = await run_in_threadpool(principal_from_token, token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await realtime.serve(websocket, principal.id, since=since, epoch=epoch)
+
+@app.get("/corkboard/{note_id}/content", response_model=schemas.NoteContent)
+def read_corkboard_note_content(
+    request: Request,
+    note_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    # the full text behind a preview listing's truncated content
+    row = crud.get_note_content(db, user_id=current_user.id, note_id=note_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Note not found or access denied")
+    with timed("serialize"):
+        return encoding.encoded_response(request, encoding.dumps({"id": row.id, "content": row.content}))
+
+@app.get("/corkboard/{note_id}/revisions", response_model=schemas.NoteRevisionPage)
+def read_corkboard_note_revisions(
+    note_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    db_note = crud.get_note(db, note_id)
+    if not db_note or db_note.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Note not found or access denied")
+    page, next_before = crud.get_note_revisions(db, note_id, limit=limit, before=before)
+    return {"revisions": page, "next_before": next_before}
+
+@app.post("/corkboard/{note_id}/revisions/{revision}/restore", response_model=schemas.NoteOut)
+def restore_corkboard_note_revision(
+    note_id: int,
+    revision: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_board_user)
+):
+    db_note = crud.get_note(db, note_id)
+    if not db_note or db_note.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Note not found or access denied")
+    state = crud.get_note_revision(db, note_id, revision)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return crud.restore_note(db, note_id, state)
+
+@app.put("/corkboard/{note_id}", response_model=schemas.NoteOut,
+         responses={202: {"model": schemas.NoteOut, "description": "Move buffered, not yet saved"}})
 def update_corkboard_note(
     note_id: int,
     note: schemas.NoteUpdate,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: model.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     db_note = crud.get_note(db, note_id)
     if not db_note or db_note.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Note not found or access denied")
+    if WRITE_BUFFER_MODE != "off" and is_geometry_only(note):
+        # drags: buffer the move and acknowledge with the note as it will be
+        generation = write_buffer.put(current_user.id, note_id, note.model_dump(exclude_none=True))
+        geometry = write_buffer.pending(current_user.id, note_id) or note.model_dump(exclude_none=True)
+        note_out = schemas.NoteOut.model_validate(db_note).model_copy(update=geometry)
+        if WRITE_BUFFER_MODE == "strict":
+            db.close()  # hand the connection back; the flusher may need it
+            write_buffer.wait(generation)
+        else:
+            response.status_code = 202
+        return note_out
+    write_buffer.flush(current_user.id)
     return crud.update_note(db, note_id=note_id, note_data=note)
 
 @app.delete("/corkboard/{note_id}")
 def delete_corkboard_note(
     note_id: int,
     db: Session = Depends(get_db),
-    current_user: model.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_board_user)
 ):
     db_note = crud.get_note(db, note_id)
     if not db_note or db_note.owner_id != current_user.id:
@@ -98,8 +678,10 @@ def delete_corkboard_note(
     return {"detail": "Note deleted successfully"}
 
 if __name__ == "__main__":
-    import os
     import uvicorn
 
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # behind a proxy, set FORWARDED_ALLOW_IPS to its address so client IPs
+    # (and the per-IP rate limits) come from X-Forwarded-For
+    uvicorn.run(app, host="0.0.0.0", port=port, proxy_headers=True,
+                forwarded_allow_ips=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"))
\ No newline at end of file
@@ -1,13 +1,19 @@
-from sqlalchemy import Column, Float, Integer, String, DateTime, func, Boolean, ForeignKey, Table 
+from sqlalchemy import Column, Float, Integer, String, DateTime, func, Boolean, ForeignKey, Table, Index, JSON, LargeBinary
+from datetime import datetime, timezone
 from sqlalchemy.orm import relationship
 from app.database import Base
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 # Association table for many-to-many relationship (Note <-> Tag)
 note_tag = Table(
     "note_tag",
     Base.metadata,
     Column("note_id", Integer, ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True),
     Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
+    # reverse lookup for tag filters: the notes carrying a tag
+    Index("ix_note_tag_tag_id_note_id", "tag_id", "note_id"),
 )
 
 class User(Base):
@@ -17,17 +23,33 @@ class User(Base):
     username = Column(String, unique=True, nullable=False, index=True)
     email = Column(String, unique=True, nullable=False, index=True)
     password = Column(String, nullable=False)  # hash later, not plaintext!
+    # bumped to revoke every token issued so far
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # bumped by every write to the user's notes; backs the corkboard ETag
+    board_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     notes = relationship("Note", back_populates="owner")
 
 
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        # keyset pagination over (updated_at, id) within a board
+        Index("ix_notes_owner_updated_id", "owner_id", "updated_at", "id"),
+        # viewport queries range-scan on x within a board
+        Index("ix_notes_owner_x_y", "owner_id", "x", "y"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String, nullable=True)  # now optional
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # what preview listings show instead of the content; see crud.content_fields
+    content_preview = Column(String, nullable=True)
+    content_length = Column(Integer, nullable=True)
+    # Set in Python, like the bulk writers' explicit updated_at, so every row
+    # has the same precision: SQLite compares these as text, and keyset
+    # pagination over (updated_at, id) breaks on mixed formats.
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), onupdate=utcnow)
 
     # relationships
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -35,12 +57,39 @@ class Note(Base):
 
     tags = relationship("Tag", secondary=note_tag, back_populates="notes")
 
+    # On Postgres the table also has a generated `content_tsv` tsvector
+    # column (see the search migration). It is left unmapped so the model
+    # still works on SQLite; crud.search_notes refers to it directly.
+
     x = Column(Float, default=0.0)
     y = Column(Float, default=0.0)
     width = Column(Float, default=150)
     height = Column(Float, default=150)
 
 
+class NoteRevision(Base):
+    # Edit history of a note's content and geometry, written with each
+    # update (see crud.record_note_revisions). Rows are deltas against the
+    # revision before, with a full snapshot every REVISION_SNAPSHOT_EVERY;
+    # app.revisions has the encoding.
+    __tablename__ = "note_revisions"
+    __table_args__ = (
+        Index("ix_note_revisions_note_revision", "note_id", "revision", unique=True),
+        # retention pruning looks for old rows
+        Index("ix_note_revisions_created_at", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), nullable=False)
+    revision = Column(Integer, nullable=False)  # 1, 2, ... per note
+    snapshot = Column(Boolean, nullable=False, default=False, server_default="false")
+    # snapshot: the whole content; delta: the edit from the revision before,
+    # NULL when the content didn't change
+    content = Column(String, nullable=True)
+    geometry = Column(LargeBinary, nullable=True)  # packed x/y/width/height that were set
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
 class Tag(Base):
     __tablename__ = "tags"
 
@@ -48,3 +97,69 @@ class Tag(Base):
     name = Column(String, unique=True, nullable=False)
 
     notes = relationship("Note", secondary=note_tag, back_populates="tags")
+
+
+class UserTagCount(Base):
+    # Notes per tag on each board, adjusted by every write that links or
+    # unlinks tags so GET /corkboard/tags never has to count note_tag.
+    __tablename__ = "user_tag_counts"
+
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True)
+    note_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class NoteTombstone(Base):
+    # Left behind by deletes so delta sync can tell clients what disappeared.
+    __tablename__ = "note_tombstones"
+    __table_args__ = (
+        Index("ix_note_tombstones_owner_deleted", "owner_id", "deleted_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, nullable=False)  # no FK: the note is gone
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # set in Python like Note.updated_at, which change tokens compare it with
+    deleted_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), nullable=False)
+
+
+class NoteImport(Base):
+    # Checkpoint of a POST /corkboard/import. Each chunk of notes commits
+    # together with its checkpoint, so a resumed upload skips exactly the
+    # lines that made it in.
+    __tablename__ = "note_imports"
+
+    id = Column(String, primary_key=True)  # chosen by the client, or generated
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(String, nullable=False, default="running")  # running, completed, failed
+    lines_processed = Column(Integer, nullable=False, default=0, server_default="0")
+    notes_imported = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_lines = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class Job(Base):
+    # Background work queued by the API and run by app.jobs. The row is the
+    # source of truth for a job's state; brokers only hint which to run.
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # workers look for queued jobs that are due
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(String, primary_key=True)
+    owner_id = Column(Integer, nullable=True, index=True)  # no FK: an account deletion outlives the account
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed, cancelled
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False, default=3, server_default="3")
+    cancel_requested = Column(Boolean, nullable=False, default=False, server_default="false")
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)  # last failure, kept while retrying
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # while running
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
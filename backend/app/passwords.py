@@ -0,0 +1,82 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# This module is imported by the password worker processes, so it must not
+# pull in the database or the rest of the app.
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_EXECUTOR = os.environ.get("PASSWORD_EXECUTOR", "process")  # "process" or "thread"
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", 2))
+# hashes allowed to be running or queued before callers get a 429
+PASSWORD_QUEUE_LIMIT = int(os.environ.get("PASSWORD_QUEUE_LIMIT", 16))
+
+# raising BCRYPT_ROUNDS marks older hashes as needing an update, which
+# verify_and_update picks up on the next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password, hashed_password) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password, hashed_password):
+    # (valid, new_hash) where new_hash is None unless the hash needs upgrading
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+_executor = None
+_lock = threading.Lock()
+_pending = 0
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            if PASSWORD_EXECUTOR == "thread":
+                _executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+            else:
+                # spawn, not fork: forking a threaded server can deadlock the child
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return _executor
+
+async def _submit(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= PASSWORD_QUEUE_LIMIT:
+            raise PasswordPoolSaturated()
+        _pending += 1
+    try:
+        return await asyncio.wrap_future(_get_executor().submit(fn, *args))
+    finally:
+        with _lock:
+            _pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await _submit(hash_password, password)
+
+async def verify_and_update_async(plain_password, hashed_password):
+    return await _submit(verify_and_update, plain_password, hashed_password)
+
+def queue_depth() -> int:
+    return _pending
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,259 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy.pool import QueuePool
+
+from app import database
+from app.auth import decode_token
+from app.instrumentation import InstrumentedRoute, metrics
+
+logger = logging.getLogger(__name__)
+
+# Signed-in callers are limited per user. Anonymous ones (logins, sign-ups)
+# are keyed by request.client.host, which behind a proxy is the proxy's
+# unless uvicorn rewrites it from X-Forwarded-For, i.e. the proxy is listed
+# in FORWARDED_ALLOW_IPS (or --forwarded-allow-ips). Set that, or everyone
+# behind the proxy shares one bucket.
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND_URL = os.environ.get("RATE_LIMIT_BACKEND_URL")  # e.g. redis://localhost:6379/2, shared by workers
+RATE_LIMIT_DEFAULT = os.environ.get("RATE_LIMIT_DEFAULT", "20:40")  # tokens per second : burst
+RATE_LIMIT_ROUTES = os.environ.get("RATE_LIMIT_ROUTES", "")  # "PUT /corkboard/{note_id}=30:60, ..." overrides
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100_000))  # buckets kept by the memory store
+# Admission control: shed requests with 503 once this many are in flight,
+# or once this share of the DB pool (pool_size + max_overflow) is checked out
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 512))  # 0 disables
+ADMISSION_POOL_THRESHOLD = float(os.environ.get("ADMISSION_POOL_THRESHOLD", 0.9))  # 0 disables
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 1))  # seconds
+
+Budget = Tuple[float, float]  # tokens per second, burst
+
+
+def parse_budget(value: str) -> Budget:
+    rate, _, burst = value.partition(":")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+# Routes not listed share one default bucket per caller. None exempts a
+# route from both rate limiting and load shedding.
+ROUTE_BUDGETS: Dict[Tuple[str, str], Optional[Budget]] = {
+    ("POST", "/auth/login"): (10 / 60, 10),       # per IP: password guessing
+    ("POST", "/users/"): (5 / 60, 5),
+    ("DELETE", "/users/me"): (1 / 60, 2),
+    ("PUT", "/corkboard/{note_id}"): (30, 60),    # drags send a PUT per move
+    ("POST", "/corkboard/batch"): (5, 10),
+    ("POST", "/corkboard/import"): (1, 3),
+    ("GET", "/corkboard/export"): (0.2, 2),
+    ("POST", "/corkboard/layout"): (1, 5),
+    ("GET", "/health"): None,
+    ("GET", "/metrics"): None,
+}
+for entry in filter(None, (part.strip() for part in RATE_LIMIT_ROUTES.split(","))):
+    route, _, value = entry.partition("=")
+    method, _, path = route.strip().partition(" ")
+    ROUTE_BUDGETS[(method.upper(), path.strip())] = parse_budget(value) if value.strip() != "off" else None
+DEFAULT_BUDGET = parse_budget(RATE_LIMIT_DEFAULT)
+
+
+# -------------------------
+# Bucket stores
+# -------------------------
+# take() spends one token from a bucket and returns 0, or returns how many
+# seconds until the bucket has a token again.
+
+class MemoryBucketStore:
+    # Buckets for this process, least recently used dropped past max_keys
+    # (a dropped bucket comes back full).
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = burst
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                self._buckets.move_to_end(key)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+TAKE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisBucketStore:
+    # Buckets shared by every worker, updated atomically by a Lua script.
+    # Costs a round trip per request; if the server is unreachable requests
+    # are let through rather than failed.
+    def __init__(self, url: str, prefix: str = "noteify:rate:"):
+        import redis  # optional dependency, only needed for a shared store
+
+        self.prefix = prefix
+        self._take = redis.Redis.from_url(url).register_script(TAKE_SCRIPT)
+        self.errors = 0
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            return float(self._take(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+        except Exception:
+            self.errors += 1
+            if self.errors == 1 or self.errors % 1000 == 0:
+                logger.exception("rate limit store unavailable; allowing requests (%d errors)", self.errors)
+            return 0.0
+
+    def __len__(self):
+        return 0
+
+
+# -------------------------
+# Limiter
+# -------------------------
+class Limiter:
+    def __init__(self, store):
+        self.store = store
+        self.in_flight = 0  # only touched on the event loop
+        self.rejected = {}  # (route, reason) -> count
+        self._token_uids = OrderedDict()  # bearer token -> (user id, expiry), verified once
+        self._lock = threading.Lock()
+
+    def caller(self, request: Request) -> str:
+        # "u<id>" for a valid bearer token, else "ip<address>"
+        header = request.headers.get("authorization", "")
+        if header[:7].lower() == "bearer ":
+            uid = self._user_id(header[7:].strip())
+            if uid is not None:
+                return f"u{uid}"
+        # the proxy's X-Forwarded-For is applied by uvicorn, which only
+        # trusts it from FORWARDED_ALLOW_IPS; the raw header can be forged
+        return "ip" + (request.client.host if request.client else "unknown")
+
+    def _user_id(self, token: str) -> Optional[int]:
+        with self._lock:
+            cached = self._token_uids.get(token)
+            if cached is not None:
+                uid, expires = cached
+                if expires is None or time.time() < expires:
+                    self._token_uids.move_to_end(token)
+                    return uid
+                del self._token_uids[token]
+                return None  # expired since it was verified
+        try:
+            payload = decode_token(token)
+        except HTTPException:
+            return None  # the route will answer 401; limit by address meanwhile
+        uid = payload.get("uid")
+        with self._lock:
+            self._token_uids[token] = (uid, payload.get("exp"))
+            if len(self._token_uids) > 10_000:
+                self._token_uids.popitem(last=False)
+        return uid
+
+    def overloaded(self) -> bool:
+        if ADMISSION_MAX_IN_FLIGHT and self.in_flight >= ADMISSION_MAX_IN_FLIGHT:
+            return True
+        pool = database.engine.pool
+        if ADMISSION_POOL_THRESHOLD and isinstance(pool, QueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            return pool.checkedout() >= capacity * ADMISSION_POOL_THRESHOLD
+        return False
+
+    def check(self, request: Request, route: str, budget: Budget) -> Optional[JSONResponse]:
+        if self.overloaded():
+            return self._reject(route, "overload", 503, "Server busy, try again shortly", ADMISSION_RETRY_AFTER)
+        if not RATE_LIMIT_ENABLED:
+            return None
+        rate, burst = budget
+        bucket = route if budget is not DEFAULT_BUDGET else "*"
+        wait = self.store.take(f"{bucket}|{self.caller(request)}", rate, burst)
+        if wait:
+            return self._reject(route, "rate", 429, "Too many requests", math.ceil(wait))
+        return None
+
+    def _reject(self, route: str, reason: str, status_code: int, detail: str, retry_after: int) -> JSONResponse:
+        with self._lock:
+            key = (route, reason)
+            self.rejected[key] = self.rejected.get(key, 0) + 1
+        return JSONResponse(status_code=status_code, content={"detail": detail},
+                            headers={"Retry-After": str(max(1, retry_after))})
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "buckets": len(self.store), "rejected": dict(self.rejected)}
+
+
+def _make_store():
+    if RATE_LIMIT_BACKEND_URL:
+        return RedisBucketStore(RATE_LIMIT_BACKEND_URL)
+    return MemoryBucketStore()
+
+limiter = Limiter(_make_store())
+
+
+class RateLimitedRoute(APIRoute):
+    # Checks the caller's budget for this route before its dependencies run,
+    # so a rejected request never takes a DB connection. Load shedding
+    # applies even with rate limiting off.
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        method = next(iter(self.methods)) if len(self.methods) == 1 else None
+        route = f"{method or '*'} {self.path_format}"
+        budget = ROUTE_BUDGETS.get((method, self.path_format), DEFAULT_BUDGET)
+        if budget is None or not (RATE_LIMIT_ENABLED or ADMISSION_MAX_IN_FLIGHT or ADMISSION_POOL_THRESHOLD):
+            return handler
+
+        async def limited_handler(request):
+            rejection = limiter.check(request, route, budget)
+            if rejection is not None:
+                return rejection
+            limiter.in_flight += 1
+            try:
+                return await handler(request)
+            finally:
+                limiter.in_flight -= 1
+
+        return limited_handler
+
+
+class LimitedRoute(InstrumentedRoute, RateLimitedRoute):
+    # route_class for the app: timing wraps the limiter, so rejected
+    # requests still show up in the latency and response metrics
+    pass
+
+
+def _limiter_metrics():
+    stats = limiter.stats()
+    yield "noteify_requests_in_flight", "gauge", "Requests admitted and not yet finished", {}, stats["in_flight"]
+    for (route, reason), count in sorted(stats["rejected"].items()):
+        yield ("noteify_rejected_requests_total", "counter", "Requests turned away by rate limiting or load shedding",
+               {"route": route, "reason": reason}, count)
+
+metrics.add_collector(_limiter_metrics)
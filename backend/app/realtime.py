@@ -0,0 +1,357 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app import crud, schemas
+
+logger = logging.getLogger(__name__)
+
+REALTIME_BACKEND_URL = os.environ.get("REALTIME_BACKEND_URL")  # e.g. redis://localhost:6379/0
+REALTIME_HISTORY = int(os.environ.get("REALTIME_HISTORY", 1000))  # events kept per board for resume
+REALTIME_BOARD_TTL = float(os.environ.get("REALTIME_BOARD_TTL", 300))  # seconds a board outlives its last socket
+REALTIME_COALESCE_MS = float(os.environ.get("REALTIME_COALESCE_MS", 30))
+REALTIME_QUEUE_LIMIT = int(os.environ.get("REALTIME_QUEUE_LIMIT", 5000))  # per socket, before it is cut off
+
+GEOMETRY_FIELDS = ("x", "y", "width", "height")
+GEOMETRY_EVENTS = ("move", "resize")
+
+
+# -------------------------
+# Events
+# -------------------------
+def build_event(change: crud.NoteChange) -> dict:
+    # Only the fields a write touched go on the wire; a create carries the
+    # whole note so clients can render it without a fetch.
+    event = {"type": change.kind, "note_id": change.note_id}
+    if change.kind == "create":
+        event["note"] = schemas.NoteOut.model_validate(change.note).model_dump(mode="json")
+    elif change.kind == "update":
+        fields = change.fields
+        if fields <= {"x", "y"}:
+            event["type"] = "move"
+        elif fields <= set(GEOMETRY_FIELDS):
+            event["type"] = "resize"
+        changes = {field: getattr(change.note, field) for field in fields if field != "tags"}
+        if "tags" in fields:
+            changes["tags"] = [{"id": tag.id, "name": tag.name} for tag in change.note.tags]
+        event["changes"] = changes
+    return event
+
+def coalesce(events: List[dict]) -> List[dict]:
+    # Collapse runs of move/resize events per note into the latest one. A
+    # merged event moves to the position of its newest member so the output
+    # stays ordered by seq; any other event for the note ends the run.
+    out = []
+    pending = {}
+    for event in events:
+        note_id = event["note_id"]
+        if event["type"] in GEOMETRY_EVENTS:
+            index = pending.get(note_id)
+            if index is not None:
+                previous = out[index]
+                out[index] = None
+                event = {
+                    **event,
+                    "type": event["type"] if event["type"] == previous["type"] else "resize",
+                    "changes": {**previous["changes"], **event["changes"]},
+                }
+            pending[note_id] = len(out)
+        else:
+            pending.pop(note_id, None)
+        out.append(event)
+    return [event for event in out if event is not None]
+
+
+# -------------------------
+# Backends
+# -------------------------
+class InProcessBackend:
+    # Sequence numbers and fan-out live in this process only. The epoch
+    # changes on restart so stale resume points are detected.
+    local_only = True
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seqs = {}
+        self._lock = threading.Lock()
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, user_id: int, events: List[dict]):
+        with self._lock:
+            seq = self._seqs.get(user_id, 0)
+            for event in events:
+                seq += 1
+                event["seq"] = seq
+            self._seqs[user_id] = seq
+            # deliver under the lock so boards see events in seq order
+            self._deliver(user_id, events)
+
+    def current_seq(self, user_id: int) -> int:
+        with self._lock:
+            return self._seqs.get(user_id, 0)
+
+    def close(self):
+        pass
+
+
+class PubSubBackend:
+    # Cross-worker fan-out over a shared server. `client` needs incr/get/
+    # publish/subscribe/close; RedisClient adapts redis-py and LocalPubSub
+    # stands in for it when running several brokers in one process.
+    local_only = False
+    epoch = "shared"
+
+    def __init__(self, client, prefix: str = "noteify:board:"):
+        self.client = client
+        self.prefix = prefix
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+        self.client.subscribe(self.prefix, self._on_message)
+
+    def _on_message(self, channel: str, data: str):
+        user_id = int(channel[len(self.prefix):])
+        self._deliver(user_id, json.loads(data))
+
+    def publish(self, user_id: int, events: List[dict]):
+        for event in events:
+            event["seq"] = self.client.incr(f"{self.prefix}{user_id}:seq")
+        self.client.publish(f"{self.prefix}{user_id}", json.dumps(events))
+
+    def current_seq(self, user_id: int) -> int:
+        return int(self.client.get(f"{self.prefix}{user_id}:seq") or 0)
+
+    def close(self):
+        self.client.close()
+
+
+class LocalPubSub:
+    # In-memory stand-in for a shared pub/sub server.
+    def __init__(self):
+        self._values = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + 1
+            return self._values[key]
+
+    def get(self, key: str):
+        with self._lock:
+            return self._values.get(key)
+
+    def publish(self, channel: str, data: str):
+        for prefix, handler in list(self._subscribers):
+            if channel.startswith(prefix):
+                handler(channel, data)
+
+    def subscribe(self, prefix: str, handler):
+        self._subscribers.append((prefix, handler))
+
+    def close(self):
+        self._subscribers.clear()
+
+
+class RedisClient:
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for a redis:// backend
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._thread = None
+
+    def incr(self, key: str) -> int:
+        return self._redis.incr(key)
+
+    def get(self, key: str):
+        return self._redis.get(key)
+
+    def publish(self, channel: str, data: str):
+        self._redis.publish(channel, data)
+
+    def subscribe(self, prefix: str, handler):
+        def on_message(message):
+            handler(message["channel"], message["data"])
+
+        self._pubsub.psubscribe(**{prefix + "*": on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=0.01, daemon=True)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+        self._pubsub.close()
+        self._redis.close()
+
+
+# -------------------------
+# Broker
+# -------------------------
+class Subscription:
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.lagging = False
+
+    def push(self, events: List[dict]):
+        # called from writer threads; hand the events over to the socket's loop
+        self.loop.call_soon_threadsafe(self._put, events)
+
+    def _put(self, events: List[dict]):
+        if self.queue.qsize() >= REALTIME_QUEUE_LIMIT:
+            self.lagging = True
+        self.queue.put_nowait(events)
+
+
+class Board:
+    def __init__(self):
+        self.history = deque(maxlen=REALTIME_HISTORY)
+        self.subscribers = set()
+        self.idle_since = None
+
+
+class Broker:
+    def __init__(self, backend):
+        self.backend = backend
+        self._boards = {}
+        self._lock = threading.Lock()
+        backend.start(self._deliver)
+
+    def on_note_changes(self, changes: List[crud.NoteChange]):
+        by_user = {}
+        for change in changes:
+            by_user.setdefault(change.user_id, []).append(change)
+        for user_id, user_changes in by_user.items():
+            if self.backend.local_only and user_id not in self._boards:
+                continue  # nobody is listening and nobody can resume
+            self.backend.publish(user_id, [build_event(change) for change in user_changes])
+
+    def _deliver(self, user_id: int, events: List[dict]):
+        with self._lock:
+            board = self._boards.get(user_id)
+            if board is None:
+                return
+            board.history.extend(events)
+            subscribers = list(board.subscribers)
+        for subscription in subscribers:
+            subscription.push(events)
+
+    def subscribe(self, user_id: int, since: Optional[int] = None, epoch: Optional[str] = None):
+        """Register a socket; returns (subscription, current seq, replay).
+
+        replay is the list of missed events when resuming from `since`, or
+        None when the gap can't be filled and the client must refetch.
+        """
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._prune()
+            board = self._boards.setdefault(user_id, Board())
+            board.subscribers.add(subscription)
+            board.idle_since = None
+        # Read the seq and history only after subscribing: anything delivered
+        # from here on is queued, anything before is in the history snapshot.
+        current = self.backend.current_seq(user_id)
+        if since is None:
+            return subscription, current, []
+        with self._lock:
+            missed = [event for event in board.history if event["seq"] > since]
+        if epoch != self.backend.epoch or since > current:
+            return subscription, current, None
+        if since == current:
+            return subscription, current, []
+        if missed and missed[0]["seq"] == since + 1:
+            return subscription, current, missed
+        return subscription, current, None
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            board = self._boards.get(subscription.user_id)
+            if board is None:
+                return
+            board.subscribers.discard(subscription)
+            if not board.subscribers:
+                board.idle_since = time.monotonic()
+
+    def _prune(self):
+        cutoff = time.monotonic() - REALTIME_BOARD_TTL
+        for user_id, board in list(self._boards.items()):
+            if board.idle_since is not None and board.idle_since < cutoff:
+                del self._boards[user_id]
+
+    def close(self):
+        crud.remove_note_listener(self.on_note_changes)
+        self.backend.close()
+
+
+def _make_backend():
+    if REALTIME_BACKEND_URL and REALTIME_BACKEND_URL.startswith(("redis://", "rediss://")):
+        return PubSubBackend(RedisClient(REALTIME_BACKEND_URL))
+    return InProcessBackend()
+
+broker = Broker(_make_backend())
+crud.add_note_listener(broker.on_note_changes)
+
+
+# -------------------------
+# WebSocket session
+# -------------------------
+async def serve(websocket: WebSocket, user_id: int, since: Optional[int] = None, epoch: Optional[str] = None):
+    subscription, current, replay = broker.subscribe(user_id, since=since, epoch=epoch)
+    try:
+        await websocket.send_json({"type": "hello", "seq": current, "epoch": broker.backend.epoch})
+        if replay is None:
+            await websocket.send_json({"type": "reset", "seq": current})
+        elif replay:
+            await websocket.send_json({"type": "events", "events": coalesce(replay)})
+
+        if since is None or replay is None:
+            after = None  # client (re)fetches the board; absolute values make repeats harmless
+        else:
+            after = replay[-1]["seq"] if replay else since
+        sender = asyncio.create_task(_send_events(websocket, subscription, after=after))
+        receiver = asyncio.create_task(_receive(websocket))
+        done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if not task.cancelled() and task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                logger.warning("corkboard socket for user %s failed", user_id, exc_info=task.exception())
+    finally:
+        broker.unsubscribe(subscription)
+
+async def _send_events(websocket: WebSocket, subscription: Subscription, after: Optional[int]):
+    # `after` drops live events already covered by the hello/replay
+    last_seq = after or 0
+    while True:
+        events = list(await subscription.queue.get())
+        if REALTIME_COALESCE_MS:
+            await asyncio.sleep(REALTIME_COALESCE_MS / 1000)
+        while not subscription.queue.empty():
+            events.extend(subscription.queue.get_nowait())
+        if subscription.lagging:
+            # the client reconnects with ?since=<last seq> and replays from history
+            await websocket.close(code=4000, reason="lagging")
+            return
+        events = [event for event in events if event["seq"] > last_seq]
+        if events:
+            last_seq = events[-1]["seq"]
+            await websocket.send_json({"type": "events", "events": coalesce(events)})
+
+async def _receive(websocket: WebSocket):
+    while True:
+        message = await websocket.receive_text()
+        if message == "ping":
+            await websocket.send_json({"type": "pong"})
@@ -0,0 +1,109 @@
+import difflib
+import json
+import os
+import struct
+from typing import Dict, Iterable, Optional
+
+# Encoding of note_revisions rows; crud writes and reads them.
+NOTE_REVISIONS_ENABLED = os.environ.get("NOTE_REVISIONS_ENABLED", "true").lower() in ("1", "true", "yes")
+# every this many revisions a note gets a full copy, so reading one back
+# replays at most this many rows
+REVISION_SNAPSHOT_EVERY = int(os.environ.get("REVISION_SNAPSHOT_EVERY", 20))
+REVISION_MAX_PER_NOTE = int(os.environ.get("REVISION_MAX_PER_NOTE", 100))  # older ones are trimmed
+REVISION_RETENTION_DAYS = int(os.environ.get("REVISION_RETENTION_DAYS", 90))
+# geometry-only edits this close to the note's last one fold into it, so a
+# drag leaves one revision rather than one per PUT
+REVISION_COALESCE_SECONDS = float(os.environ.get("REVISION_COALESCE_SECONDS", 60))
+REVISION_DIFF_MAX_CHARS = int(os.environ.get("REVISION_DIFF_MAX_CHARS", 20_000))  # past this, edits aren't diffed
+
+GEOMETRY_FIELDS = ("x", "y", "width", "height")
+REVISION_FIELDS = ("content",) + GEOMETRY_FIELDS
+
+
+def is_snapshot(revision: int) -> bool:
+    return (revision - 1) % max(REVISION_SNAPSHOT_EVERY, 1) == 0
+
+def trim_before(revision: int) -> int:
+    # oldest revision kept once `revision` is written: a snapshot, with at
+    # least REVISION_MAX_PER_NOTE revisions from it on
+    if revision <= REVISION_MAX_PER_NOTE:
+        return 1
+    every = max(REVISION_SNAPSHOT_EVERY, 1)
+    return (revision - REVISION_MAX_PER_NOTE) // every * every + 1
+
+
+# -------------------------
+# Content deltas
+# -------------------------
+# A delta is a JSON list of [start, end] slices of the previous content and
+# strings of new text, joined in order.
+
+def diff_text(old: str, new: str) -> Optional[str]:
+    """Delta from old to new, or None when storing new whole is no bigger."""
+    # edits are usually in one place: match the common ends first and only
+    # diff what is between them
+    head = len(os.path.commonprefix([old, new]))
+    tail = len(os.path.commonprefix([old[head:][::-1], new[head:][::-1]]))
+    old_mid, new_mid = old[head:len(old) - tail], new[head:len(new) - tail]
+    ops = [[0, head]] if head else []
+    if old_mid and new_mid and len(old_mid) + len(new_mid) <= REVISION_DIFF_MAX_CHARS:
+        matcher = difflib.SequenceMatcher(None, old_mid, new_mid, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append([head + i1, head + i2])
+            elif j2 > j1:
+                ops.append(new_mid[j1:j2])
+    elif new_mid:
+        ops.append(new_mid)
+    if tail:
+        ops.append([len(old) - tail, len(old)])
+    delta = json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+    return delta if len(delta) < len(new) else None
+
+def apply_delta(old: str, delta: str) -> str:
+    return "".join(old[op[0]:op[1]] if isinstance(op, list) else op for op in json.loads(delta))
+
+
+# -------------------------
+# Geometry
+# -------------------------
+# One byte flagging which of x, y, width, height follow, then each as a
+# little-endian double: 9 to 33 bytes.
+
+def pack_geometry(values: Dict[str, float]) -> Optional[bytes]:
+    present = [field for field in GEOMETRY_FIELDS if values.get(field) is not None]
+    if not present:
+        return None
+    mask = sum(1 << GEOMETRY_FIELDS.index(field) for field in present)
+    return struct.pack(f"<B{len(present)}d", mask, *(values[field] for field in present))
+
+def unpack_geometry(data: Optional[bytes]) -> Dict[str, float]:
+    if not data:
+        return {}
+    fields = [field for bit, field in enumerate(GEOMETRY_FIELDS) if data[0] & (1 << bit)]
+    return dict(zip(fields, struct.unpack_from(f"<{len(fields)}d", data, 1)))
+
+
+# -------------------------
+# Replay
+# -------------------------
+def replay(rows: Iterable) -> Iterable:
+    """(row, state, changed) per revision row, in order.
+
+    `rows` (revision, snapshot, content, geometry) must start at a
+    snapshot. `state` is the note's content and geometry as of the row;
+    `changed` lists the fields that differ from the row before, or is None
+    for the first row.
+    """
+    state = None
+    for row in rows:
+        previous = state
+        if row.snapshot:
+            state = {"content": row.content, **dict.fromkeys(GEOMETRY_FIELDS)}
+        else:
+            state = dict(state)
+            if row.content is not None:
+                state["content"] = apply_delta(state["content"] or "", row.content)
+        state.update(unpack_geometry(row.geometry))
+        changed = None if previous is None else [field for field in REVISION_FIELDS if state[field] != previous[field]]
+        yield row, state, changed
@@ -1,6 +1,17 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, computed_field
 from datetime import datetime
-from typing import Optional, List
+from typing import Annotated, Optional, List, Literal
+import os
+
+# "full": board listings carry every note's whole content.
+# "preview": they carry notes.content_preview instead, with content_truncated
+# set on longer notes, whose text is at GET /corkboard/{id}/content.
+NOTE_LISTING_CONTENT = os.environ.get("NOTE_LISTING_CONTENT", "full")
+PREVIEW_LISTINGS = NOTE_LISTING_CONTENT == "preview"
+
+# board coordinates and sizes; NaN and infinity would break the spatial
+# index and layout for the whole board
+Coordinate = Annotated[float, Field(allow_inf_nan=False)]
 
 # -------------------------
 # Tag Schemas
@@ -17,6 +28,9 @@ class TagOut(TagBase):
     class Config:
         from_attributes = True
 
+class TagCount(TagBase):
+    note_count: int
+
 
 # -------------------------
 # User Schemas
@@ -40,10 +54,10 @@ class UserOut(UserBase):
 # -------------------------
 class NoteBase(BaseModel):
     content: Optional[str] = None   # now optional
-    x: Optional[float] = 0
-    y: Optional[float] = 0
-    width: Optional[float] = 150
-    height: Optional[float] = 100
+    x: Optional[Coordinate] = 0
+    y: Optional[Coordinate] = 0
+    width: Optional[Coordinate] = 150
+    height: Optional[Coordinate] = 100
 
 class NoteCreate(NoteBase):
     tags: List[str] = []  # list of tag names when creating a note
@@ -58,10 +72,146 @@ class NoteOut(NoteBase):
     class Config:
         from_attributes = True
 
+class NotePreviewOut(NoteOut):
+    # listing entry in preview mode; reads the preview column, never the
+    # (deferred) full content
+    content: Optional[str] = Field(None, validation_alias="content_preview")
+    content_length: Optional[int] = None
+
+    @computed_field
+    @property
+    def content_truncated(self) -> bool:
+        return (self.content_length or 0) > len(self.content or "")
+
+NoteListOut = NotePreviewOut if PREVIEW_LISTINGS else NoteOut
+
+class NoteContent(BaseModel):
+    id: int
+    content: Optional[str] = None
+
+class NotePage(BaseModel):
+    notes: List[NoteListOut]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
+
+class NoteChanges(BaseModel):
+    notes: List[NoteListOut]            # created or updated since the token
+    deleted: List[int] = []          # ids of notes deleted since the token
+    next_token: str                  # pass back as ?since= on the next sync
+    reset: bool = False              # notes is the whole board; replace local state
+
+class NoteSearchHit(BaseModel):
+    note: NoteOut
+    rank: float
+    snippet: Optional[str] = None  # matches wrapped in <mark>; content is not HTML-escaped
+
+class NoteSearchPage(BaseModel):
+    hits: List[NoteSearchHit]
+    next_offset: Optional[int] = None
+
 class NoteUpdate(BaseModel):
     content: Optional[str] = None
     tags: Optional[List[str]] = None
+    x: Optional[Coordinate] = None
+    y: Optional[Coordinate] = None
+    width: Optional[Coordinate] = None
+    height: Optional[Coordinate] = None
+
+
+class NoteRevisionOut(BaseModel):
+    # the note's content and geometry as of this revision
+    revision: int
+    created_at: datetime
+    changed: Optional[List[str]] = None  # fields changed by this revision; None for the oldest kept
+    content: Optional[str] = None
     x: Optional[float] = None
     y: Optional[float] = None
     width: Optional[float] = None
     height: Optional[float] = None
+
+class NoteRevisionPage(BaseModel):
+    revisions: List[NoteRevisionOut]  # newest first
+    next_before: Optional[int] = None  # pass back as ?before= for older revisions
+
+
+# -------------------------
+# Batch Schemas
+# -------------------------
+class NoteBatchOp(NoteUpdate):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None  # required for update/delete
+
+class NoteBatch(BaseModel):
+    operations: List[NoteBatchOp] = Field(..., max_length=500)
+
+class NoteBatchResult(BaseModel):
+    index: int
+    op: str
+    status: int  # HTTP-style status for this item (201, 200, 204, 404, 422)
+    id: Optional[int] = None
+    note: Optional[NoteOut] = None
+    detail: Optional[str] = None
+
+
+class NoteCollisions(BaseModel):
+    note_ids: List[int]  # notes overlapping the queried rectangle
+
+class LayoutRequest(BaseModel):
+    algorithm: Literal["grid", "shelf", "force"] = "grid"
+    gap: float = Field(20, ge=0, allow_inf_nan=False)  # space kept between notes
+    origin_x: Optional[Coordinate] = None  # top-left of the result; defaults to the board's
+    origin_y: Optional[Coordinate] = None
+    dry_run: bool = False                  # return the positions without saving them
+    background: bool = False               # run as a job; the response is 202 with the job
+
+class NotePosition(BaseModel):
+    id: int
+    x: Coordinate
+    y: Coordinate
+
+class LayoutResult(BaseModel):
+    algorithm: str
+    dry_run: bool
+    positions: List[NotePosition]
+
+# -------------------------
+# Job Schemas
+# -------------------------
+class JobOut(BaseModel):
+    id: str
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    cancel_requested: bool
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class JobAccepted(JobOut):
+    token: Optional[str] = None  # for GET /jobs/{id}?token=, which needs no sign-in
+
+
+# -------------------------
+# Import/Export Schemas
+# -------------------------
+class NoteImportLine(NoteCreate):
+    # one NDJSON line; GET /corkboard/export lines import as-is (id and
+    # updated_at are ignored, imported notes get new ones)
+    created_at: Optional[datetime] = None
+
+class NoteImportError(BaseModel):
+    line: int
+    detail: str
+
+class NoteImportStatus(BaseModel):
+    import_id: str
+    status: str                  # running, completed, failed
+    lines_processed: int         # committed lines; a resumed upload skips these
+    notes_imported: int
+    failed_lines: int
+    errors: List[NoteImportError] = []  # from this upload only, capped
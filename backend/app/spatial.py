@@ -0,0 +1,233 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import crud, model
+
+SPATIAL_CELL_SIZE = float(os.environ.get("SPATIAL_CELL_SIZE", 256))  # board units per grid cell
+SPATIAL_MAX_CELLS = int(os.environ.get("SPATIAL_MAX_CELLS", 64))  # notes spanning more cells are kept aside
+SPATIAL_MAX_BOARDS = int(os.environ.get("SPATIAL_MAX_BOARDS", 1000))  # boards indexed per process
+# "memory" keeps a grid per board; "postgres" asks the GiST index from the
+# spatial migration instead, for deployments with many workers and few reads
+SPATIAL_BACKEND = os.environ.get("SPATIAL_BACKEND", "memory")
+
+GEOMETRY_FIELDS = {"x", "y", "width", "height"}
+
+Rect = Tuple[float, float, float, float]  # x, y, width, height
+
+
+def intersects(a: Rect, b: Rect) -> bool:
+    # edges that only touch don't count, matching crud.viewport_select
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+def contains(outer: Rect, inner: Rect) -> bool:
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+def contains_point(rect: Rect, x: float, y: float) -> bool:
+    return rect[0] <= x <= rect[0] + rect[2] and rect[1] <= y <= rect[1] + rect[3]
+
+
+# -------------------------
+# Grid index
+# -------------------------
+class GridIndex:
+    # Uniform grid over board coordinates: each note is listed in every cell
+    # its rectangle touches, so a query only looks at the notes in the cells
+    # it covers. Notes are small next to the board, which keeps that to a
+    # handful per query; the few huge ones live in `oversized` and are
+    # always checked.
+    def __init__(self, cell_size: float = SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.rects: Dict[int, Rect] = {}
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self.oversized: Set[int] = set()
+
+    def __len__(self):
+        return len(self.rects)
+
+    def _cell_range(self, rect: Rect):
+        size = self.cell_size
+        return (math.floor(rect[0] / size), math.floor(rect[1] / size),
+                math.floor((rect[0] + rect[2]) / size), math.floor((rect[1] + rect[3]) / size))
+
+    def _cells(self, rect: Rect) -> Iterable[Tuple[int, int]]:
+        x0, y0, x1, y1 = self._cell_range(rect)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                yield cx, cy
+
+    def _cell_count(self, rect: Rect) -> int:
+        x0, y0, x1, y1 = self._cell_range(rect)
+        return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+    def insert(self, note_id: int, rect: Rect):
+        self.remove(note_id)
+        self.rects[note_id] = rect
+        if self._cell_count(rect) > SPATIAL_MAX_CELLS:
+            self.oversized.add(note_id)
+            return
+        for cell in self._cells(rect):
+            self.cells.setdefault(cell, set()).add(note_id)
+
+    def remove(self, note_id: int):
+        rect = self.rects.pop(note_id, None)
+        if rect is None:
+            return
+        if note_id in self.oversized:
+            self.oversized.discard(note_id)
+            return
+        for cell in self._cells(rect):
+            members = self.cells.get(cell)
+            if members is not None:
+                members.discard(note_id)
+                if not members:
+                    del self.cells[cell]
+
+    def _candidates(self, rect: Rect) -> Set[int]:
+        if self._cell_count(rect) > len(self.cells):
+            return set(self.rects)  # covers most of the board; a scan is cheaper
+        found = set(self.oversized)
+        for cell in self._cells(rect):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+    def query_rect(self, rect: Rect, mode: str = "intersects") -> List[int]:
+        test = contains if mode == "contains" else intersects
+        if mode == "contains":
+            return sorted(i for i in self._candidates(rect) if test(rect, self.rects[i]))
+        return sorted(i for i in self._candidates(rect) if test(self.rects[i], rect))
+
+    def query_point(self, x: float, y: float) -> List[int]:
+        return sorted(i for i in self._candidates((x, y, 0, 0)) if contains_point(self.rects[i], x, y))
+
+
+def note_rect(note) -> Rect:
+    # NULL geometry falls back to the column defaults
+    return (note.x or 0.0, note.y or 0.0,
+            150.0 if note.width is None else note.width, 150.0 if note.height is None else note.height)
+
+
+# -------------------------
+# Per-board indexes
+# -------------------------
+class SpatialIndexes:
+    # One GridIndex per board, tagged with the board version it reflects.
+    # Writes in this process are applied in place by the note listener;
+    # anything else (another worker, a bulk import, a listener that ran
+    # out of order) shows up as a version mismatch and the board is
+    # rebuilt from its geometry columns on the next query.
+    def __init__(self, max_boards: int = SPATIAL_MAX_BOARDS):
+        self.max_boards = max_boards
+        self._boards = OrderedDict()  # user_id -> (version, GridIndex)
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def query(self, db: Session, user_id: int, search):
+        # `search` runs under the lock so listeners can't mutate the grid under it
+        index = self._get(db, user_id)
+        with self._lock:
+            return search(index)
+
+    def _get(self, db: Session, user_id: int) -> GridIndex:
+        version = crud.get_board_version(db, user_id)
+        with self._lock:
+            entry = self._boards.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._boards.move_to_end(user_id)
+                return entry[1]
+        index = GridIndex()
+        rows = db.execute(
+            select(model.Note.id, model.Note.x, model.Note.y, model.Note.width, model.Note.height)
+            .where(model.Note.owner_id == user_id)
+        )
+        for row in rows:
+            index.insert(row.id, note_rect(row))
+        with self._lock:
+            self.rebuilds += 1
+            self._boards[user_id] = (version, index)
+            self._boards.move_to_end(user_id)
+            while len(self._boards) > self.max_boards:
+                self._boards.popitem(last=False)
+        return index
+
+    def on_note_changes(self, changes: List[crud.NoteChange]):
+        by_user = {}
+        for change in changes:
+            by_user.setdefault(change.user_id, []).append(change)
+        with self._lock:
+            for user_id, user_changes in by_user.items():
+                entry = self._boards.get(user_id)
+                if entry is None:
+                    continue
+                version, index = entry
+                new_version = user_changes[0].version
+                if new_version is None or new_version != version + 1:
+                    del self._boards[user_id]  # missed a write; rebuild on demand
+                    continue
+                for change in user_changes:
+                    if change.kind == "delete":
+                        index.remove(change.note_id)
+                    elif change.kind == "create" or (change.kind == "update" and change.fields & GEOMETRY_FIELDS):
+                        index.insert(change.note_id, note_rect(change.note))
+                    elif change.kind != "update":
+                        del self._boards[user_id]  # bulk write; nothing to apply in place
+                        break
+                else:
+                    self._boards[user_id] = (new_version, index)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "boards": len(self._boards),
+                "notes": sum(len(index) for _, index in self._boards.values()),
+                "rebuilds": self.rebuilds,
+            }
+
+spatial_indexes = SpatialIndexes()
+crud.add_note_listener(spatial_indexes.on_note_changes)
+
+
+# -------------------------
+# Queries
+# -------------------------
+def _box(x, y, width, height):
+    return func.box(func.point(x, y), func.point(x + width, y + height))
+
+def _note_box():
+    # must match the expression of ix_notes_owner_box
+    return _box(model.Note.x, model.Note.y, model.Note.width, model.Note.height)
+
+def _postgres_ids(db: Session, user_id: int, condition) -> List[int]:
+    return list(db.scalars(
+        select(model.Note.id).where(model.Note.owner_id == user_id, condition).order_by(model.Note.id)
+    ))
+
+def hit_test(db: Session, user_id: int, x: float, y: float) -> List[int]:
+    if SPATIAL_BACKEND == "postgres":
+        return _postgres_ids(db, user_id, _note_box().op("@>")(func.point(x, y)))
+    return spatial_indexes.query(db, user_id, lambda index: index.query_point(x, y))
+
+def select_rect(db: Session, user_id: int, rect: Rect, mode: str = "intersects") -> List[int]:
+    if SPATIAL_BACKEND == "postgres":
+        # unlike the grid, box && also matches rectangles that only share an edge
+        area = _box(*rect)
+        condition = area.op("@>")(_note_box()) if mode == "contains" else _note_box().op("&&")(area)
+        return _postgres_ids(db, user_id, condition)
+    return spatial_indexes.query(db, user_id, lambda index: index.query_rect(rect, mode))
+
+def find_collisions(db: Session, user_id: int, rect: Rect, exclude: Iterable[int] = ()) -> List[int]:
+    skip = set(exclude)
+    return [note_id for note_id in select_rect(db, user_id, rect) if note_id not in skip]
+
+def load_notes(db: Session, user_id: int, note_ids: List[int]):
+    # full notes for the matched ids, in the order given
+    if not note_ids:
+        return []
+    notes = {note.id: note for note in db.scalars(crud.board_select(user_id, listing=True).where(model.Note.id.in_(note_ids)))}
+    return [notes[note_id] for note_id in note_ids if note_id in notes]
@@ -0,0 +1,225 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from app import crud
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# off:     every PUT commits on its own, as before
+# relaxed: geometry-only PUTs are acknowledged once buffered; a crash can
+#          lose up to WRITE_BUFFER_INTERVAL_MS of moves
+# strict:  group commit; the PUT returns after the batch holding it commits
+WRITE_BUFFER_MODE = os.environ.get("WRITE_BUFFER_MODE", "off")
+WRITE_BUFFER_INTERVAL_MS = float(os.environ.get("WRITE_BUFFER_INTERVAL_MS", 100))
+WRITE_BUFFER_MAX_NOTES = int(os.environ.get("WRITE_BUFFER_MAX_NOTES", 1000))  # flush early past this many
+WRITE_BUFFER_STRICT_TIMEOUT = float(os.environ.get("WRITE_BUFFER_STRICT_TIMEOUT", 5))  # seconds
+WRITE_BUFFER_LOCK_STRIPES = 64  # boards share flush locks by user id modulo this
+
+GEOMETRY_FIELDS = ("x", "y", "width", "height")
+
+
+class FlushFailed(Exception):
+    pass
+
+
+def is_geometry_only(note_data) -> bool:
+    fields = note_data.model_dump(exclude_none=True)
+    return bool(fields) and fields.keys() <= set(GEOMETRY_FIELDS)
+
+
+class WriteBuffer:
+    # Latest geometry per note, per board, until the flusher writes them
+    # out. Repeated moves of one note between flushes collapse into one
+    # row of one executemany UPDATE.
+    def __init__(self, interval_ms: float = WRITE_BUFFER_INTERVAL_MS, max_notes: int = WRITE_BUFFER_MAX_NOTES):
+        self.interval = interval_ms / 1000
+        self.max_notes = max_notes
+        self._pending: Dict[int, Dict[int, dict]] = {}  # user_id -> note_id -> geometry
+        self._size = 0
+        self._cond = threading.Condition()
+        # a board is written by one flush at a time, in order; boards in
+        # different stripes flush independently
+        self._board_locks = [threading.Lock() for _ in range(WRITE_BUFFER_LOCK_STRIPES)]
+        self._writing = set()  # users whose taken moves are being written
+        self._generation = 0   # bumped each time the pending set is taken
+        self._flushed = 0      # last generation that committed
+        self._failed = {}      # generation -> error, for strict waiters
+        self._thread = None
+        self._stopping = False
+        self.writes = 0
+        self.rows_flushed = 0
+        self.flushes = 0
+
+    def put(self, user_id: int, note_id: int, values: dict) -> int:
+        """Buffer a geometry update; returns the generation it will flush in."""
+        with self._cond:
+            self._ensure_thread()
+            board = self._pending.setdefault(user_id, {})
+            if note_id not in board:
+                board[note_id] = {}
+                self._size += 1
+            board[note_id].update(values)
+            self.writes += 1
+            if self._size >= self.max_notes:
+                self._cond.notify()
+            return self._generation + 1
+
+    def pending(self, user_id: int, note_id: int) -> Optional[dict]:
+        with self._cond:
+            values = self._pending.get(user_id, {}).get(note_id)
+            return dict(values) if values else None
+
+    def wait(self, generation: int, timeout: float = WRITE_BUFFER_STRICT_TIMEOUT):
+        # for strict mode: block until `generation` has committed
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._flushed < generation:
+                if generation in self._failed:
+                    raise FlushFailed(str(self._failed[generation]))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise FlushFailed("timed out waiting for the write buffer")
+                self._cond.wait(remaining)
+            if generation in self._failed:
+                raise FlushFailed(str(self._failed[generation]))
+
+    def flush(self, user_id: Optional[int] = None):
+        """Write out buffered moves, all boards or just one.
+
+        Reads and non-geometry writes of a board call this first, so they
+        see (and are ordered after) the moves buffered for it. With nothing
+        buffered or being written for the board it returns at once.
+        """
+        if user_id is None:
+            self._flush_all()
+            return
+        if not self.needs_flush(user_id):
+            return
+        with self._board_lock(user_id):
+            taken = self._take([user_id])
+            if not taken:
+                return  # a flush in progress wrote it; holding the lock waited for it
+            error = self._write_taken(taken)
+        if error is not None:
+            raise FlushFailed(str(error))
+
+    def needs_flush(self, user_id: int) -> bool:
+        # whether flush(user_id) has anything to write or wait for
+        with self._cond:
+            return user_id in self._pending or user_id in self._writing
+
+    def _flush_all(self):
+        # completes a generation, for strict waiters
+        with self._cond:
+            users = list(self._pending)
+            self._generation += 1
+            generation = self._generation
+        locks = [self._board_locks[stripe] for stripe in sorted({self._stripe(u) for u in users})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            error = self._write_taken(self._take(users))
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        with self._cond:
+            if error is not None:
+                self._failed[generation] = error
+                self._failed = {g: e for g, e in self._failed.items() if g > generation - 100}
+            self._flushed = generation
+            self._cond.notify_all()
+
+    def _stripe(self, user_id: int) -> int:
+        return user_id % WRITE_BUFFER_LOCK_STRIPES
+
+    def _board_lock(self, user_id: int) -> threading.Lock:
+        return self._board_locks[self._stripe(user_id)]
+
+    def _take(self, users) -> Dict[int, Dict[int, dict]]:
+        # pending moves of `users`, marked as being written; callers hold their board locks
+        taken = {}
+        with self._cond:
+            for user_id in users:
+                board = self._pending.pop(user_id, None)
+                if board:
+                    taken[user_id] = board
+                    self._size -= len(board)
+            self._writing.update(taken)
+        return taken
+
+    def _write_taken(self, taken: Dict[int, Dict[int, dict]]) -> Optional[Exception]:
+        if not taken:
+            return None
+        error = None
+        try:
+            self._write(taken)
+        except Exception as exc:
+            logger.exception("write buffer flush failed; re-queueing %d notes",
+                             sum(len(board) for board in taken.values()))
+            error = exc
+            self._requeue(taken)
+        with self._cond:
+            self._writing.difference_update(taken)
+            self._cond.notify_all()
+        return error
+
+    def _write(self, taken: Dict[int, Dict[int, dict]]):
+        db = SessionLocal()
+        try:
+            self.rows_flushed += crud.write_note_geometry(db, taken)
+        finally:
+            db.close()
+        self.flushes += 1
+
+    def _requeue(self, taken: Dict[int, Dict[int, dict]]):
+        # put failed values back unless a newer move has replaced them
+        with self._cond:
+            for user_id, board in taken.items():
+                pending = self._pending.setdefault(user_id, {})
+                for note_id, values in board.items():
+                    if note_id not in pending:
+                        pending[note_id] = values
+                        self._size += 1
+                    else:
+                        pending[note_id] = {**values, **pending[note_id]}
+
+    def _ensure_thread(self):
+        if self._thread is None and not self._stopping:
+            self._thread = threading.Thread(target=self._run, name="write-buffer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping:
+                    self._cond.wait(self.interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def close(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        else:
+            self.flush()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "mode": WRITE_BUFFER_MODE,
+                "pending": self._size,
+                "writes": self.writes,
+                "rows_flushed": self.rows_flushed,
+                "flushes": self.flushes,
+            }
+
+write_buffer = WriteBuffer()
@@ -0,0 +1,306 @@
+"""Load test for the corkboard API.
+
+Seeds users, notes and tags through app.crud, then drives /auth/login and
+the /corkboard endpoints at a fixed concurrency and reports latency
+percentiles, throughput and DB queries per request for each endpoint.
+
+Run from backend/ (httpx is needed on top of requirements.txt):
+
+    DATABASE_URL=sqlite:///bench.db python -m bench.corkboard_bench \
+        --board-sizes 100,10000 --concurrency 32 --output results.json
+
+By default the app runs in-process over ASGI against DATABASE_URL, which
+is what makes query counting possible. Pass --url to hit a running
+server instead; the database is then seeded through DATABASE_URL and
+query counts are left out, and the server should run with
+RATE_LIMIT_ENABLED=false. --baseline compares against an earlier
+results file and exits non-zero when a p95 regresses past --max-regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import event
+
+# app modules read DATABASE_URL and the rest of their settings on import, so
+# they are imported where used, after main() has checked the environment
+PASSWORD = "bench-password"
+SEED_CHUNK = 500
+TAG_POOL = [f"tag{i}" for i in range(200)]
+
+
+# -------------------------
+# Seeding
+# -------------------------
+def seed_board(db, username: str, notes: int, tags_per_note: int, hashed_password: str):
+    from app import crud, schemas
+
+    user = crud.create_user(
+        db,
+        schemas.UserCreate(username=username, email=f"{username}@example.com", password=PASSWORD),
+        hashed_password=hashed_password,
+    )
+    remaining = notes
+    while remaining > 0:
+        chunk = min(SEED_CHUNK, remaining)
+        operations = [
+            schemas.NoteBatchOp(
+                op="create",
+                content=f"bench note {random.randrange(1_000_000)}",
+                x=random.uniform(0, 5000),
+                y=random.uniform(0, 5000),
+                tags=random.sample(TAG_POOL, tags_per_note),
+            )
+            for _ in range(chunk)
+        ]
+        crud.apply_note_batch(db, user_id=user.id, operations=operations)
+        db.expunge_all()
+        remaining -= chunk
+    return user.id
+
+def seed(board_size: int, users: int, tags_per_note: int):
+    from app import crud, database
+
+    database.Base.metadata.create_all(database.engine)
+    hashed_password = crud.get_password_hash(PASSWORD)  # hash once, reuse for every user
+    run_id = uuid.uuid4().hex[:8]
+    db = database.SessionLocal()
+    try:
+        usernames = [f"bench-{run_id}-{board_size}-{i}" for i in range(users)]
+        for username in usernames:
+            seed_board(db, username, board_size, tags_per_note, hashed_password)
+    finally:
+        db.close()
+    return usernames
+
+
+# -------------------------
+# Measurement
+# -------------------------
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(latencies, errors: int, elapsed: float, queries):
+    ms = [latency * 1000 for latency in latencies]
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else 0.0,
+        "queries_per_request": round(queries / total, 2) if queries is not None and total else None,
+    }
+
+async def run_phase(name, make_request, requests: int, concurrency: int, counter):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await make_request(i)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    queries_before = counter.count if counter else None
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    queries = counter.count - queries_before if counter else None
+    result = summarize(latencies, errors, elapsed, queries)
+    print(f"  {name:<18} p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+          f"p99 {result['p99_ms']:>8} ms  {result['throughput_rps']:>8} req/s  errors {errors}",
+          file=sys.stderr)
+    return result
+
+
+# -------------------------
+# Scenario
+# -------------------------
+async def bench_board(client, usernames, args, counter):
+    tokens = {}
+    for username in usernames:
+        response = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+        response.raise_for_status()
+        tokens[username] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    headers = list(tokens.values())
+
+    # note ids per user, so drags and deletes hit the caller's own notes
+    boards = []
+    for auth in headers:
+        response = await client.get("/corkboard/page", params={"limit": 1000}, headers=auth)
+        response.raise_for_status()
+        boards.append([note["id"] for note in response.json()["notes"]])
+    created = [[] for _ in headers]
+
+    async def login(i):
+        return await client.post("/auth/login", data={"username": usernames[i % len(usernames)], "password": PASSWORD})
+
+    async def get_board(i):
+        # Accept-Encoding identity keeps client-side decompression out of the numbers
+        return await client.get("/corkboard", headers={**headers[i % len(headers)], "Accept-Encoding": "identity"})
+
+    async def create(i):
+        slot = i % len(headers)
+        response = await client.post(
+            "/corkboard",
+            json={"content": "bench", "x": random.uniform(0, 5000), "y": random.uniform(0, 5000),
+                  "tags": random.sample(TAG_POOL, args.tags_per_note)},
+            headers=headers[slot],
+        )
+        if response.status_code == 200:
+            created[slot].append(response.json()["id"])
+        return response
+
+    async def drag(i):
+        slot = i % len(headers)
+        note_id = random.choice(boards[slot] or created[slot])
+        return await client.put(f"/corkboard/{note_id}",
+                                json={"x": random.uniform(0, 5000), "y": random.uniform(0, 5000)},
+                                headers=headers[slot])
+
+    async def remove(i):
+        slot = next(slot for slot, ids in enumerate(created) if ids)
+        return await client.delete(f"/corkboard/{created[slot].pop()}", headers=headers[slot])
+
+    phases = [
+        ("POST /auth/login", login, args.login_requests),
+        ("GET /corkboard", get_board, args.requests),
+        ("POST /corkboard", create, args.requests),
+        ("PUT /corkboard/{id}", drag, args.requests),
+    ]
+    results = {}
+    for name, make_request, requests in phases:
+        results[name] = await run_phase(name, make_request, requests, args.concurrency, counter)
+    deletable = sum(len(ids) for ids in created)
+    results["DELETE /corkboard/{id}"] = await run_phase(
+        "DELETE /corkboard/{id}", remove, deletable, args.concurrency, counter
+    )
+    return results
+
+async def run(args):
+    from app import database
+
+    counter = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        from app.main import app
+
+        counter = QueryCounter(database.engine)
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout)
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "target": args.url or "in-process",
+        "database": database.engine.dialect.name,
+        "python": platform.python_version(),
+        "concurrency": args.concurrency,
+        "requests_per_endpoint": args.requests,
+        "boards": {},
+    }
+    async with client:
+        for board_size in args.board_sizes:
+            print(f"board of {board_size} notes x {args.users} users", file=sys.stderr)
+            started = time.perf_counter()
+            usernames = await asyncio.to_thread(seed, board_size, args.users, args.tags_per_note)
+            print(f"  seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            report["boards"][str(board_size)] = await bench_board(client, usernames, args, counter)
+    return report
+
+
+# -------------------------
+# Baseline comparison
+# -------------------------
+def compare(report, baseline, max_regression: float):
+    regressions = []
+    for board_size, endpoints in report["boards"].items():
+        for endpoint, result in endpoints.items():
+            before = baseline.get("boards", {}).get(board_size, {}).get(endpoint)
+            if not before or not before.get("p95_ms"):
+                continue
+            change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+            result["p95_change"] = round(change, 3)
+            marker = ""
+            if change > max_regression:
+                regressions.append((board_size, endpoint, change))
+                marker = "  REGRESSION"
+            print(f"  [{board_size}] {endpoint:<24} p95 {before['p95_ms']} -> {result['p95_ms']} ms "
+                  f"({change:+.1%}){marker}", file=sys.stderr)
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Corkboard API load test")
+    parser.add_argument("--url", help="base URL of a running server (default: run the app in-process)")
+    parser.add_argument("--board-sizes", default="100,10000",
+                        type=lambda value: [int(size) for size in value.split(",")],
+                        help="comma-separated notes per board, e.g. 100,10000,100000")
+    parser.add_argument("--users", type=int, default=4, help="users (boards) per board size")
+    parser.add_argument("--tags-per-note", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per corkboard endpoint")
+    parser.add_argument("--login-requests", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1234, help="random seed for generated data")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 growth, 0.2 = 20%%")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    if not os.environ.get("DATABASE_URL"):
+        sys.exit("DATABASE_URL must point at the database to seed")
+    # measure the app, not the per-user rate limits (in-process runs only;
+    # set before app.ratelimit is imported, which is on by default)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    report = asyncio.run(run(args))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its settings at import time, so point it at a throwaway
+# SQLite file before anything imports it.
+_db_dir = tempfile.mkdtemp(prefix="noteify-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.sqlite')}")
+# on by default; test_ratelimit.py turns it back on for its own tests
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ.setdefault("PASSWORD_EXECUTOR", "thread")
+
+
+@pytest.fixture()
+def client():
+    from fastapi.testclient import TestClient
+
+    from app import database, model  # noqa: F401  (registers the tables)
+    from app.main import app
+
+    database.Base.metadata.drop_all(database.engine)
+    database.Base.metadata.create_all(database.engine)
+    # no `with`: the lifespan shuts down process-wide workers that can't restart
+    yield TestClient(app)
+
+
+def auth_headers(client, username: str) -> dict:
+    client.post("/users/", json={"username": username, "email": f"{username}@example.com", "password": "pw"})
+    response = client.post("/auth/login", data={"username": username, "password": "pw"})
+    return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+
+@pytest.fixture()
+def job_queue(monkeypatch):
+    # a queue without worker threads: tests run jobs with run_once()
+    from app import jobs, main
+
+    queue = jobs.JobQueue(jobs.MemoryBroker(), workers=0)
+    monkeypatch.setattr(main, "job_queue", queue)
+    return queue
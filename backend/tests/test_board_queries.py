@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import event
+
+from conftest import auth_headers
+
+# Board listings load notes, owners and tags in a fixed number of queries;
+# a lazy load per note would make the count grow with the board.
+LISTINGS = [
+    "/corkboard",
+    "/corkboard?tags=red",
+    "/corkboard/page?limit=100",
+    "/corkboard/viewport?x=-10&y=-10&width=100000&height=100000",
+    "/corkboard/changes",
+    "/corkboard/select?x=-10&y=-10&width=100000&height=100000",
+]
+
+
+def seed_board(client, username: str, notes: int) -> dict:
+    headers = auth_headers(client, username)
+    for number in range(notes):
+        tags = ["red", f"tag{number % 7}"]
+        response = client.post("/corkboard", headers=headers,
+                               json={"content": f"note {number}", "x": number * 10, "y": number * 5, "tags": tags})
+        assert response.status_code == 200
+    return headers
+
+
+def count_queries(client, url: str, headers: dict) -> int:
+    from app import database
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.text
+    return len(statements)
+
+
+@pytest.mark.parametrize("url", LISTINGS)
+def test_listing_query_count_does_not_grow_with_board(client, url):
+    small = seed_board(client, "small", 5)
+    large = seed_board(client, "large", 50)
+    # the first request of each user fills the auth cache; measure after it
+    client.get("/users/me/", headers=small)
+    client.get("/users/me/", headers=large)
+
+    assert count_queries(client, url, small) == count_queries(client, url, large)
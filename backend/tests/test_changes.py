@@ -0,0 +1,36 @@
+from sqlalchemy import select
+
+from conftest import auth_headers
+
+
+def test_delete_right_after_a_sync_is_reported(client, monkeypatch):
+    # tombstones and notes carry timestamps of the same precision, so a delete
+    # in the same second as the token's last change still comes after it
+    from app import crud
+
+    monkeypatch.setattr(crud, "CHANGES_OVERLAP_SECONDS", 0)
+    headers = auth_headers(client, "alice")
+    first = client.post("/corkboard", headers=headers, json={"content": "a"}).json()["id"]
+    client.post("/corkboard", headers=headers, json={"content": "b"})
+    token = client.get("/corkboard/changes", headers=headers).json()["next_token"]
+
+    client.delete(f"/corkboard/{first}", headers=headers)
+    changes = client.get("/corkboard/changes", params={"since": token}, headers=headers).json()
+    assert changes["deleted"] == [first] and not changes["reset"]
+    # and the next token is past the delete
+    changes = client.get("/corkboard/changes", params={"since": changes["next_token"]}, headers=headers).json()
+    assert changes["deleted"] == [] and changes["notes"] == []
+
+
+def test_tombstone_times_have_note_precision(client):
+    from app import database, model
+
+    headers = auth_headers(client, "alice")
+    for _ in range(3):
+        note_id = client.post("/corkboard", headers=headers, json={"content": "a"}).json()["id"]
+        client.delete(f"/corkboard/{note_id}", headers=headers)
+    db = database.SessionLocal()
+    try:
+        assert all(moment.microsecond for moment in db.scalars(select(model.NoteTombstone.deleted_at)))
+    finally:
+        db.close()
@@ -0,0 +1,17 @@
+from datetime import datetime, timezone
+
+import pytest
+
+orjson = pytest.importorskip("orjson")
+
+
+def test_dumps_matches_without_orjson(monkeypatch):
+    # compact listings and their ETags must not depend on whether orjson is installed
+    from app import encoding
+
+    value = {"at": datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc),
+             "naive": datetime(2026, 1, 2, 3, 4, 5), "x": 12.5, "tags": ["é", None, True]}
+    with_orjson = encoding.dumps(value)
+    monkeypatch.setattr(encoding, "orjson", None)
+    assert encoding.dumps(value) == with_orjson
+
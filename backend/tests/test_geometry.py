@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import auth_headers
+
+# NaN or infinity in one note's geometry would break the spatial index and
+# layout for the whole board, so it is turned away at the edge.
+QUERIES = [
+    "/corkboard/hit?x={v}&y=0",
+    "/corkboard/hit?x=0&y={v}",
+    "/corkboard/select?x={v}&y=0&width=10&height=10",
+    "/corkboard/select?x=0&y=0&width={v}&height=10",
+    "/corkboard/collisions?x=0&y={v}&width=10&height=10",
+    "/corkboard/collisions?x=0&y=0&width=10&height={v}",
+    "/corkboard/viewport?x={v}&y=0&width=10&height=10",
+]
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf"])
+@pytest.mark.parametrize("query", QUERIES)
+def test_non_finite_query_is_rejected(client, query, value):
+    headers = auth_headers(client, "alice")
+    assert client.get(query.format(v=value), headers=headers).status_code == 422
+
+
+@pytest.mark.parametrize("value", ["NaN", "Infinity", "-Infinity"])
+def test_non_finite_note_geometry_is_rejected(client, value):
+    headers = {**auth_headers(client, "alice"), "Content-Type": "application/json"}
+    # json.dumps can't write these the way a client would, so send them raw
+    response = client.post("/corkboard", headers=headers, content='{"content": "a", "x": %s}' % value)
+    assert response.status_code == 422
+
+    note_id = client.post("/corkboard", headers=headers, json={"content": "a"}).json()["id"]
+    response = client.put(f"/corkboard/{note_id}", headers=headers, content='{"width": %s}' % value)
+    assert response.status_code == 422
+    response = client.post("/corkboard/batch", headers=headers,
+                           content='{"operations": [{"op": "update", "id": %d, "y": %s}]}' % (note_id, value))
+    assert response.status_code == 422
+    response = client.post("/corkboard/layout", headers=headers, content='{"origin_x": %s}' % value)
+    assert response.status_code == 422
+
+    # the board still works
+    assert client.get("/corkboard/hit?x=10&y=10", headers=headers).json()[0]["id"] == note_id
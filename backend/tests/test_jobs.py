@@ -0,0 +1,126 @@
+import pytest
+
+from conftest import auth_headers
+
+
+@pytest.fixture()
+def db():
+    from app import database
+
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+def reload(db, job):
+    from app import crud
+
+    db.expire_all()
+    return crud.get_job(db, job.id)
+
+
+def test_claim_takes_a_job_once(client, db):
+    from app import crud
+
+    job = crud.create_job(db, "noop", None, {})
+    claimed = crud.claim_job(db, lease_seconds=60)
+    assert claimed.id == job.id and claimed.status == "running" and claimed.attempts == 1
+    assert claimed.lease_expires_at is not None
+    assert crud.claim_job(db, lease_seconds=60) is None
+
+
+def test_expired_lease_is_claimed_again(client, db):
+    from app import crud
+
+    job = crud.create_job(db, "noop", None, {})
+    crud.claim_job(db, lease_seconds=-1)  # the worker died straight away
+    again = crud.claim_job(db, lease_seconds=60)
+    assert again.id == job.id and again.attempts == 2
+    assert crud.claim_job(db, lease_seconds=60) is None
+
+
+def test_claim_by_id_skips_other_jobs(client, db):
+    from app import crud
+
+    first = crud.create_job(db, "noop", None, {})
+    second = crud.create_job(db, "noop", None, {})
+    assert crud.claim_job(db, lease_seconds=60, job_id=second.id).id == second.id
+    assert crud.claim_job(db, lease_seconds=60, job_id=second.id) is None
+    assert crud.claim_job(db, lease_seconds=60).id == first.id
+
+
+def test_failed_job_is_retried_then_failed(client, db, job_queue, monkeypatch):
+    from app import crud, jobs
+
+    calls = []
+
+    def boom(db, job):
+        calls.append(job.attempts)
+        raise RuntimeError("no luck")
+
+    monkeypatch.setitem(jobs.HANDLERS, "boom", boom)
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0)
+    job = crud.create_job(db, "boom", None, {}, max_attempts=2)
+
+    job_queue.run_once(job.id)
+    job = reload(db, job)
+    assert job.status == "queued" and job.error == "RuntimeError: no luck"
+    job_queue.run_once(job.id)
+    job = reload(db, job)
+    assert job.status == "failed" and job.attempts == 2 and job.finished_at is not None
+    assert calls == [1, 2]
+    assert job_queue.run_once() is None
+
+
+def test_cancel(client, db, job_queue, monkeypatch):
+    from app import crud, jobs
+
+    headers = auth_headers(client, "alice")
+    owner_id = client.get("/users/me/", headers=headers).json()["id"]
+
+    queued = crud.create_job(db, "noop", owner_id, {})
+    response = client.post(f"/jobs/{queued.id}/cancel", headers=headers)
+    assert response.json()["status"] == "cancelled"
+    assert client.post(f"/jobs/{queued.id}/cancel", headers=headers).status_code == 409
+
+    # a running job stops at its next check
+    def slow(db, job):
+        crud.request_job_cancel(db, job)  # as if the API had been called meanwhile
+        jobs.check_cancelled(db, job)
+        return {"done": True}
+
+    monkeypatch.setitem(jobs.HANDLERS, "slow", slow)
+    running = crud.create_job(db, "slow", owner_id, {})
+    job_queue.run_once(running.id)
+    assert reload(db, running).status == "cancelled"
+
+
+def test_jobs_are_private(client, db):
+    from app import crud
+
+    alice = auth_headers(client, "alice")
+    bob = auth_headers(client, "bob")
+    job = crud.create_job(db, "noop", client.get("/users/me/", headers=alice).json()["id"], {})
+    assert client.get(f"/jobs/{job.id}", headers=alice).status_code == 200
+    assert client.get(f"/jobs/{job.id}", headers=bob).status_code == 404
+    assert client.post(f"/jobs/{job.id}/cancel", headers=bob).status_code == 404
+
+
+def test_account_deletion_can_be_polled_after_the_account_is_gone(client, job_queue):
+    headers = auth_headers(client, "alice")
+    client.post("/corkboard", headers=headers, json={"content": "a", "tags": ["red"]})
+
+    response = client.delete("/users/me", headers=headers)
+    assert response.status_code == 202
+    job_id, token = response.json()["id"], response.json()["token"]
+    assert response.headers["location"] == f"/jobs/{job_id}?token={token}"
+
+    job_queue.run_once()
+    assert client.get("/users/me/", headers=headers).status_code == 401
+    assert client.get(f"/jobs/{job_id}", headers=headers).status_code == 401
+    polled = client.get(response.headers["location"])
+    assert polled.status_code == 200 and polled.json()["status"] == "succeeded"
+    assert client.get(f"/jobs/{job_id}").status_code == 401  # neither token nor sign-in
+
+    other = client.delete("/users/me", headers=auth_headers(client, "bob")).json()
+    assert client.get(f"/jobs/{other['id']}", params={"token": token}).status_code == 404
@@ -0,0 +1,110 @@
+import itertools
+
+import pytest
+
+from conftest import auth_headers
+
+ALGORITHMS = ["grid", "shelf", "force"]
+
+
+def seed(client, headers, count: int = 12):
+    # a pile of overlapping notes of mixed sizes
+    ids = []
+    for number in range(count):
+        response = client.post("/corkboard", headers=headers, json={
+            "content": str(number), "x": number % 3 * 10, "y": number % 4 * 10,
+            "width": 100 + number % 3 * 40, "height": 80 + number % 2 * 50,
+        })
+        ids.append(response.json()["id"])
+    return ids
+
+
+def rects(client, headers):
+    return {note["id"]: (note["x"], note["y"], note["width"], note["height"])
+            for note in client.get("/corkboard", headers=headers).json()}
+
+
+def assert_spaced(boxes, gap: float):
+    # every pair is at least `gap` apart on one axis
+    for (ax, ay, aw, ah), (bx, by, bw, bh) in itertools.combinations(boxes, 2):
+        apart_x = max(bx - (ax + aw), ax - (bx + bw))
+        apart_y = max(by - (ay + ah), ay - (by + bh))
+        assert max(apart_x, apart_y) >= gap - 1e-6
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_layout_removes_overlaps(client, algorithm):
+    headers = auth_headers(client, "alice")
+    ids = seed(client, headers)
+
+    response = client.post("/corkboard/layout", headers=headers, json={"algorithm": algorithm, "gap": 15})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["algorithm"] == algorithm and not body["dry_run"]
+    assert sorted(position["id"] for position in body["positions"]) == sorted(ids)
+
+    saved = rects(client, headers)
+    assert {position["id"]: (position["x"], position["y"]) for position in body["positions"]} == \
+        {note_id: rect[:2] for note_id, rect in saved.items()}
+    assert_spaced(saved.values(), 15)
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_layout_starts_at_the_origin(client, algorithm):
+    headers = auth_headers(client, "alice")
+    seed(client, headers)
+
+    body = client.post("/corkboard/layout", headers=headers,
+                       json={"algorithm": algorithm, "origin_x": 500, "origin_y": -200}).json()
+    assert min(position["x"] for position in body["positions"]) == pytest.approx(500)
+    assert min(position["y"] for position in body["positions"]) == pytest.approx(-200)
+
+
+def test_dry_run_saves_nothing(client):
+    headers = auth_headers(client, "alice")
+    seed(client, headers)
+    before = rects(client, headers)
+
+    body = client.post("/corkboard/layout", headers=headers, json={"dry_run": True}).json()
+    assert body["dry_run"] and len(body["positions"]) == len(before)
+    assert rects(client, headers) == before
+
+
+def test_empty_board(client):
+    headers = auth_headers(client, "alice")
+    assert client.post("/corkboard/layout", headers=headers, json={}).json()["positions"] == []
+
+
+def test_layout_only_touches_the_callers_board(client):
+    alice = auth_headers(client, "alice")
+    bob = auth_headers(client, "bob")
+    seed(client, alice)
+    seed(client, bob, count=3)
+    before = rects(client, bob)
+
+    client.post("/corkboard/layout", headers=alice, json={"algorithm": "force"})
+    assert rects(client, bob) == before
+
+
+def test_background_layout(client, job_queue):
+    headers = auth_headers(client, "alice")
+    ids = seed(client, headers)
+    before = rects(client, headers)
+
+    response = client.post("/corkboard/layout", headers=headers, json={"algorithm": "shelf", "background": True})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["kind"] == "layout" and job["status"] == "queued"
+    assert response.headers["location"] == f"/jobs/{job['id']}"
+    assert rects(client, headers) == before  # not yet
+
+    job_queue.run_once()
+    polled = client.get(f"/jobs/{job['id']}", headers=headers).json()
+    assert polled["status"] == "succeeded" and polled["result"] == {"algorithm": "shelf", "notes": len(ids)}
+    assert_spaced(rects(client, headers).values(), 20)
+
+
+def test_background_dry_run_is_rejected(client):
+    headers = auth_headers(client, "alice")
+    response = client.post("/corkboard/layout", headers=headers, json={"dry_run": True, "background": True})
+    assert response.status_code == 422
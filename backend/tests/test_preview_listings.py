@@ -0,0 +1,105 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import text
+
+from conftest import auth_headers
+
+# NOTE_LISTING_CONTENT is read at import, so the preview-mode tests run in
+# a process of their own, started by test_preview_mode.
+PREVIEW = os.environ.get("NOTE_LISTING_CONTENT") == "preview"
+preview_only = pytest.mark.skipif(not PREVIEW, reason="run by test_preview_mode")
+
+LONG = "x" * 1000 + " needle"
+
+
+@pytest.mark.skipif(PREVIEW, reason="already in preview mode")
+def test_preview_mode(tmp_path):
+    env = {**os.environ, "NOTE_LISTING_CONTENT": "preview",
+           "DATABASE_URL": f"sqlite:///{tmp_path / 'preview.sqlite'}"}
+    result = subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", __file__],
+                            cwd=os.path.dirname(os.path.dirname(__file__)), env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def seed(client, headers):
+    long_id = client.post("/corkboard", headers=headers, json={"content": LONG, "tags": ["red"]}).json()["id"]
+    short_id = client.post("/corkboard", headers=headers, json={"content": "short", "x": 500, "tags": ["red"]}).json()["id"]
+    return long_id, short_id
+
+
+def test_preview_columns_follow_every_write(client):
+    headers = auth_headers(client, "alice")
+    long_id, short_id = seed(client, headers)
+    client.put(f"/corkboard/{short_id}", headers=headers, json={"content": "y" * 400})
+    client.put(f"/corkboard/{long_id}", headers=headers, json={"content": None, "x": 5})  # no content change
+    client.post("/corkboard/batch", headers=headers, json={"operations": [
+        {"op": "create", "content": "z" * 300}, {"op": "create"},
+    ]})
+    client.post("/corkboard/import", headers=headers, content=json.dumps({"content": "w" * 500}))
+
+    from app import crud, database
+
+    with database.engine.connect() as conn:
+        rows = conn.execute(text("SELECT content, content_preview, content_length FROM notes")).all()
+    assert len(rows) == 5
+    for content, preview, length in rows:
+        if content is None:
+            assert preview is None and length is None
+        else:
+            assert preview == content[:crud.NOTE_PREVIEW_CHARS] and length == len(content)
+
+
+def test_full_content_endpoint(client):
+    headers = auth_headers(client, "alice")
+    long_id, _ = seed(client, headers)
+    response = client.get(f"/corkboard/{long_id}/content", headers=headers)
+    assert response.json() == {"id": long_id, "content": LONG}
+    assert client.get(f"/corkboard/{long_id}/content", headers=auth_headers(client, "bob")).status_code == 404
+
+
+@preview_only
+@pytest.mark.parametrize("url", [
+    "/corkboard",
+    "/corkboard?tags=red",
+    "/corkboard/page",
+    "/corkboard/changes",
+    "/corkboard/viewport?x=-10&y=-10&width=10000&height=10000",
+    "/corkboard/hit?x=10&y=10",
+    "/corkboard/select?x=-10&y=-10&width=10000&height=10000",
+])
+def test_listings_carry_previews(client, url):
+    from app import crud
+
+    headers = auth_headers(client, "alice")
+    long_id, short_id = seed(client, headers)
+    body = client.get(url, headers=headers).json()
+    notes = {note["id"]: note for note in (body["notes"] if isinstance(body, dict) else body)}
+
+    assert notes[long_id]["content"] == LONG[:crud.NOTE_PREVIEW_CHARS]
+    assert notes[long_id]["content_truncated"] and notes[long_id]["content_length"] == len(LONG)
+    if short_id in notes:
+        assert notes[short_id]["content"] == "short" and not notes[short_id]["content_truncated"]
+
+
+@preview_only
+def test_compact_listing_carries_previews(client):
+    from app import crud
+
+    headers = auth_headers(client, "alice")
+    long_id, _ = seed(client, headers)
+    notes = {note["id"]: note for note in client.get("/corkboard?format=compact", headers=headers).json()["notes"]}
+    assert notes[long_id]["content"] == LONG[:crud.NOTE_PREVIEW_CHARS] and notes[long_id]["content_truncated"]
+
+
+@preview_only
+def test_single_note_responses_carry_full_content(client):
+    headers = auth_headers(client, "alice")
+    long_id, _ = seed(client, headers)
+    assert client.put(f"/corkboard/{long_id}", headers=headers, json={"x": 40}).json()["content"] == LONG
+    hits = client.get("/corkboard/search", params={"q": "needle"}, headers=headers).json()["hits"]
+    assert [hit["note"]["content"] for hit in hits] == [LONG]
@@ -0,0 +1,60 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+from conftest import auth_headers
+
+
+@pytest.fixture()
+def limits(monkeypatch):
+    # rate limiting on, with empty buckets
+    from app import ratelimit
+
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit.limiter, "store", ratelimit.MemoryBucketStore())
+    monkeypatch.setattr(ratelimit.limiter, "_token_uids", ratelimit.OrderedDict())
+    monkeypatch.setattr(ratelimit.limiter, "rejected", {})
+    return ratelimit
+
+
+def test_anonymous_callers_are_limited_by_address(client, limits):
+    # POST /users/ allows a burst of 5; the check runs before the body is read
+    statuses = [client.post("/users/", json={}).status_code for _ in range(6)]
+    assert statuses == [422] * 5 + [429]
+    response = client.post("/users/", json={})
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+
+
+def test_signed_in_callers_each_get_their_own_bucket(client, limits):
+    alice = auth_headers(client, "alice")
+    bob = auth_headers(client, "bob")
+    # GET /corkboard/export allows a burst of 2
+    assert [client.get("/corkboard/export", headers=alice).status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get("/corkboard/export", headers=bob).status_code == 200
+    assert limits.limiter.stats()["rejected"] == {("GET /corkboard/export", "rate"): 1}
+
+
+def test_expired_token_is_limited_by_address(client, limits):
+    from app import auth
+
+    uid = client.get("/users/me/", headers=auth_headers(client, "alice")).json()["id"]
+    token = auth.create_access_token({"sub": "alice", "uid": uid, "ver": 0}, expires_delta=timedelta(seconds=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(2):
+        client.get("/corkboard/export", headers=headers)  # spends alice's bucket
+    time.sleep(2)
+    # no longer alice's: the address's bucket is untouched, so this gets the 401
+    assert client.get("/corkboard/export", headers=headers).status_code == 401
+
+
+def test_overload_is_shed_with_503(client, limits, monkeypatch):
+    headers = auth_headers(client, "alice")
+    monkeypatch.setattr(limits, "ADMISSION_MAX_IN_FLIGHT", 1)
+    monkeypatch.setattr(limits.limiter, "in_flight", 1)  # as if one request were running
+
+    response = client.get("/corkboard", headers=headers)
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+    assert client.get("/health").status_code == 200  # exempt
+    monkeypatch.setattr(limits.limiter, "in_flight", 0)
+    assert client.get("/corkboard", headers=headers).status_code == 200
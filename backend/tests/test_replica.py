@@ -0,0 +1,72 @@
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from conftest import auth_headers
+
+
+@pytest.fixture()
+def replica(client, monkeypatch, tmp_path):
+    # a second SQLite file stands in for the replica; sync() copies the
+    # primary over it, as replication would
+    from app import database
+
+    path = tmp_path / "replica.sqlite"
+    engine = create_engine(f"sqlite:///{path}")
+    database.Base.metadata.create_all(engine)
+    monkeypatch.setattr(database, "replica_engine", engine)
+
+    def sync():
+        engine.dispose()
+        source = sqlite3.connect(database.engine.url.database)
+        target = sqlite3.connect(os.fspath(path))
+        source.backup(target)
+        source.close()
+        target.close()
+
+    def execute(statement: str):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(statement)
+
+    sync.execute = execute
+    yield sync
+    engine.dispose()
+
+
+def test_login_right_after_signup_uses_the_primary(client, replica):
+    # the replica hasn't seen the new user yet
+    headers = auth_headers(client, "alice")
+    assert client.get("/users/me/", headers=headers).status_code == 200
+
+
+def test_board_reads_go_to_the_replica(client, replica):
+    headers = auth_headers(client, "alice")
+    client.post("/corkboard", headers=headers, json={"content": "a", "tags": ["red"]})
+    replica()
+    # mark the replica's copy, to tell which database answered
+    replica.execute("UPDATE notes SET content = 'from replica'")
+    replica.execute("UPDATE tags SET name = 'replica-red'")
+
+    for url in ("/corkboard", "/corkboard/page", "/corkboard?tags=replica-red"):
+        notes = client.get(url, headers=headers).json()
+        notes = notes["notes"] if "notes" in notes else notes
+        assert [(note["content"], [tag["name"] for tag in note["tags"]]) for note in notes] == \
+            [("from replica", ["replica-red"])], url
+
+
+def test_board_etag_follows_the_replica(client, replica):
+    headers = {**auth_headers(client, "alice"), "Accept-Encoding": "identity"}
+    replica()
+    first = client.get("/corkboard", headers=headers)
+
+    # a write the replica hasn't caught up with yet: the old board is all
+    # there is to serve, so it keeps its old ETag
+    client.post("/corkboard", headers=headers, json={"content": "a"})
+    lagging = client.get("/corkboard", headers=headers)
+    assert lagging.json() == [] and lagging.headers["etag"] == first.headers["etag"]
+
+    replica()
+    caught_up = client.get("/corkboard", headers=headers)
+    assert len(caught_up.json()) == 1 and caught_up.headers["etag"] != first.headers["etag"]
@@ -0,0 +1,204 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import auth_headers
+
+FIELDS = ("content", "x", "y", "width", "height")
+BASE = "lorem ipsum " * 10
+
+
+@pytest.fixture()
+def settings(monkeypatch):
+    # small numbers, so a test reaches snapshots and trimming in a few edits
+    from app import revisions
+
+    monkeypatch.setattr(revisions, "REVISION_SNAPSHOT_EVERY", 3)
+    monkeypatch.setattr(revisions, "REVISION_MAX_PER_NOTE", 100)
+    return revisions
+
+
+def state(note: dict) -> dict:
+    return {field: note[field] for field in FIELDS}
+
+
+def all_revisions(client, headers, note_id: int, limit: int = 4) -> list:
+    # every revision, newest first, following next_before a page at a time
+    pages = []
+    before = None
+    while True:
+        params = {"limit": limit, **({"before": before} if before else {})}
+        body = client.get(f"/corkboard/{note_id}/revisions", params=params, headers=headers).json()
+        pages += body["revisions"]
+        before = body["next_before"]
+        if before is None:
+            return pages
+
+
+def stored_rows(note_id: int) -> dict:
+    from app import database, model
+
+    db = database.SessionLocal()
+    try:
+        return {row.revision: row.snapshot for row in db.query(model.NoteRevision).filter_by(note_id=note_id)}
+    finally:
+        db.close()
+
+
+def edit(client, headers, note_id: int, written: list, **values) -> dict:
+    note = client.put(f"/corkboard/{note_id}", headers=headers, json=values).json()
+    written.append(state(note))
+    return note
+
+
+def test_replay_matches_every_write(client, settings):
+    headers = auth_headers(client, "alice")
+    text = "The quick brown fox jumps over the lazy dog. " * 6
+    note = client.post("/corkboard", headers=headers, json={"content": text, "x": 1, "y": 2}).json()
+    written = [state(note)]
+    for i in range(10):
+        # small edits in the middle, stored as deltas, and some moves with them
+        text = text.replace("fox" if i % 2 else "dog", f"animal {i}", 1)
+        edit(client, headers, note["id"], written, content=text, **({"x": 10 * i} if i % 3 == 0 else {}))
+
+    listed = all_revisions(client, headers, note["id"])
+    assert [entry["revision"] for entry in listed] == list(range(11, 0, -1))
+    assert [state(entry) for entry in listed[::-1]] == written
+    assert listed[0]["changed"] == ["content", "x"] and listed[1]["changed"] == ["content"]
+    # a full copy every third revision, deltas in between
+    assert [number for number, snapshot in sorted(stored_rows(note["id"]).items()) if snapshot] == [1, 4, 7, 10]
+
+
+def test_page_limits(client, settings):
+    headers = auth_headers(client, "alice")
+    note_id = client.post("/corkboard", headers=headers, json={"content": "a"}).json()["id"]
+    for content in ("b", "c", "d", "e"):
+        client.put(f"/corkboard/{note_id}", headers=headers, json={"content": content})
+
+    body = client.get(f"/corkboard/{note_id}/revisions", params={"limit": 2}, headers=headers).json()
+    assert [entry["content"] for entry in body["revisions"]] == ["e", "d"] and body["next_before"] == 4
+    body = client.get(f"/corkboard/{note_id}/revisions", params={"limit": 2, "before": 2}, headers=headers).json()
+    assert [entry["content"] for entry in body["revisions"]] == ["a"] and body["next_before"] is None
+    assert client.get(f"/corkboard/{note_id}/revisions", headers=auth_headers(client, "bob")).status_code == 404
+
+
+def test_moves_coalesce(client, settings):
+    headers = auth_headers(client, "alice")
+    note_id = client.post("/corkboard", headers=headers, json={"content": "a"}).json()["id"]
+    for x in (10, 20, 30):
+        client.put(f"/corkboard/{note_id}", headers=headers, json={"x": x, "y": x})
+    client.put(f"/corkboard/{note_id}", headers=headers, json={"content": "b"})
+    client.put(f"/corkboard/{note_id}", headers=headers, json={"x": 40})
+
+    listed = all_revisions(client, headers, note_id)
+    # the drag is one revision; a content edit ends it
+    assert [(entry["content"], entry["x"], entry["y"]) for entry in listed[::-1]] == [
+        ("a", 0, 0), ("a", 30, 30), ("b", 30, 30), ("b", 40, 30),
+    ]
+
+
+def test_moves_coalesce_only_within_the_window(client, settings, monkeypatch):
+    monkeypatch.setattr(settings, "REVISION_COALESCE_SECONDS", 0)
+    headers = auth_headers(client, "alice")
+    note_id = client.post("/corkboard", headers=headers, json={"content": "a"}).json()["id"]
+    for x in (10, 20):
+        client.put(f"/corkboard/{note_id}", headers=headers, json={"x": x})
+    assert [entry["x"] for entry in all_revisions(client, headers, note_id)] == [20, 10, 0]
+
+
+def test_restore(client, settings):
+    headers = auth_headers(client, "alice")
+    note_id = client.post("/corkboard", headers=headers, json={"x": 5}).json()["id"]  # no content
+    client.put(f"/corkboard/{note_id}", headers=headers, json={"content": "first"})
+    client.put(f"/corkboard/{note_id}", headers=headers, json={"content": "second", "x": 50})
+
+    restored = client.post(f"/corkboard/{note_id}/revisions/2/restore", headers=headers).json()
+    assert (restored["content"], restored["x"]) == ("first", 5)
+    restored = client.post(f"/corkboard/{note_id}/revisions/1/restore", headers=headers).json()
+    assert (restored["content"], restored["x"]) == (None, 5)
+
+    # restoring is an edit of its own, so it can be undone
+    listed = all_revisions(client, headers, note_id)
+    assert [entry["content"] for entry in listed] == [None, "first", "second", "first", None]
+    restored = client.post(f"/corkboard/{note_id}/revisions/3/restore", headers=headers).json()
+    assert (restored["content"], restored["x"]) == ("second", 50)
+    assert client.post(f"/corkboard/{note_id}/revisions/99/restore", headers=headers).status_code == 404
+
+
+def test_trimming_keeps_a_snapshot_to_replay_from(client, settings, monkeypatch):
+    monkeypatch.setattr(settings, "REVISION_MAX_PER_NOTE", 5)
+    headers = auth_headers(client, "alice")
+    note = client.post("/corkboard", headers=headers, json={"content": BASE}).json()
+    written = [state(note)]
+    for i in range(1, 12):
+        edit(client, headers, note["id"], written, content=f"{BASE} {i}")
+
+    # trimmed as the snapshot at 10 was written: from the snapshot at 4 on,
+    # at least REVISION_MAX_PER_NOTE kept
+    kept = stored_rows(note["id"])
+    assert sorted(kept) == list(range(4, 13)) and kept[4]
+    assert [state(entry) for entry in all_revisions(client, headers, note["id"])[::-1]] == written[3:]
+    assert client.post(f"/corkboard/{note['id']}/revisions/1/restore", headers=headers).status_code == 404
+
+
+def test_prune_keeps_what_later_revisions_replay_from(client, settings):
+    from app import crud, database
+
+    headers = auth_headers(client, "alice")
+    note = client.post("/corkboard", headers=headers, json={"content": BASE}).json()
+    written = [state(note)]
+    for i in range(1, 9):
+        edit(client, headers, note["id"], written, content=f"{BASE} {i}")
+
+    db = database.SessionLocal()
+    try:
+        crud.prune_note_revisions(db, datetime.now(timezone.utc) + timedelta(seconds=1))
+    finally:
+        db.close()
+    # snapshots at 1, 4 and 7: 7 on is kept
+    assert sorted(stored_rows(note["id"])) == [7, 8, 9]
+    assert [state(entry) for entry in all_revisions(client, headers, note["id"])[::-1]] == written[6:]
+
+
+def test_deleting_a_note_drops_its_revisions(client, settings):
+    headers = auth_headers(client, "alice")
+    note_id = client.post("/corkboard", headers=headers, json={"content": "a"}).json()["id"]
+    client.put(f"/corkboard/{note_id}", headers=headers, json={"content": "b"})
+    client.delete(f"/corkboard/{note_id}", headers=headers)
+    assert stored_rows(note_id) == {}
+
+
+def test_concurrent_writers_number_revisions_in_turn(client, settings):
+    # each writer in a session of its own, as concurrent requests are;
+    # without the note locked first, two read the same latest revision and
+    # the second insert breaks the unique (note_id, revision) index
+    from app import crud, database, schemas
+
+    headers = auth_headers(client, "alice")
+    note_id = client.post("/corkboard", headers=headers, json={"content": "start"}).json()["id"]
+    errors = []
+    start = threading.Barrier(4)
+
+    def writer(name: str):
+        start.wait()
+        for i in range(5):
+            db = database.SessionLocal()
+            try:
+                crud.update_note(db, note_id, schemas.NoteUpdate(content=f"{name} {i}"))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer, args=(f"writer {n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    listed = all_revisions(client, headers, note_id, limit=100)
+    assert [entry["revision"] for entry in listed] == list(range(21, 0, -1))
+    note = client.get("/corkboard", headers=headers).json()[0]
+    assert listed[0]["content"] == note["content"]
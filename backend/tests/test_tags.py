@@ -0,0 +1,79 @@
+from collections import Counter
+
+import pytest
+
+from conftest import auth_headers
+
+
+def note(client, headers, *tags) -> int:
+    response = client.post("/corkboard", headers=headers, json={"content": "n", "tags": list(tags)})
+    return response.json()["id"]
+
+
+def tag_counts(client, headers) -> dict:
+    return {entry["name"]: entry["note_count"] for entry in client.get("/corkboard/tags", headers=headers).json()}
+
+
+def board_counts(client, headers) -> dict:
+    # what the counts should be, from the notes themselves
+    notes = client.get("/corkboard", headers=headers).json()
+    return dict(Counter(tag["name"] for note in notes for tag in note["tags"]))
+
+
+def test_counts_follow_every_kind_of_write(client):
+    headers = auth_headers(client, "alice")
+    first = note(client, headers, "red", "blue")
+    second = note(client, headers, "red")
+    note(client, headers, "green")
+    assert tag_counts(client, headers) == {"red": 2, "blue": 1, "green": 1}
+
+    client.put(f"/corkboard/{second}", headers=headers, json={"tags": ["blue", "green"]})
+    client.delete(f"/corkboard/{first}", headers=headers)
+    client.post("/corkboard/batch", headers=headers, json={"operations": [
+        {"op": "create", "content": "b", "tags": ["red", "red"]},
+        {"op": "update", "id": second, "tags": ["green"]},
+    ]})
+    assert tag_counts(client, headers) == board_counts(client, headers) == {"green": 2, "red": 1}
+    # most used first, then by name
+    assert [entry["name"] for entry in client.get("/corkboard/tags", headers=headers).json()] == ["green", "red"]
+
+
+def test_counts_are_per_board(client):
+    alice = auth_headers(client, "alice")
+    bob = auth_headers(client, "bob")
+    note(client, alice, "red")
+    note(client, bob, "red")
+    note(client, bob, "red")
+    assert tag_counts(client, alice) == {"red": 1}
+    assert tag_counts(client, bob) == {"red": 2}
+
+
+def test_tag_list_etag(client):
+    headers = auth_headers(client, "alice")
+    note(client, headers, "red")
+    first = client.get("/corkboard/tags", headers=headers)
+    etag = first.headers["etag"]
+    assert client.get("/corkboard/tags", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    note(client, headers, "blue")
+    response = client.get("/corkboard/tags", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("tags=red", {"red", "red+blue"}),
+    ("tags=red,blue", {"red+blue"}),
+    ("tags=red,blue&match=any", {"red", "blue", "red+blue"}),
+    ("tags=red,unknown", set()),
+    ("tags=red,unknown&match=any", {"red", "red+blue"}),
+    ("tags=%20red%20,,", {"red", "red+blue"}),
+])
+def test_filter(client, query, expected):
+    headers = auth_headers(client, "alice")
+    for content, tags in (("red", ["red"]), ("blue", ["blue"]), ("red+blue", ["red", "blue"]), ("none", [])):
+        client.post("/corkboard", headers=headers, json={"content": content, "tags": tags})
+    # another board's notes never match
+    client.post("/corkboard", headers=auth_headers(client, "bob"), json={"content": "bob", "tags": ["red"]})
+
+    response = client.get(f"/corkboard?{query}", headers=headers)
+    assert {note["content"] for note in response.json()} == expected
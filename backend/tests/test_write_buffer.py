@@ -0,0 +1,138 @@
+import pytest
+
+from conftest import auth_headers
+
+
+@pytest.fixture()
+def buffer(monkeypatch):
+    # a buffer of the test's own, with the mode and flush interval it asks for
+    from app import main
+    from app.write_buffer import WriteBuffer
+
+    buffers = []
+
+    def make(mode: str, interval_ms: float = 100):
+        monkeypatch.setattr(main, "WRITE_BUFFER_MODE", mode)
+        buffers.append(WriteBuffer(interval_ms=interval_ms))
+        monkeypatch.setattr(main, "write_buffer", buffers[-1])
+        return buffers[-1]
+
+    yield make
+    for created in buffers:
+        created.close()
+
+
+def stored_note(note_id: int):
+    from app import database, model
+
+    db = database.SessionLocal()
+    try:
+        note = db.get(model.Note, note_id)
+        return {field: getattr(note, field) for field in ("content", "x", "y", "width", "height")}
+    finally:
+        db.close()
+
+
+def user_id(client, headers) -> int:
+    return client.get("/users/me/", headers=headers).json()["id"]
+
+
+def create_note(client, headers) -> int:
+    response = client.post("/corkboard", headers=headers, json={"content": "a", "x": 1, "y": 2, "tags": ["red"]})
+    return response.json()["id"]
+
+
+def check_note_out(body: dict):
+    # a move's response is a whole note, as the OpenAPI schema says
+    from app import schemas
+
+    note = schemas.NoteOut.model_validate(body)
+    assert [tag.name for tag in note.tags] == ["red"]
+    assert note.content == "a" and note.owner is not None
+
+
+def test_off_commits_each_move(client, buffer):
+    buffer("off")
+    headers = auth_headers(client, "alice")
+    note_id = create_note(client, headers)
+
+    response = client.put(f"/corkboard/{note_id}", headers=headers, json={"x": 50})
+    assert response.status_code == 200
+    check_note_out(response.json())
+    assert stored_note(note_id)["x"] == 50
+
+
+def test_relaxed_acknowledges_before_saving(client, buffer):
+    pending = buffer("relaxed", interval_ms=3_600_000)  # only flushes when asked
+    headers = auth_headers(client, "alice")
+    note_id = create_note(client, headers)
+
+    response = client.put(f"/corkboard/{note_id}", headers=headers, json={"x": 50})
+    assert response.status_code == 202
+    check_note_out(response.json())
+    assert response.json()["x"] == 50 and response.json()["y"] == 2
+    response = client.put(f"/corkboard/{note_id}", headers=headers, json={"y": 60})
+    assert (response.json()["x"], response.json()["y"]) == (50, 60)  # moves of one note merge
+    assert stored_note(note_id)["x"] == 1
+    assert pending.needs_flush(user_id(client, headers))
+
+    # a read of the board flushes first, so it sees the moves
+    notes = client.get("/corkboard", headers=headers).json()
+    assert (notes[0]["x"], notes[0]["y"]) == (50, 60)
+    assert not pending.needs_flush(user_id(client, headers))
+    assert (stored_note(note_id)["x"], stored_note(note_id)["y"]) == (50, 60)
+
+
+def test_relaxed_flushes_before_other_writes(client, buffer):
+    buffer("relaxed", interval_ms=3_600_000)
+    headers = auth_headers(client, "alice")
+    note_id = create_note(client, headers)
+
+    assert client.put(f"/corkboard/{note_id}", headers=headers, json={"x": 50}).status_code == 202
+    response = client.put(f"/corkboard/{note_id}", headers=headers, json={"content": "b", "x": 70})
+    assert response.status_code == 200
+    # the content edit is ordered after the buffered move, not overtaken by it
+    assert stored_note(note_id) == {"content": "b", "x": 70, "y": 2, "width": 150, "height": 100}
+
+
+def test_relaxed_reads_only_flush_their_board(client, buffer):
+    pending = buffer("relaxed", interval_ms=3_600_000)
+    alice = auth_headers(client, "alice")
+    bob = auth_headers(client, "bob")
+    note_id = create_note(client, alice)
+
+    client.put(f"/corkboard/{note_id}", headers=alice, json={"x": 50})
+    client.get("/corkboard", headers=bob)
+    assert pending.needs_flush(user_id(client, alice))
+    assert stored_note(note_id)["x"] == 1
+
+
+def test_strict_returns_once_saved(client, buffer):
+    pending = buffer("strict")
+    headers = auth_headers(client, "alice")
+    note_id = create_note(client, headers)
+
+    response = client.put(f"/corkboard/{note_id}", headers=headers, json={"x": 50, "width": 300})
+    assert response.status_code == 200
+    check_note_out(response.json())
+    assert not pending.needs_flush(user_id(client, headers))
+    assert stored_note(note_id)["x"] == 50 and stored_note(note_id)["width"] == 300
+
+
+def test_buffered_move_of_deleted_note_is_dropped(client, buffer):
+    pending = buffer("relaxed", interval_ms=3_600_000)
+    headers = auth_headers(client, "alice")
+    note_id = create_note(client, headers)
+    other_id = create_note(client, headers)
+
+    client.put(f"/corkboard/{note_id}", headers=headers, json={"x": 50})
+    client.put(f"/corkboard/{other_id}", headers=headers, json={"x": 80})
+    from app import crud, database
+
+    db = database.SessionLocal()
+    try:
+        crud.delete_note(db, note_id)  # behind the buffer's back
+    finally:
+        db.close()
+    pending.flush(user_id(client, headers))
+    assert stored_note(other_id)["x"] == 80